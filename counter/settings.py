@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'counter_app.metrics.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'counter.urls'
@@ -130,3 +132,264 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# OCR
+# Número de processos usados para aplicar OCR nas páginas de um PDF escaneado.
+# Com 1 o processamento é serial, no próprio processo da requisição.
+
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+
+# Páginas rasterizadas por vez. Limita a memória e o disco usados por
+# requisição ao tamanho da janela, independente do tamanho do documento.
+
+OCR_PAGE_WINDOW = int(os.environ.get("OCR_PAGE_WINDOW", max(OCR_WORKERS, 2)))
+
+# Rasterização das páginas para o OCR, direto em memória e em escala de cinza.
+# DPI é a resolução padrão (200, a mesma da rasterização anterior) e
+# LANGUAGE_DPI a ajusta por idioma, pois scripts com traços finos pedem mais
+# resolução; com vários idiomas na requisição, vale o maior DPI entre eles.
+# Em cada página, o DPI não passa da resolução da digitalização, fica entre
+# MIN_DPI e MAX_DPI e é reduzido para que a página caiba em MAX_PIXELS.
+# THREAD_COUNT é o número de processos do pdftoppm por janela de páginas.
+
+OCR_RASTER = {
+    "DPI": int(os.environ.get("OCR_RASTER_DPI", 200)),
+    "LANGUAGE_DPI": {"jpn": 400, "kor": 400, "hin": 350},
+    "MIN_DPI": int(os.environ.get("OCR_RASTER_MIN_DPI", 150)),
+    "MAX_DPI": int(os.environ.get("OCR_RASTER_MAX_DPI", 400)),
+    "MAX_PIXELS": int(os.environ.get("OCR_RASTER_MAX_PIXELS", 16_000_000)),
+    "GRAYSCALE": os.environ.get("OCR_RASTER_GRAYSCALE", "1") == "1",
+    "THREAD_COUNT": int(os.environ.get("OCR_RASTER_THREAD_COUNT", OCR_WORKERS)),
+}
+
+# Modo de pré-processamento das imagens antes do OCR: um dos pipelines de
+# counter_app.preprocessing.PIPELINES ("hard", "soft", "otsu", "adaptive"...)
+# ou de OCR_PREPROCESS_PIPELINES, que acrescenta ou substitui pipelines no
+# formato {"nome": [("estágio", {parâmetros}), ...]}.
+
+OCR_PREPROCESS_MODE = os.environ.get("OCR_PREPROCESS_MODE", "hard")
+
+OCR_PREPROCESS_PIPELINES = {}
+
+# Filtros aplicados, em ordem, às linhas do texto extraído por OCR (nomes de
+# counter_app.linefilters.LINE_FILTERS). min_word_length descarta linhas sem
+# nenhuma palavra com OCR_WORD_LENGTH caracteres ou mais.
+
+OCR_LINE_FILTERS = ["alpha_ratio", "min_word_length"]
+
+OCR_WORD_LENGTH = int(os.environ.get("OCR_WORD_LENGTH", 4))
+
+# Remove do final do texto as OCR_SIGNATURE_LINES últimas linhas quando todas
+# contêm alguma das OCR_SIGNATURE_KEYWORDS. Pode ser ligado por requisição.
+
+OCR_REMOVE_SIGNATURE_LINES = os.environ.get("OCR_REMOVE_SIGNATURE_LINES", "0") == "1"
+
+OCR_SIGNATURE_KEYWORDS = ["assinado", "assinatura", "assinaturas"]
+
+OCR_SIGNATURE_LINES = 2
+
+# Roteamento de idiomas do OCR em documentos com vários idiomas: o OSD do
+# Tesseract detecta o script de cada página (com confiança mínima
+# MIN_SCRIPT_CONFIDENCE) e o OCR usa só os idiomas pedidos que usam esse
+# script. Entre os latinos, as SAMPLE_PAGES primeiras páginas passam pelo OCR
+# com todos eles e as seguintes só com os que tiverem ao menos
+# MIN_LANGUAGE_SHARE da pontuação do mais frequente. Requer osd.traineddata.
+# Pode ser ligado por requisição.
+
+OCR_LANGUAGE_ROUTING = {
+    "ENABLED": os.environ.get("OCR_LANGUAGE_ROUTING", "0") == "1",
+    "MIN_SCRIPT_CONFIDENCE": 2.0,
+    "SAMPLE_PAGES": 3,
+    "MIN_LANGUAGE_SHARE": 0.2,
+}
+
+
+# Cache de resultados por conteúdo do arquivo, idiomas e pré-processamento.
+# BACKEND: "disk" (LRU limitado a MAX_SIZE bytes em LOCATION), "django"
+# (usa settings.CACHES[ALIAS]) ou None para desativar.
+
+RESULT_CACHE = {
+    "BACKEND": os.environ.get("RESULT_CACHE_BACKEND", "disk"),
+    "LOCATION": os.environ.get("RESULT_CACHE_LOCATION", BASE_DIR / "cache"),
+    "MAX_SIZE": int(os.environ.get("RESULT_CACHE_MAX_SIZE", 512 * 1024 * 1024)),
+    "ALIAS": "default",
+    "TIMEOUT": None,
+}
+
+
+# Histórico de extrações no banco (counter_app.models): cada extração
+# completa grava hash e tamanho do arquivo, idiomas, caminho de extração,
+# contagens por página, tempos das etapas e o texto comprimido com zlib
+# (COMPRESSION_LEVEL). Com LOOKUP, o mesmo arquivo com as mesmas opções é
+# servido do histórico sem nova extração, mesmo depois de sair do cache de
+# resultados. BATCH_SIZE é o tamanho dos lotes do bulk_create das páginas.
+
+RESULT_STORE = {
+    "ENABLED": os.environ.get("RESULT_STORE", "1") == "1",
+    "LOOKUP": os.environ.get("RESULT_STORE_LOOKUP", "1") == "1",
+    "COMPRESSION_LEVEL": 6,
+    "BATCH_SIZE": 500,
+}
+
+
+# Limites verificados antes da extração (counter_app.preflight). Arquivos
+# acima de MAX_BYTES, PDFs com mais de MAX_PAGES páginas e imagens com mais de
+# MAX_PIXELS pixels são recusados; no upload, LimitedUploadHandler interrompe
+# o recebimento assim que o arquivo passa de MAX_BYTES. Pela página web,
+# arquivos acima de SYNC_MAX_PAGES páginas ou SYNC_MAX_BYTES bytes são
+# enviados para a fila de jobs em vez de processados na requisição.
+
+UPLOAD_LIMITS = {
+    "MAX_BYTES": int(os.environ.get("UPLOAD_MAX_BYTES", 200 * 1024 * 1024)),
+    "MAX_PAGES": int(os.environ.get("UPLOAD_MAX_PAGES", 2000)),
+    "MAX_PIXELS": int(os.environ.get("UPLOAD_MAX_PIXELS", 100_000_000)),
+    "SYNC_MAX_PAGES": int(os.environ.get("UPLOAD_SYNC_MAX_PAGES", 50)),
+    "SYNC_MAX_BYTES": int(os.environ.get("UPLOAD_SYNC_MAX_BYTES", 20 * 1024 * 1024)),
+}
+
+FILE_UPLOAD_HANDLERS = [
+    "counter_app.preflight.LimitedUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
+
+# View assíncrona do contador, para servir counter.asgi:application com um
+# servidor ASGI (ex.: gunicorn -k uvicorn.workers.UvicornWorker). A extração
+# roda em threads, no máximo MAX_CONCURRENT por processo; as requisições
+# excedentes esperam na ordem de chegada e, com MAX_WAITING já esperando,
+# recebem 503.
+
+ASYNC_COUNTER = {
+    "ENABLED": os.environ.get("ASYNC_COUNTER_ENABLED", "0") == "1",
+    "MAX_CONCURRENT": int(os.environ.get("ASYNC_COUNTER_MAX_CONCURRENT", os.cpu_count() or 1)),
+    "MAX_WAITING": int(os.environ.get("ASYNC_COUNTER_MAX_WAITING", 100)),
+}
+
+
+# Resultado em tempo real na página do contador: o formulário é enviado para
+# counter_stream, que responde com server-sent events por página. Sem evento
+# por HEARTBEAT segundos, envia um keep-alive. Textos maiores que
+# INLINE_TEXT_MAX caracteres não são incluídos inteiros no HTML: são
+# carregados do histórico (RESULT_STORE) em páginas de TEXT_PAGE_SIZE.
+
+STREAMING = {
+    "ENABLED": os.environ.get("STREAMING_ENABLED", "1") == "1",
+    "HEARTBEAT": 15,
+    "INLINE_TEXT_MAX": int(os.environ.get("STREAMING_INLINE_TEXT_MAX", 200_000)),
+    "TEXT_PAGE_SIZE": int(os.environ.get("STREAMING_TEXT_PAGE_SIZE", 100_000)),
+}
+
+
+# Jobs assíncronos: os arquivos e o status de cada job ficam em LOCATION,
+# processados por WORKERS processos. Acima de MAX_QUEUE jobs pendentes por
+# processo do servidor, novos envios recebem 503. Os jobs terminados há mais
+# de TTL segundos são removidos de LOCATION, verificado no máximo a cada
+# CLEANUP_INTERVAL segundos ao receber um novo job.
+
+JOBS = {
+    "LOCATION": os.environ.get("JOBS_LOCATION", BASE_DIR / "jobs"),
+    "WORKERS": int(os.environ.get("JOBS_WORKERS", 2)),
+    "MAX_QUEUE": int(os.environ.get("JOBS_MAX_QUEUE", 20)),
+    "TTL": int(os.environ.get("JOBS_TTL", 24 * 60 * 60)),
+    "CLEANUP_INTERVAL": 10 * 60,
+}
+
+
+# API de lotes: número de processos e limite de arquivos (incluindo os
+# membros de arquivos .zip) por requisição. Nos processos do lote (e nos de
+# count_files e dos jobs), o OCR, a camada de texto, o pdftoppm e o pool do
+# Tesseract ficam limitados à parte de cada um nos núcleos (núcleos/WORKERS).
+
+BATCH = {
+    "WORKERS": int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 1)),
+    "MAX_FILES": int(os.environ.get("BATCH_MAX_FILES", 500)),
+}
+
+
+# Validação de PDFs: "native" lê fontes e metadados com o pdfplumber, no mesmo
+# documento usado na extração; "subprocess" usa `pdffonts` e `exiftool`.
+
+PDF_VALIDATION_BACKEND = os.environ.get("PDF_VALIDATION_BACKEND", "native")
+
+# Com a validação nativa, decide o caminho de extração por página: só as
+# páginas com fontes inválidas são rasterizadas e passam por OCR.
+
+PDF_PAGE_ROUTING = os.environ.get("PDF_PAGE_ROUTING", "1") == "1"
+
+# Pool persistente do Tesseract (pacote tesserocr). Um único pool de
+# PROCESSES processos atende o OCR de todos os idiomas e o OSD do roteamento
+# de idiomas; cada processo mantém os modelos de até MAX_LANGUAGE_SETS
+# conjuntos de idiomas (o osd conta como um) carregados, é reciclado a cada
+# MAX_TASKS_PER_WORKER imagens e verificado a cada HEALTH_CHECK_INTERVAL
+# segundos. Sem o tesserocr, ou em caso de falha, o OCR usa o pytesseract.
+
+TESSERACT_POOL = {
+    "ENABLED": os.environ.get("TESSERACT_POOL_ENABLED", "1") == "1",
+    "PROCESSES": int(os.environ.get("TESSERACT_POOL_PROCESSES", os.cpu_count() or 1)),
+    "MAX_TASKS_PER_WORKER": int(os.environ.get("TESSERACT_POOL_MAX_TASKS", 200)),
+    "MAX_LANGUAGE_SETS": int(os.environ.get("TESSERACT_POOL_MAX_LANGUAGE_SETS", 4)),
+    "HEALTH_CHECK_INTERVAL": 30,
+    "TIMEOUT": 300,
+}
+
+# Imagens embutidas em PDFs com menos pixels que isto (ex.: ícones e pequenos
+# logotipos) não passam pelo OCR. Use 0 para processar todas.
+
+EMBEDDED_IMAGE_MIN_PIXELS = int(os.environ.get("EMBEDDED_IMAGE_MIN_PIXELS", 64 * 64))
+
+
+# Extração da camada de texto dos PDFs. ENGINE "fast" (counter_app.textlayer)
+# lê os caracteres direto do conteúdo das páginas, sem os objetos de layout do
+# pdfminer nem os dicionários do pdfplumber, e agrupa as palavras com as mesmas
+# regras de page.extract_words(); "pdfplumber" usa page.extract_words(). Com a
+# engine "fast" e WORKERS > 1, documentos com mais de CHUNK_PAGES páginas são
+# lidos em paralelo, em blocos de CHUNK_PAGES páginas por processo.
+
+TEXT_LAYER = {
+    "ENGINE": os.environ.get("TEXT_LAYER_ENGINE", "fast"),
+    "WORKERS": int(os.environ.get("TEXT_LAYER_WORKERS", os.cpu_count() or 1)),
+    "CHUNK_PAGES": int(os.environ.get("TEXT_LAYER_CHUNK_PAGES", 20)),
+}
+
+
+# Modo de amostragem de páginas: estimativas rápidas para documentos grandes
+# processando só SIZE páginas igualmente espaçadas (até MAX_SIZE por
+# requisição) e extrapolando os totais, com intervalo de confiança de 95%.
+
+PAGE_SAMPLING = {
+    "SIZE": int(os.environ.get("PAGE_SAMPLING_SIZE", 10)),
+    "MAX_SIZE": int(os.environ.get("PAGE_SAMPLING_MAX_SIZE", 50)),
+}
+
+
+# Métricas de desempenho: tempos por etapa (pdffonts, exiftool, extract_words,
+# rasterização, pré-processamento, Tesseract...) e contadores de páginas,
+# imagens e palavras, expostos em /metrics no formato do Prometheus.
+# TIMING_LOG (desligado por padrão) grava uma linha JSON por requisição no
+# logger counter_app.metrics; DEBUG_PANEL mostra os tempos do upload na página.
+# /metrics só responde aos IPs de ALLOWED_IPS (separados por vírgula) ou a
+# quem enviar "Authorization: Bearer <TOKEN>"; os demais recebem 403.
+
+METRICS = {
+    "ENABLED": os.environ.get("METRICS_ENABLED", "1") == "1",
+    "TIMING_LOG": os.environ.get("METRICS_TIMING_LOG", "0") == "1",
+    "DEBUG_PANEL": os.environ.get("METRICS_DEBUG_PANEL", "1" if DEBUG else "0") == "1",
+    "ALLOWED_IPS": [
+        ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()
+    ],
+    "TOKEN": os.environ.get("METRICS_TOKEN", ""),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "counter_app": {"handlers": ["console"], "level": "WARNING", "propagate": False},
+        "counter_app.metrics": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
@@ -1,3 +1,31 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Extraction, PageCount
+
+
+class PageCountInline(admin.TabularInline):
+    model = PageCount
+    fields = ("page", "path", "words", "chars", "chars_cleaned")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Extraction)
+class ExtractionAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "file_name", "languages", "path", "qt_pages", "qt_words", "qt_char_cleaned")
+    list_filter = ("path",)
+    # Busca exata pelo hash, que usa o índice; a contagem total de resultados
+    # é omitida porque um COUNT(*) fica lento com milhões de linhas
+    search_fields = ("=file_hash",)
+    show_full_result_count = False
+    exclude = ("text_zlib",)
+    readonly_fields = (
+        "lookup_key", "file_hash", "file_name", "file_size", "languages", "preprocess", "path", "qt_pages",
+        "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned", "timings", "created_at", "text",
+    )
+    inlines = [PageCountInline]
+
+    @admin.display(description="Texto")
+    def text(self, obj):
+        return obj.text
@@ -0,0 +1,262 @@
+import io
+import json
+import os
+import random
+import zlib
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Tipos de documento do corpus:
+# - text: só camada de texto (Helvetica, WinAnsiEncoding), extraída pelo pdfplumber;
+# - scanned: páginas digitalizadas (uma imagem por página) com uma fonte Type3
+#   de encoding próprio, como nos PDFs com OCR embutido, o que manda todas as
+#   páginas para a rasterização e o OCR;
+# - mixed: alterna páginas de texto e páginas digitalizadas (roteamento por página);
+# - image_heavy: páginas de texto com várias imagens embutidas com texto e um
+#   logotipo repetido em todas as páginas.
+KINDS = ("text", "scanned", "mixed", "image_heavy")
+
+# Idiomas do Tesseract com texto de exemplo. Só alfabetos latinos, que cabem no
+# WinAnsiEncoding da Helvetica e na fonte padrão do Pillow.
+SAMPLES = {
+    "por": (
+        "O contratante pagará ao contratado a quantia ajustada na cláusula terceira deste instrumento. "
+        "As partes elegem o foro da comarca para dirimir quaisquer dúvidas oriundas da execução do contrato. "
+        "A tradução foi conferida com o documento original apresentado e está de acordo com ele."
+    ),
+    "eng": (
+        "The contractor shall deliver the translated documents within the period agreed in this statement. "
+        "Both parties acknowledge that the original certificate was presented and verified by the notary. "
+        "Payment is due thirty days after the invoice date unless otherwise stated in writing."
+    ),
+    "spa": (
+        "El contratante pagará al contratado la cantidad acordada en la cláusula tercera de este documento. "
+        "Las partes se someten a los tribunales de la ciudad para resolver cualquier controversia. "
+        "La traducción fue cotejada con el original y concuerda fielmente con él."
+    ),
+    "fra": (
+        "Le contractant paiera au prestataire la somme convenue dans la troisième clause du présent acte. "
+        "Les parties élisent domicile au tribunal de la ville pour tout litige relatif à l'exécution. "
+        "La traduction a été vérifiée avec le document original et lui est conforme."
+    ),
+    "deu": (
+        "Der Auftraggeber zahlt dem Auftragnehmer den in der dritten Klausel vereinbarten Betrag. "
+        "Die Parteien vereinbaren als Gerichtsstand das zuständige Gericht der Stadt für alle Streitigkeiten. "
+        "Die Übersetzung wurde mit dem vorgelegten Original verglichen und stimmt mit ihm überein."
+    ),
+    "ita": (
+        "Il committente pagherà al prestatore la somma concordata nella terza clausola del presente atto. "
+        "Le parti eleggono il foro della città per qualsiasi controversia derivante dall'esecuzione. "
+        "La traduzione è stata confrontata con il documento originale ed è ad esso conforme."
+    ),
+}
+
+PAGE_SIZE = (612, 792)
+LINES_PER_PAGE = 40
+LINE_WIDTH = 90
+
+
+class PdfWriter:
+    """Escritor mínimo de PDF: objetos numerados, tabela xref e trailer."""
+
+    def __init__(self):
+        self.objects = []
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def add(self, data, obj_id=None):
+        if obj_id is None:
+            obj_id = self.reserve()
+        self.objects[obj_id - 1] = data
+        return obj_id
+
+    def add_stream(self, entries, data):
+        return self.add(b"<< %s /Length %d >>\nstream\n" % (entries, len(data)) + data + b"\nendstream")
+
+    def write(self, root_id, info_id=None):
+        output = io.BytesIO()
+        output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for obj_id, data in enumerate(self.objects, start=1):
+            offsets.append(output.tell())
+            output.write(b"%d 0 obj\n" % obj_id + data + b"\nendobj\n")
+        xref = output.tell()
+        output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1))
+        for offset in offsets:
+            output.write(b"%010d 00000 n \n" % offset)
+        trailer = b"/Size %d /Root %d 0 R" % (len(self.objects) + 1, root_id)
+        if info_id is not None:
+            trailer += b" /Info %d 0 R" % info_id
+        output.write(b"trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n" % (trailer, xref))
+        return output.getvalue()
+
+
+def make_lines(lang, count, rng):
+    """Gera `count` linhas de texto no idioma, embaralhando as palavras de exemplo."""
+    words = SAMPLES[lang].split()
+    lines = []
+    for _ in range(count):
+        line = []
+        while sum(len(word) + 1 for word in line) < LINE_WIDTH - 12:
+            line.append(rng.choice(words))
+        lines.append(" ".join(line))
+    return lines
+
+
+def _pdf_string(text):
+    data = text.encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _text_content(lines, top=740, render_mode=0, font=b"/F1"):
+    ops = [b"BT %s 10 Tf %d Tr 1 0 0 1 50 %d Tm 14 TL" % (font, render_mode, top)]
+    ops += [_pdf_string(line) + b" '" for line in lines]
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+def render_text_image(lines, size, font_size):
+    """Desenha as linhas em uma imagem em escala de cinza, como uma página digitalizada."""
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=font_size)
+    margin = size[0] // 12
+    for number, line in enumerate(lines):
+        draw.text((margin, margin + number * font_size * 1.4), line, fill=0, font=font)
+    return image
+
+
+def _jpeg(image, quality=75):
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+
+def _image_xobject(pdf, image, jpeg=True):
+    entries = b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray /BitsPerComponent 8" % (
+        image.width, image.height
+    )
+    if jpeg:
+        return pdf.add_stream(entries + b" /Filter /DCTDecode", _jpeg(image))
+    return pdf.add_stream(entries + b" /Filter /FlateDecode", zlib.compress(image.tobytes()))
+
+
+def build_pdf(kind, lang, pages, seed=0, dpi=200):
+    """
+    Gera um PDF sintético.
+
+    :param kind: Um dos KINDS.
+    :param lang: Idioma do texto (chave de SAMPLES).
+    :param pages: Número de páginas.
+    :param seed: Semente do gerador de texto, para corpus reproduzíveis.
+    :param dpi: Resolução das páginas digitalizadas e das imagens embutidas.
+    :return: Tupla (bytes do PDF, palavras esperadas na camada de texto e nas imagens).
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Tipo de documento desconhecido: {kind}")
+    rng = random.Random(f"{kind}:{lang}:{pages}:{seed}")
+    pdf = PdfWriter()
+    pages_id = pdf.reserve()
+    helvetica = pdf.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    type3 = pdf.add(
+        b"<< /Type /Font /Subtype /Type3 /FontBBox [0 0 1000 1000] /FontMatrix [0.001 0 0 0.001 0 0]"
+        b" /CharProcs << >> /Encoding << /Type /Encoding /Differences [32 /space] >>"
+        b" /FirstChar 32 /LastChar 255 /Widths [%s] >>" % b" ".join([b"500"] * 224)
+    )
+    scan_size = (round(PAGE_SIZE[0] * dpi / 72), round(PAGE_SIZE[1] * dpi / 72))
+    logo = None
+    if kind == "image_heavy":
+        logo = _image_xobject(pdf, render_text_image(["LOGOTIPO " + lang.upper()], (dpi * 2, dpi // 2), dpi // 8))
+
+    page_ids, expected_words = [], 0
+    for number in range(pages):
+        lines = make_lines(lang, LINES_PER_PAGE, rng)
+        expected_words += sum(len(line.split()) for line in lines)
+        scanned = kind == "scanned" or (kind == "mixed" and number % 2 == 1)
+
+        if scanned:
+            scan = _image_xobject(pdf, render_text_image(lines, scan_size, dpi // 7))
+            content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q\n" % PAGE_SIZE + _text_content(lines, render_mode=3, font=b"/F2")
+            resources = b"/Font << /F2 %d 0 R >> /XObject << /Im0 %d 0 R >>" % (type3, scan)
+        elif kind == "image_heavy":
+            expected_words += 2  # "LOGOTIPO XXX", repetido em todas as páginas
+            text_lines, image_lines = lines[:LINES_PER_PAGE // 2], lines[LINES_PER_PAGE // 2:]
+            content = _text_content(text_lines)
+            xobjects = [b"/Logo %d 0 R" % logo]
+            content += b"\nq 144 0 0 36 420 750 cm /Logo Do Q"
+            for index in range(4):
+                snippet = image_lines[index * 5:index * 5 + 5]
+                image = render_text_image(snippet, (round(512 * dpi / 72), round(70 * dpi / 72)), dpi // 7)
+                xobjects.append(b"/Im%d %d 0 R" % (index, _image_xobject(pdf, image, jpeg=index % 2 == 0)))
+                content += b"\nq 512 0 0 70 50 %d cm /Im%d Do Q" % (440 - index * 90, index)
+            resources = b"/Font << /F1 %d 0 R >> /XObject << %s >>" % (helvetica, b" ".join(xobjects))
+        else:
+            content = _text_content(lines)
+            resources = b"/Font << /F1 %d 0 R >>" % helvetica
+
+        content_id = pdf.add_stream(b"", content)
+        page_ids.append(pdf.add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources << %s >> >>"
+            % (pages_id, *PAGE_SIZE, content_id, resources)
+        ))
+
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    pdf.add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)), pages_id)
+    root = pdf.add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    info = pdf.add(b"<< /Producer (counter benchmark corpus) /Creator (%s) >>" % kind.encode())
+    return pdf.write(root, info), expected_words
+
+
+def build_image(lang, seed=0, dpi=200):
+    """Gera uma página digitalizada em PNG, usada nos benchmarks de process_image."""
+    lines = make_lines(lang, LINES_PER_PAGE, random.Random(f"image:{lang}:{seed}"))
+    size = (round(PAGE_SIZE[0] * dpi / 72), round(PAGE_SIZE[1] * dpi / 72))
+    output = io.BytesIO()
+    render_text_image(lines, size, dpi // 7).save(output, "PNG")
+    return output.getvalue(), sum(len(line.split()) for line in lines)
+
+
+def generate_corpus(directory, kinds=KINDS, page_counts=(1, 10), langs=("por", "eng"), seed=0, dpi=200):
+    """
+    Gera o corpus de benchmark em `directory`, com um manifest.json descrevendo
+    cada documento. Se o manifesto existente tiver os mesmos parâmetros, o
+    corpus é reaproveitado.
+
+    :return: Lista de documentos do manifesto ({"name", "kind", "lang",
+        "pages", "path", "expected_words"}).
+    """
+    params = {"kinds": list(kinds), "pages": list(page_counts), "langs": list(langs), "seed": seed, "dpi": dpi}
+    manifest_path = os.path.join(directory, "manifest.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["params"] == params and all(
+            os.path.exists(os.path.join(directory, document["path"])) for document in manifest["documents"]
+        ):
+            return manifest["documents"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(directory, exist_ok=True)
+    documents = []
+
+    def save(name, data, **fields):
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        documents.append({"name": os.path.splitext(name)[0], "path": name, **fields})
+
+    for lang in langs:
+        for kind in kinds:
+            for pages in page_counts:
+                data, expected_words = build_pdf(kind, lang, pages, seed, dpi)
+                save(f"{kind}-{lang}-{pages}p.pdf", data, kind=kind, lang=lang, pages=pages,
+                     expected_words=expected_words)
+        data, expected_words = build_image(lang, seed, dpi)
+        save(f"image-{lang}.png", data, kind="image", lang=lang, pages=1, expected_words=expected_words)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "documents": documents}, f, indent=2)
+    return documents
@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+
+import pdfplumber
+from django.conf import settings
+from django.core.files import File
+
+from .corpus import KINDS
+
+
+# Etapas medidas e os tipos de documento a que cada uma se aplica.
+STAGE_KINDS = {
+    "validate_pdf": ("text", "scanned", "mixed", "image_heavy"),
+    "validate_pdf_native": ("text", "scanned", "mixed", "image_heavy"),
+    "process_pdf": ("text", "image_heavy"),
+    "process_pdf_pdfplumber": ("text", "image_heavy"),
+    "extract_text_from_pdf_images": ("scanned",),
+    "process_image": ("image",),
+    "extract_file": ("text", "scanned", "mixed", "image_heavy", "image"),
+}
+
+
+def _validate_pdf(path, lang):
+    from counter_app.utils import validate_pdf
+
+    return {"valid": validate_pdf(path)}
+
+
+def _validate_pdf_native(path, lang):
+    from counter_app.utils import validate_pdf_pages_native
+
+    with pdfplumber.open(path) as pdf:
+        routes = validate_pdf_pages_native(pdf)
+    return {"text_pages": sum(routes), "ocr_pages": len(routes) - sum(routes)}
+
+
+def _process_pdf(path, lang):
+    from counter_app.views import process_pdf
+
+    text, qt_pages, qt_images = process_pdf(path, lang)
+    return {"qt_pages": qt_pages, "qt_images": qt_images, "qt_words": text.qt_words,
+            "qt_char_extracted": text.qt_char_extracted}
+
+
+def _process_pdf_pdfplumber(path, lang):
+    # Roda no processo filho da etapa, então a troca de engine não vaza para as demais
+    settings.TEXT_LAYER = {**settings.TEXT_LAYER, "ENGINE": "pdfplumber"}
+    return _process_pdf(path, lang)
+
+
+def _extract_text_from_pdf_images(path, lang):
+    from counter_app.views import extract_text_from_pdf_images
+
+    text, qt_pages, qt_images = extract_text_from_pdf_images(path, lang)
+    return {"qt_pages": qt_pages, "qt_images": qt_images, "qt_words": text.qt_words,
+            "qt_char_extracted": text.qt_char_extracted}
+
+
+def _process_image(path, lang):
+    from counter_app.views import process_image
+
+    text, qt_words = process_image(path, lang)
+    return {"qt_words": qt_words, "qt_char_extracted": len(text)}
+
+
+def _extract_file(path, lang):
+    from counter_app.views import extract_file
+
+    with open(path, "rb") as f:
+        result = extract_file(File(f, name=os.path.basename(path)), lang)
+    return {field: result[field] for field in
+            ("qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned")}
+
+
+STAGES = {
+    "validate_pdf": _validate_pdf,
+    "validate_pdf_native": _validate_pdf_native,
+    "process_pdf": _process_pdf,
+    "process_pdf_pdfplumber": _process_pdf_pdfplumber,
+    "extract_text_from_pdf_images": _extract_text_from_pdf_images,
+    "process_image": _process_image,
+    "extract_file": _extract_file,
+}
+
+
+def _measure(stage, path, lang, repeat, connection):
+    """
+    Executa a etapa `repeat` vezes no processo filho e envia pelo pipe os
+    tempos, o pico de memória do processo e o dos subprocessos (poppler,
+    tesseract, pools de OCR) e as contagens da última execução.
+    """
+    # O cache de resultados esconderia o custo do OCR nas repetições
+    from counter_app.cache import get_result_cache
+
+    settings.RESULT_CACHE = {**settings.RESULT_CACHE, "BACKEND": None}
+    get_result_cache.cache_clear()
+    try:
+        runs, output = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = STAGES[stage](path, lang)
+            runs.append(time.perf_counter() - start)
+        connection.send({
+            "runs": runs,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "children_peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            "output": output,
+        })
+    except Exception as e:
+        connection.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        connection.close()
+
+
+def run_stage(stage, path, lang, repeat=3):
+    """
+    Mede uma etapa em um processo filho próprio, para que o pico de memória
+    (ru_maxrss) seja o da etapa e não o acumulado do benchmark. O processo é
+    criado por fork, então o pico inclui a memória herdada do benchmark.
+
+    :return: Dicionário com runs, median, min, peak_rss_kb,
+        children_peak_rss_kb e output, ou com error se a etapa falhar.
+    """
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(stage, path, lang, repeat, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"error": "O processo da etapa terminou sem resultado."}
+    process.join()
+    if "runs" in result:
+        result["median"] = statistics.median(result["runs"])
+        result["min"] = min(result["runs"])
+    return result
+
+
+def _command_version(command):
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    output = (result.stdout or result.stderr).strip().splitlines()
+    return output[0] if output else None
+
+
+def environment(repeat):
+    """Descreve a máquina e a configuração em que o benchmark foi executado."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=settings.BASE_DIR
+        ).stdout.strip() or None
+    except FileNotFoundError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tesseract": _command_version(["tesseract", "--version"]),
+        "pdftoppm": _command_version(["pdftoppm", "-v"]),
+        "ocr_workers": settings.OCR_WORKERS,
+        "ocr_preprocess_mode": settings.OCR_PREPROCESS_MODE,
+        "ocr_raster_dpi": settings.OCR_RASTER["DPI"],
+        "tesseract_pool": settings.TESSERACT_POOL["ENABLED"],
+        "pdf_validation_backend": settings.PDF_VALIDATION_BACKEND,
+    }
+
+
+def run_benchmarks(corpus_dir, documents, stages=None, repeat=3, report=None):
+    """
+    Executa as etapas aplicáveis sobre cada documento do corpus.
+
+    :param corpus_dir: Diretório do corpus.
+    :param documents: Documentos de generate_corpus.
+    :param stages: Nomes das etapas; padrão todas de STAGES.
+    :param repeat: Execuções de cada etapa por documento.
+    :param report: Callable opcional chamado com cada resultado ao terminar.
+    :return: Dicionário {"environment", "results"}, serializável em JSON.
+    """
+    results = []
+    for document in documents:
+        for stage in stages or STAGES:
+            if document["kind"] not in STAGE_KINDS[stage]:
+                continue
+            result = {
+                "document": document["name"],
+                "kind": document["kind"],
+                "lang": document["lang"],
+                "pages": document["pages"],
+                "expected_words": document["expected_words"],
+                "stage": stage,
+                **run_stage(stage, os.path.join(corpus_dir, document["path"]), document["lang"], repeat),
+            }
+            results.append(result)
+            if report is not None:
+                report(result)
+    return {"environment": environment(repeat), "results": results}
+
+
+def check_text_layer(corpus_dir, documents):
+    """
+    Verifica, página a página, que a engine "fast" da camada de texto extrai
+    as mesmas palavras que page.extract_words() em todos os PDFs do corpus.
+
+    :return: Lista de dicionários {"document", "page", "fast_words",
+        "pdfplumber_words", "first_difference"}, vazia se não houver diferenças.
+    """
+    from counter_app.textlayer import compare_engines
+
+    differences = []
+    for document in documents:
+        if document["kind"] not in KINDS:
+            continue
+        with pdfplumber.open(os.path.join(corpus_dir, document["path"])) as pdf:
+            differences += [{"document": document["name"], **page} for page in compare_engines(pdf)]
+    return differences
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compara os resultados com os de uma execução anterior.
+
+    Uma etapa regrediu quando a mediana ou o pico de memória ficou mais de
+    `threshold` (fração) acima do baseline.
+
+    :return: Lista de dicionários {"document", "stage", "median", "baseline_median",
+        "time_ratio", "peak_rss_kb", "baseline_peak_rss_kb", "rss_ratio", "regression"}.
+    """
+    previous = {
+        (result["document"], result["stage"]): result for result in baseline["results"] if "median" in result
+    }
+    rows = []
+    for result in current["results"]:
+        before = previous.get((result["document"], result["stage"]))
+        if before is None or "median" not in result:
+            continue
+        time_ratio = result["median"] / before["median"] if before["median"] else None
+        rss_ratio = result["peak_rss_kb"] / before["peak_rss_kb"] if before["peak_rss_kb"] else None
+        rows.append({
+            "document": result["document"],
+            "stage": result["stage"],
+            "median": result["median"],
+            "baseline_median": before["median"],
+            "time_ratio": time_ratio,
+            "peak_rss_kb": result["peak_rss_kb"],
+            "baseline_peak_rss_kb": before["peak_rss_kb"],
+            "rss_ratio": rss_ratio,
+            "regression": any(ratio is not None and ratio > 1 + threshold for ratio in (time_ratio, rss_ratio)),
+        })
+    return rows
@@ -0,0 +1,287 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .concurrency import file_pool_options
+from .preflight import EXTENSIONS
+
+
+logger = logging.getLogger(__name__)
+
+# Extensões dos arquivos contados (as aceitas pelo preflight, exceto zip) e
+# dos arquivos compactados percorridos como diretórios.
+COUNTABLE_EXTENSIONS = frozenset(
+    extension for kind, extensions in EXTENSIONS.items() if kind != "zip" for extension in extensions
+)
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Separa o caminho do arquivo compactado do nome do membro no campo source.
+MEMBER_SEPARATOR = "::"
+
+CSV_FIELDS = (
+    "source", "file_name", "qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned",
+    "from_cache", "seconds", "error",
+)
+
+
+def is_countable(name):
+    """True se a extensão do nome for de um PDF ou imagem aceitos."""
+    return os.path.splitext(name)[1].lower().lstrip(".") in COUNTABLE_EXTENSIONS
+
+
+def is_archive(name):
+    """True se o nome for de um arquivo .zip ou .tar (comprimido ou não)."""
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+class Source:
+    """
+    Um arquivo a contar: no disco (path) ou membro de um arquivo compactado,
+    extraído para um temporário só quando chega a vez dele (open_path).
+    """
+
+    def __init__(self, key, file_name, size, path=None, extract=None):
+        self.key = key
+        self.file_name = file_name
+        self.size = size
+        self.path = path
+        self._extract = extract
+
+    def open_path(self, temp_dir):
+        """Caminho do arquivo no disco, extraindo o membro em temp_dir se preciso."""
+        if self.path is not None:
+            return self.path
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(self.file_name)[1].lower(), dir=temp_dir)
+        with self._extract() as source, os.fdopen(fd, "wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        return path
+
+
+def _iter_zip(path):
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or not is_countable(member.filename):
+                continue
+            yield Source(
+                f"{path}{MEMBER_SEPARATOR}{member.filename}", os.path.basename(member.filename), member.file_size,
+                extract=lambda member=member: archive.open(member),
+            )
+
+
+def _iter_tar(path):
+    # Lido em sequência ("r|*"), sem índice: os membros de um .tar.gz são
+    # descomprimidos uma única vez, na ordem em que estão no arquivo
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not is_countable(member.name):
+                continue
+            yield Source(
+                f"{path}{MEMBER_SEPARATOR}{member.name}", os.path.basename(member.name), member.size,
+                extract=lambda member=member: archive.extractfile(member),
+            )
+
+
+def iter_sources(paths):
+    """
+    Percorre arquivos, diretórios (recursivamente, em ordem alfabética) e
+    arquivos .zip/.tar, gerando os PDFs e imagens encontrados.
+
+    Membros de arquivos compactados só podem ser extraídos enquanto o
+    gerador está parado neles, antes de avançar para o próximo.
+
+    :param paths: Caminhos passados na linha de comando.
+    :return: Gerador de Source.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                yield from iter_sources(os.path.join(root, name) for name in sorted(files))
+        elif is_archive(path):
+            try:
+                yield from _iter_zip(path) if path.lower().endswith(".zip") else _iter_tar(path)
+            except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+                logger.warning("Erro lendo o arquivo compactado %s: %s", path, e)
+        elif is_countable(path):
+            yield Source(path, os.path.basename(path), os.path.getsize(path), path=path)
+
+
+def _count(path, file_name, lang, preprocess, line_filters, language_routing):
+    """count_path em um processo do pool, medindo o tempo total do arquivo."""
+    from .views import count_path
+
+    started = time.perf_counter()
+    result = count_path(path, file_name, lang, preprocess, line_filters, language_routing)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_bulk(sources, lang, preprocess=None, line_filters=None, language_routing=None, workers=None,
+             done=frozenset()):
+    """
+    Conta os arquivos em um pool de processos, extraindo os membros de
+    arquivos compactados sob demanda.
+
+    No máximo 2 * workers arquivos ficam pendentes ao mesmo tempo, então o
+    disco temporário usado pelos membros extraídos fica limitado ao tamanho
+    desses arquivos, e não ao do arquivo compactado.
+
+    :param sources: Gerador de Source (iter_sources).
+    :param workers: Número de processos; padrão settings.BATCH["WORKERS"].
+    :param done: Chaves (Source.key) já contadas, que são puladas.
+    :return: Gerador de resultados de count_path acrescidos de source e
+        seconds, na ordem em que terminam.
+    :raises BrokenProcessPool: Se um processo do pool morrer (ex.: falta de
+        memória), depois de gerar os resultados dos arquivos já enviados.
+    """
+    workers = max(1, workers or settings.BATCH["WORKERS"])
+    max_bytes = settings.UPLOAD_LIMITS["MAX_BYTES"]
+    pending = {}
+    with tempfile.TemporaryDirectory() as temp_dir, ProcessPoolExecutor(**file_pool_options(workers)) as executor:
+
+        def finished(futures):
+            for future in futures:
+                source, path = pending.pop(future)
+                if path != source.path:
+                    os.remove(path)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"file_name": source.file_name, "error": f"Erro: {e}"}
+                yield {"source": source.key, **result}
+
+        for source in sources:
+            if source.key in done:
+                continue
+            if source.size > max_bytes:
+                yield {"source": source.key, "file_name": source.file_name,
+                       "error": "Erro: arquivo maior que o limite permitido."}
+                continue
+            try:
+                path = source.open_path(temp_dir)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                yield {"source": source.key, "file_name": source.file_name, "error": f"Erro: {e}"}
+                continue
+            try:
+                future = executor.submit(
+                    _count, path, source.file_name, lang, preprocess, line_filters, language_routing
+                )
+            except BrokenProcessPool:
+                if path != source.path:
+                    os.remove(path)
+                yield from finished(list(pending))
+                raise
+            pending[future] = (source, path)
+            if len(pending) >= 2 * workers:
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(completed)
+
+        while pending:
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(completed)
+
+
+def output_format(path, requested=None):
+    """Formato de saída ("jsonl" ou "csv"): o pedido ou o da extensão do arquivo."""
+    return requested or ("csv" if path.lower().endswith(".csv") else "jsonl")
+
+
+def read_checkpoint(path, output_format):
+    """
+    Lê as chaves já contadas de um arquivo de resultados, para retomar uma
+    execução interrompida. Arquivos que terminaram com erro não entram, para
+    serem tentados de novo.
+
+    Uma última linha incompleta (a execução foi interrompida durante a
+    gravação) é descartada do arquivo.
+
+    :return: Conjunto de chaves (campo source).
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+    done = set()
+    with open(path, encoding="utf-8", newline="") as f:
+        if output_format == "csv":
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            # No CSV, a coluna error fica vazia nos resultados sem erro
+            if not record.get("error"):
+                done.add(record["source"])
+    return done
+
+
+class ResultWriter:
+    """Grava cada resultado assim que ele termina, em JSONL ou CSV, com flush por linha."""
+
+    def __init__(self, path, output_format, append=False):
+        self.output_format = output_format
+        new = not append or not os.path.exists(path) or not os.path.getsize(path)
+        self.file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self.csv = None
+        if output_format == "csv":
+            self.csv = csv.DictWriter(self.file, CSV_FIELDS, extrasaction="ignore")
+            if new:
+                self.csv.writeheader()
+
+    def write(self, result):
+        if self.csv is not None:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Throughput:
+    """Totais e vazão de uma execução em lote."""
+
+    FIELDS = ("qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = self.failed = 0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, result):
+        self.files += 1
+        if "error" in result:
+            self.failed += 1
+            return
+        for field in self.FIELDS:
+            self.totals[field] += result[field]
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            **self.totals,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(self.files / elapsed, 3) if elapsed else None,
+            "pages_per_second": round(self.totals["qt_pages"] / elapsed, 3) if elapsed else None,
+        }
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .linefilters import line_filter_key
+
+
+class DiskResultCache:
+    """
+    Cache de resultados em disco, um arquivo JSON por chave.
+
+    A data de modificação de cada arquivo é atualizada a cada leitura (LRU).
+    O tamanho do diretório é contado a cada gravação, sem listá-lo; só quando
+    passa de `max_size` bytes os arquivos menos usados recentemente são
+    removidos, até sobrar LOW_WATERMARK de `max_size`. Como outros processos
+    gravam no mesmo diretório, ele é listado de novo a cada RESCAN_INTERVAL
+    gravações para corrigir a contagem.
+    """
+
+    LOW_WATERMARK = 0.9
+    RESCAN_INTERVAL = 100
+
+    def __init__(self, location, max_size):
+        self.location = str(location)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+        self.writes = 0
+        os.makedirs(self.location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.location, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        size = os.path.getsize(temp_path)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.writes += 1
+            if self.size is None or self.writes % self.RESCAN_INTERVAL == 0:
+                self.size = self._scan_size()
+            else:
+                self.size += size - replaced
+            if self.size <= self.max_size:
+                return
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.location) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove as entradas menos usadas até o cache caber em LOW_WATERMARK de max_size."""
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        target = self.max_size * self.LOW_WATERMARK
+        for _, size, path in entries:
+            if total_size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+        with self.lock:
+            self.size = total_size
+
+
+class DjangoResultCache:
+    """
+    Cache de resultados sobre o framework de cache do Django.
+
+    O limite de tamanho e a política de remoção ficam a cargo do backend
+    configurado em settings.CACHES (ex.: MAX_ENTRIES do LocMemCache).
+    """
+
+    def __init__(self, alias="default", timeout=None):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+
+@lru_cache(maxsize=None)
+def get_result_cache():
+    """
+    Retorna o cache de resultados configurado em settings.RESULT_CACHE.
+
+    :return: Instância do backend, ou None se o cache estiver desativado.
+    """
+    config = settings.RESULT_CACHE
+    backend = config.get("BACKEND")
+    if backend == "disk":
+        return DiskResultCache(config["LOCATION"], config["MAX_SIZE"])
+    if backend == "django":
+        return DjangoResultCache(config.get("ALIAS", "default"), config.get("TIMEOUT"))
+    return None
+
+
+def file_hash(file):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo.
+
+    :param file: Arquivo enviado (UploadedFile) ou caminho no disco.
+    :return: Hash em hexadecimal.
+    """
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        for chunk in file.chunks():
+            digest.update(chunk)
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def pixels_hash(image):
+    """
+    Calcula o SHA-256 dos pixels de uma imagem PIL, junto com o modo e as
+    dimensões, para imagens que só existem em memória.
+
+    :return: Hash em hexadecimal.
+    """
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def extraction_settings_key():
+    """
+    Hash curto das configurações que mudam o resultado da extração de um
+    arquivo inteiro: engine da camada de texto, validação e roteamento das
+    páginas, DPI da rasterização, tamanho mínimo das imagens embutidas,
+    pipelines de pré-processamento e roteamento de idiomas.
+    """
+    raster = settings.OCR_RASTER
+    values = {
+        "text_layer": settings.TEXT_LAYER["ENGINE"],
+        "validation": settings.PDF_VALIDATION_BACKEND,
+        "page_routing": settings.PDF_PAGE_ROUTING,
+        "raster": [raster[name] for name in ("DPI", "LANGUAGE_DPI", "MIN_DPI", "MAX_DPI", "MAX_PIXELS", "GRAYSCALE")],
+        "embedded_image_min_pixels": settings.EMBEDDED_IMAGE_MIN_PIXELS,
+        "preprocess_pipelines": settings.OCR_PREPROCESS_PIPELINES,
+        "language_routing": settings.OCR_LANGUAGE_ROUTING,
+    }
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def make_cache_key(kind, digest, lang, preprocess, line_filters=None, settings_key=None):
+    """
+    Monta a chave de cache a partir do hash do conteúdo e das opções de OCR.
+
+    Os idiomas entram em ordem alfabética, então "por+eng" e "eng+por" têm a
+    mesma chave.
+
+    :param settings_key: extraction_settings_key, nas chaves de arquivos inteiros.
+    """
+    lang = "+".join(sorted((lang or "").split("+")))
+    key = f"counter:{kind}:{digest}:{lang}:{preprocess}:{line_filter_key(line_filters)}"
+    return f"{key}:{settings_key}" if settings_key else key
@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+
+from . import metrics
+
+
+class Overloaded(Exception):
+    """Há mais requisições esperando por uma vaga de extração do que ASYNC_COUNTER["MAX_WAITING"]."""
+
+
+_lock = threading.Lock()
+_semaphore = None
+_executor = None
+_waiting = 0
+
+# Processos ou threads que cada nível interno de paralelismo (OCR, camada de
+# texto, pdftoppm, pool do Tesseract) pode usar neste processo. None fora dos
+# pools que processam vários arquivos ao mesmo tempo.
+_inner_budget = None
+
+
+def file_pool_options(workers):
+    """
+    Argumentos de ProcessPoolExecutor para um pool que processa `workers`
+    arquivos ao mesmo tempo (lotes, count_files, jobs): os processos dividem
+    os núcleos da máquina, e o paralelismo interno de cada um fica limitado
+    à sua parte, em vez de cada nível usar todos os núcleos.
+
+    :return: Dicionário com max_workers, initializer e initargs.
+    """
+    budget = max(1, (os.cpu_count() or 1) // max(1, workers))
+    return {"max_workers": workers, "initializer": limit_inner_workers, "initargs": (budget,)}
+
+
+def limit_inner_workers(budget):
+    """Initializer dos pools de file_pool_options."""
+    global _inner_budget
+    _inner_budget = budget
+
+
+def inner_workers(workers):
+    """Número de processos ou threads de um nível interno: `workers`, limitado à parte deste processo."""
+    return workers if _inner_budget is None else max(1, min(workers, _inner_budget))
+
+
+def _get_semaphore():
+    global _semaphore
+    with _lock:
+        if _semaphore is None:
+            _semaphore = asyncio.Semaphore(settings.ASYNC_COUNTER["MAX_CONCURRENT"])
+        return _semaphore
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_COUNTER["MAX_CONCURRENT"], thread_name_prefix="counter-extract"
+            )
+        return _executor
+
+
+def check_capacity():
+    """
+    Verifica se há lugar na fila de espera de run_extraction, para recusar a
+    requisição antes de começar a responder (ex.: counter_stream_async).
+
+    :raises Overloaded: Se todas as vagas estiverem ocupadas e a fila cheia.
+    """
+    if _get_semaphore().locked() and _waiting >= settings.ASYNC_COUNTER["MAX_WAITING"]:
+        raise Overloaded("Servidor ocupado, tente novamente mais tarde.")
+
+
+async def run_extraction(func, *args, **kwargs):
+    """
+    Executa uma extração bloqueante (pdfplumber, pdffonts, exiftool, poppler,
+    Tesseract) em uma thread do executor, sem bloquear o event loop.
+
+    Um semáforo global limita a ASYNC_COUNTER["MAX_CONCURRENT"] as extrações
+    simultâneas do processo; as demais esperam na ordem de chegada (a fila
+    do asyncio.Semaphore é FIFO). Com MAX_WAITING requisições já esperando,
+    a próxima é recusada com Overloaded em vez de entrar na fila.
+
+    A vaga só é liberada quando a extração termina, mesmo que a requisição
+    seja cancelada (cliente desconectado) antes disso. Os tempos medidos na
+    thread vão para a coleta de métricas da requisição.
+
+    :return: O retorno de func(*args, **kwargs).
+    :raises Overloaded: Se a fila de espera estiver cheia.
+    """
+    global _waiting
+    check_capacity()
+    semaphore = _get_semaphore()
+
+    _waiting += 1
+    try:
+        with metrics.stage("queue_wait"):
+            await semaphore.acquire()
+    finally:
+        _waiting -= 1
+
+    try:
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(
+            _get_executor(), partial(context.run, func, *args, **kwargs)
+        )
+    except BaseException:
+        semaphore.release()
+        raise
+    future.add_done_callback(lambda _: semaphore.release())
+    return await asyncio.shield(future)
+
@@ -0,0 +1,53 @@
+# Caracteres desconsiderados na contagem de caracteres sem espaços.
+WHITESPACE = ("\n", "\r", "\t", " ")
+
+
+def count_cleaned(text):
+    """Conta os caracteres do texto desconsiderando quebras de linha, tabulações e espaços."""
+    return len(text) - sum(text.count(char) for char in WHITESPACE)
+
+
+def count_characters(text):
+    """
+    Conta os caracteres do texto com e sem espaços, sem criar cópias do texto.
+
+    :return: Tupla (caracteres, caracteres sem quebras de linha, tabulações e espaços).
+    """
+    return len(text), count_cleaned(text)
+
+
+class TextAccumulator:
+    """
+    Junta os trechos de texto de um documento e conta palavras e caracteres à
+    medida que cada trecho chega.
+
+    Os trechos ficam em uma lista e são unidos uma única vez em `text`, em vez
+    de concatenados a cada página; as contagens de caracteres são as mesmas de
+    count_characters aplicada ao texto final.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.qt_words = 0
+        self.qt_char_extracted = 0
+        self.qt_char_cleaned = 0
+
+    def add(self, text, word_count=0):
+        """
+        Acrescenta um trecho de texto.
+
+        :param text: Trecho, na ordem em que aparece no documento.
+        :param word_count: Palavras do trecho.
+        """
+        if text:
+            self.parts.append(text)
+            self.qt_char_extracted += len(text)
+            self.qt_char_cleaned += count_cleaned(text)
+        self.qt_words += word_count
+
+    @property
+    def text(self):
+        """Texto acumulado até agora."""
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
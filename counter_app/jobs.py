@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files import File
+
+from . import metrics
+from .concurrency import file_pool_options
+
+
+class QueueFull(Exception):
+    """A fila de jobs atingiu settings.JOBS["MAX_QUEUE"]."""
+
+
+class JobCancelled(Exception):
+    """O job foi cancelado enquanto era processado."""
+
+
+class JobsUnavailable(Exception):
+    """O pool de processos dos jobs quebrou e não pôde ser recriado."""
+
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("done", "error", "cancelled")
+
+_executor = None
+_broken = None
+_futures = {}
+_lock = threading.Lock()
+_cleaned_at = 0
+
+
+def _job_dir(job_id):
+    return os.path.join(str(settings.JOBS["LOCATION"]), job_id)
+
+
+def _write_status(job_id, status):
+    """Grava o status do job de forma atômica, para leitura por qualquer processo."""
+    job_dir = _job_dir(job_id)
+    fd, temp_path = tempfile.mkstemp(dir=job_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(temp_path, os.path.join(job_dir, "status.json"))
+
+
+def get_job_status(job_id):
+    """
+    Lê o status de um job.
+
+    :param job_id: Identificador retornado por submit_job.
+    :return: Dicionário de status, ou None se o job não existir.
+    """
+    try:
+        with open(os.path.join(_job_dir(job_id), "status.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_cancelled(job_id):
+    return os.path.exists(os.path.join(_job_dir(job_id), "cancel"))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None or _executor is _broken:
+        _executor = ProcessPoolExecutor(**file_pool_options(settings.JOBS["WORKERS"]))
+    return _executor
+
+
+def _mark_broken(executor):
+    """
+    Marca um pool quebrado (um processo morreu) para o próximo job criar
+    outro. O próprio pool quebrado encerra os processos restantes; a
+    referência é mantida porque o callback que o descobre roda na thread
+    de gerenciamento do pool, onde ele não pode ser coletado.
+    """
+    global _broken
+    _broken = executor
+
+
+def _forget(job_id, executor, future):
+    with _lock:
+        _futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            _mark_broken(executor)
+    if error is None:
+        return
+    # O processo morreu sem gravar o status final (ex.: falta de memória)
+    status = get_job_status(job_id)
+    if status is not None and status["status"] not in FINISHED:
+        logger.error("Job %s interrompido: %s", job_id, error)
+        status.update({"status": "error", "message": "Erro: o processamento foi interrompido.",
+                       "finished_at": time.time()})
+        _write_status(job_id, status)
+
+
+def cleanup_jobs():
+    """
+    Remove os diretórios dos jobs terminados há mais de JOBS["TTL"] segundos,
+    e os de jobs sem status (envio interrompido) criados há mais que isso.
+
+    :return: Número de jobs removidos.
+    """
+    location = str(settings.JOBS["LOCATION"])
+    expires = time.time() - settings.JOBS["TTL"]
+    removed = 0
+    try:
+        entries = list(os.scandir(location))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        status = get_job_status(entry.name)
+        if status is None:
+            try:
+                expired = entry.stat().st_mtime < expires
+            except OSError:
+                continue
+        else:
+            expired = status["status"] in FINISHED and status.get("finished_at", 0) < expires
+        if expired:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _cleanup_periodically():
+    global _cleaned_at
+    now = time.monotonic()
+    if now - _cleaned_at < settings.JOBS["CLEANUP_INTERVAL"]:
+        return
+    _cleaned_at = now
+    cleanup_jobs()
+
+
+def submit_job(file, lang, preprocess=None, line_filters=None, page_selection=None, language_routing=None):
+    """
+    Grava o arquivo enviado no diretório de jobs e o coloca na fila.
+
+    :param file: Arquivo enviado (UploadedFile).
+    :param lang: Idiomas do Tesseract.
+    :param preprocess: Modo de pré-processamento das imagens.
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param page_selection: Seleção de páginas (intervalo ou amostra).
+    :param language_routing: Roteamento de idiomas do OCR por página.
+    :return: Identificador do job.
+    :raises QueueFull: Se já houver MAX_QUEUE jobs pendentes neste processo.
+    :raises JobsUnavailable: Se o pool de processos quebrar também depois de recriado.
+    """
+    _cleanup_periodically()
+    with _lock:
+        if len(_futures) >= settings.JOBS["MAX_QUEUE"]:
+            raise QueueFull("Fila de processamento cheia, tente novamente mais tarde.")
+
+    # O arquivo é gravado fora do lock, que só protege o registro do job:
+    # job_status e job_cancel não esperam a gravação de um upload grande
+    job_id = str(uuid.uuid4())
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir)
+    upload_path = os.path.join(job_dir, "upload" + os.path.splitext(file.name)[1].lower())
+    with open(upload_path, "wb") as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+    _write_status(job_id, {
+        "job_id": job_id,
+        "status": "queued",
+        "file_name": file.name,
+        "pages_done": 0,
+        "pages_total": None,
+        "created_at": time.time(),
+    })
+
+    with _lock:
+        if len(_futures) >= settings.JOBS["MAX_QUEUE"]:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise QueueFull("Fila de processamento cheia, tente novamente mais tarde.")
+        args = (job_id, upload_path, file.name, lang, preprocess, line_filters, page_selection, language_routing)
+        for _ in range(2):
+            executor = _get_executor()
+            try:
+                future = executor.submit(run_job, *args)
+                break
+            except BrokenProcessPool:
+                _mark_broken(executor)
+        else:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise JobsUnavailable("Processamento indisponível, tente novamente mais tarde.")
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _forget(job_id, executor, f))
+    return job_id
+
+
+def cancel_job(job_id):
+    """
+    Solicita o cancelamento de um job.
+
+    Jobs ainda na fila deste processo são retirados dela; jobs em execução
+    param ao terminar a página corrente.
+
+    :return: False se o job não existir ou já tiver terminado.
+    """
+    status = get_job_status(job_id)
+    if status is None or status["status"] in FINISHED:
+        return False
+
+    open(os.path.join(_job_dir(job_id), "cancel"), "w").close()
+    with _lock:
+        future = _futures.get(job_id)
+    if future is not None and future.cancel():
+        status["status"] = "cancelled"
+        _write_status(job_id, status)
+        for name in os.listdir(_job_dir(job_id)):
+            if name.startswith("upload"):
+                os.remove(os.path.join(_job_dir(job_id), name))
+    return True
+
+
+def run_job(job_id, upload_path, file_name, lang, preprocess=None, line_filters=None, page_selection=None,
+            language_routing=None):
+    """
+    Executa a extração de um job no processo do pool, registrando o progresso.
+
+    A cada página processada o status é regravado só com os contadores, e o
+    pedido de cancelamento é verificado no mesmo momento. As contagens por
+    página e o resultado entram no status uma vez, ao final.
+    """
+    from .views import cached_extract_file
+
+    status = get_job_status(job_id)
+    status.update({"status": "running", "started_at": time.time()})
+    pages = []
+
+    def progress(page, total):
+        # O texto da página fica só no resultado final
+        pages.append({key: value for key, value in page.items() if key != "text"})
+        status["pages_done"] = len(pages)
+        status["pages_total"] = total
+        _write_status(job_id, status)
+        if _is_cancelled(job_id):
+            raise JobCancelled()
+
+    try:
+        if _is_cancelled(job_id):
+            raise JobCancelled()
+        _write_status(job_id, status)
+        with metrics.collect() as timings, open(upload_path, "rb") as f:
+            result = cached_extract_file(
+                File(f, name=file_name), lang, preprocess, progress, line_filters, page_selection,
+                language_routing,
+            )
+        if not result["text_extracted"]:
+            raise ValueError("Erro ao extrair texto.")
+        if result["from_cache"]:
+            # Sem progresso por página: as contagens vêm do resultado guardado
+            paths = {route["page"]: route["path"] for route in result["page_routes"]}
+            pages = [
+                {**page, "word_count": page["words"], "path": paths.get(page["page"])}
+                for page in result["page_counts"]
+            ]
+            status.update({"pages_done": result["qt_pages"], "pages_total": result["qt_pages"]})
+
+        status.update({
+            "status": "done",
+            "pages": pages,
+            "result": {**result, "text_extracted": result["text_extracted"].strip()},
+            "timings": timings.as_dict(),
+        })
+    except JobCancelled:
+        status["status"] = "cancelled"
+    except Exception as e:
+        status.update({"status": "error", "message": f"Erro: {e}"})
+    finally:
+        status["finished_at"] = time.time()
+        _write_status(job_id, status)
+        os.remove(upload_path)
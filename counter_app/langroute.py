@@ -0,0 +1,147 @@
+import logging
+import re
+from collections import Counter
+
+import pytesseract
+from django.conf import settings
+
+from . import tesseract_pool
+
+
+logger = logging.getLogger(__name__)
+
+# Idiomas do Tesseract, entre os oferecidos na página, que usam cada script
+# informado pela detecção de orientação e script (OSD) do Tesseract.
+SCRIPT_LANGUAGES = {
+    "Latin": ("deu", "spa", "fra", "eng", "ita", "por"),
+    "Han": ("jpn",),
+    "Japanese": ("jpn",),
+    "Katakana": ("jpn",),
+    "Hiragana": ("jpn",),
+    "Hangul": ("kor",),
+    "Korean": ("kor",),
+    "Devanagari": ("hin",),
+}
+
+# Palavras funcionais frequentes, usadas para identificar quais idiomas de
+# script latino aparecem no texto de uma amostra de páginas.
+STOPWORDS = {
+    "por": frozenset("""
+        de que não para com uma os no se na por mais as dos como mas ao ele das à seu sua ou quando muito
+        nos já também são pelo pela até isso foi está ser pelos entre depois sem mesmo aos seus quem
+    """.split()),
+    "spa": frozenset("""
+        de que el la los las del se por un para con no una su al es lo como más pero sus le ya este sí
+        porque esta entre cuando muy sin sobre también hasta hay donde desde todo nos durante
+    """.split()),
+    "eng": frozenset("""
+        the and of to in is that it for was on are with as be this by have from or not but which at
+        they their an has been were will would there what all can
+    """.split()),
+    "fra": frozenset("""
+        le la les de des et est un une du que qui dans pour pas sur au avec ce il elle ne se plus par
+        sont aux ou mais nous vous cette été être leur comme fait
+    """.split()),
+    "deu": frozenset("""
+        der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an
+        werden aus er hat dass sie nach wird bei einer um noch wie
+    """.split()),
+    "ita": frozenset("""
+        di che il la per un non una del della sono con gli le dei nel si da al lo come più ma anche
+        alla questo ha delle nella essere è loro questa tra
+    """.split()),
+}
+
+WORD_RE = re.compile(r"\w+")
+
+
+def detect_script(image):
+    """
+    Detecta o script predominante de uma página com o OSD do Tesseract, pelo
+    pool do Tesseract quando habilitado (tesseract_pool.image_to_osd).
+
+    :param image: Imagem PIL da página.
+    :return: Tupla (script, confiança); (None, 0) se o OSD falhar, por
+        exemplo em páginas com pouco texto ou sem osd.traineddata.
+    """
+    try:
+        osd = tesseract_pool.image_to_osd(image)
+    except (pytesseract.TesseractError, ValueError) as e:
+        logger.warning("Erro na detecção de script da página: %s", e)
+        return None, 0
+    if osd is None:
+        return None, 0
+    return osd["script"], float(osd["script_conf"] or 0)
+
+
+def script_languages(lang, script):
+    """
+    Idiomas de `lang` ("deu+kor+por") que usam o script detectado.
+
+    :return: Lista de códigos, vazia se nenhum dos idiomas usa o script.
+    """
+    candidates = SCRIPT_LANGUAGES.get(script, ())
+    return [code for code in lang.split("+") if code in candidates]
+
+
+def route_languages(image, lang, latin=None):
+    """
+    Escolhe os idiomas do OCR de uma página: só os de `lang` que usam o
+    script detectado pelo OSD, e entre os latinos só os de `latin`, quando a
+    amostra do documento já os identificou (LanguageRouter).
+
+    Com confiança abaixo de OCR_LANGUAGE_ROUTING["MIN_SCRIPT_CONFIDENCE"], ou
+    se nenhum idioma pedido usa o script, a página usa todos os de `lang`.
+
+    :return: Dicionário {"script", "languages"}, com languages no formato do Tesseract.
+    """
+    script, confidence = detect_script(image)
+    languages = []
+    if script is not None and confidence >= settings.OCR_LANGUAGE_ROUTING["MIN_SCRIPT_CONFIDENCE"]:
+        languages = script_languages(lang, script)
+        if script == "Latin" and latin:
+            languages = [code for code in languages if code in latin] or languages
+    return {"script": script, "languages": "+".join(languages) or lang}
+
+
+def language_scores(text, candidates):
+    """Conta, para cada idioma candidato, as palavras do texto que estão em STOPWORDS."""
+    scores = Counter()
+    for word in WORD_RE.findall(text.lower()):
+        for code in candidates:
+            if word in STOPWORDS.get(code, ()):
+                scores[code] += 1
+    return scores
+
+
+class LanguageRouter:
+    """
+    Estado da escolha de idiomas ao longo de um documento.
+
+    As primeiras SAMPLE_PAGES páginas de script latino passam pelo OCR com
+    todos os idiomas latinos pedidos; pelas palavras funcionais do texto
+    delas ficam só os idiomas com pelo menos MIN_LANGUAGE_SHARE da pontuação
+    do mais frequente, usados nas páginas latinas seguintes.
+    """
+
+    def __init__(self, lang):
+        self.lang = lang
+        self.candidates = script_languages(lang, "Latin")
+        self.scores = Counter()
+        self.sampled = 0
+        self.latin = None if len(self.candidates) > 1 else self.candidates
+
+    def state(self):
+        """Idiomas latinos já identificados (ou None), para route_languages."""
+        return self.latin
+
+    def observe(self, detection, text):
+        """Acumula o texto de uma página latina da amostra e, ao fim dela, fixa os idiomas."""
+        if self.latin is not None or detection["script"] != "Latin":
+            return
+        self.scores.update(language_scores(text, self.candidates))
+        self.sampled += 1
+        if self.sampled >= settings.OCR_LANGUAGE_ROUTING["SAMPLE_PAGES"] and self.scores:
+            best = self.scores.most_common(1)[0][1]
+            share = settings.OCR_LANGUAGE_ROUTING["MIN_LANGUAGE_SHARE"]
+            self.latin = [code for code in self.candidates if self.scores[code] >= best * share]
@@ -0,0 +1,117 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Letras do Latin-1 (ASCII e acentuadas). Em linhas que cabem no Latin-1, o
+# número de letras é a diferença de tamanho depois de removê-las dos bytes, sem
+# percorrer os caracteres em Python.
+_LATIN1_LETTERS = bytes(i for i in range(256) if chr(i).isalpha())
+
+
+def alpha_ratio():
+    """Mantém linhas com pelo menos tantas letras quanto outros caracteres."""
+    def keep(line):
+        try:
+            data = line.encode("latin-1")
+        except UnicodeEncodeError:
+            alpha_count = sum(map(str.isalpha, line))
+        else:
+            alpha_count = len(data) - len(data.translate(None, _LATIN1_LETTERS))
+        return 2 * alpha_count >= len(line)
+    return keep
+
+
+def min_word_length(word_length=4):
+    """Mantém linhas com ao menos uma palavra de `word_length` caracteres ou mais."""
+    pattern = re.compile(r"\S{%d,}" % max(word_length, 1))
+    return lambda line: pattern.search(line) is not None
+
+
+LINE_FILTERS = {
+    "alpha_ratio": alpha_ratio,
+    "min_word_length": min_word_length,
+}
+
+
+def get_line_filter_options(word_length=None, remove_signature_lines=None):
+    """
+    Monta as opções dos filtros de linha, usando os padrões de settings para
+    o que não for informado.
+
+    :param word_length: Tamanho mínimo de palavra de min_word_length.
+    :param remove_signature_lines: Remove as linhas de assinatura do final.
+    :return: Dicionário {"word_length", "remove_signature_lines"}.
+    :raises ValueError: Se word_length não for um inteiro não negativo.
+    """
+    if word_length in (None, ""):
+        word_length = settings.OCR_WORD_LENGTH
+    try:
+        word_length = int(word_length)
+    except (TypeError, ValueError):
+        raise ValueError(f"Tamanho mínimo de palavra inválido: {word_length}")
+    if word_length < 0:
+        raise ValueError(f"Tamanho mínimo de palavra inválido: {word_length}")
+    if remove_signature_lines is None:
+        remove_signature_lines = settings.OCR_REMOVE_SIGNATURE_LINES
+    return {"word_length": word_length, "remove_signature_lines": bool(remove_signature_lines)}
+
+
+def line_filter_key(options):
+    """Representação curta das opções, usada nas chaves do cache de resultados."""
+    options = options or get_line_filter_options()
+    signature = "s" if options["remove_signature_lines"] else ""
+    return f"{','.join(settings.OCR_LINE_FILTERS)}/w{options['word_length']}{signature}"
+
+
+@lru_cache(maxsize=32)
+def _build(names, word_length, signature_keywords, signature_lines):
+    """Compila o pipeline: os predicados de cada linha e o de assinatura."""
+    params = {"min_word_length": {"word_length": word_length}}
+    predicates = [LINE_FILTERS[name](**params.get(name, {})) for name in names]
+    signature = None
+    if signature_keywords is not None:
+        signature = re.compile("|".join(re.escape(word.lower()) for word in signature_keywords))
+
+    def run(text):
+        kept = []
+        for line in text.splitlines():
+            for keep in predicates:
+                if not keep(line):
+                    break
+            else:
+                if signature is None:
+                    kept.append(line)
+                elif line.strip():
+                    kept.append(line.strip())
+        if signature is not None and signature_lines and len(kept) >= signature_lines and all(
+            signature.search(line.lower()) for line in kept[-signature_lines:]
+        ):
+            del kept[-signature_lines:]
+        return "\n".join(kept)
+
+    return run
+
+
+def filter_lines(text, options=None):
+    """
+    Aplica ao texto do OCR os filtros de settings.OCR_LINE_FILTERS, em ordem,
+    em uma única passada pelas linhas.
+
+    Com remove_signature_lines as linhas são aparadas, as vazias descartadas e,
+    se as últimas settings.OCR_SIGNATURE_LINES linhas contiverem alguma das
+    settings.OCR_SIGNATURE_KEYWORDS, elas são removidas.
+
+    :param text: Texto extraído pelo OCR.
+    :param options: Opções de get_line_filter_options; padrão as de settings.
+    :return: Texto filtrado.
+    """
+    options = options or get_line_filter_options()
+    signature_keywords = None
+    if options["remove_signature_lines"]:
+        signature_keywords = tuple(settings.OCR_SIGNATURE_KEYWORDS)
+    run = _build(
+        tuple(settings.OCR_LINE_FILTERS), options["word_length"], signature_keywords, settings.OCR_SIGNATURE_LINES
+    )
+    return run(text)
@@ -0,0 +1,113 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from counter_app.linefilters import filter_lines, get_line_filter_options
+
+
+def legacy_filter_lines(text_extracted, word_length=4, remove_target_lines=False):
+    """Filtros de linha como eram feitos em process_image, mantidos para comparação."""
+    # Remove linhas com caracteres não alfanuméricos excessivos
+    lines = text_extracted.splitlines()
+    cleaned_lines = []
+    for line in lines:
+        non_alpha_count = sum(1 for char in line if not char.isalpha())
+        alpha_count = sum(1 for char in line if char.isalpha())
+        if alpha_count >= non_alpha_count:
+            cleaned_lines.append(line)
+    text_extracted = "\n".join(cleaned_lines)
+
+    #Remove linhas que tem apenas palavras com menos caracteres que definido em word_length
+    lines = text_extracted.splitlines()
+    cleaned_lines = []
+    for line in lines:
+        # Ignorar linhas vazias ou com apenas espaços em branco
+        if line.strip():
+            words = line.split()
+            # Verificar se todas as palavras têm menos de N caracteres
+            if any(len(word) >= word_length for word in words):
+                cleaned_lines.append(line)
+    text_extracted = "\n".join(cleaned_lines)
+
+    # Remove target lines from the end of the text if they contain key words
+    if remove_target_lines:
+        key_words = ["assinado", "assinatura", "assinaturas"]
+        target_lines = 2
+        lines = [line.strip() for line in text_extracted.split("\n") if line.strip()]
+        def contains_key_words(line, words):
+            return any(word in line.lower() for word in words)
+        if len(lines) >= target_lines and all(contains_key_words(line, key_words) for line in lines[-target_lines:]):
+            lines = lines[:-target_lines]
+        text_extracted = "\n".join(lines)
+
+    return text_extracted
+
+
+WORDS = [
+    "contrato", "prestação", "serviços", "cláusula", "pagamento", "são", "de", "o", "a", "em",
+    "Tradução", "juramentada", "documento", "página", "número", "ação", "informação", "the", "of",
+]
+NOISE = "|!~.,;:-_=+*/\\()[]{}'\"0123456789"
+
+
+def make_ocr_text(lines, rng):
+    """Gera uma saída de OCR sintética: texto, ruído, palavras curtas e linhas vazias."""
+    output = []
+    for _ in range(lines):
+        kind = rng.random()
+        if kind < 0.6:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14)))
+        elif kind < 0.75:
+            line = "".join(rng.choice(NOISE) for _ in range(rng.randint(1, 30)))
+        elif kind < 0.85:
+            line = " ".join(rng.choice(("a", "de", "o", "em", "I", "|")) for _ in range(rng.randint(1, 6)))
+        elif kind < 0.95:
+            line = " ".join(rng.choice(WORDS) for _ in range(3)) + " " + "".join(
+                rng.choice(NOISE) for _ in range(rng.randint(5, 40))
+            )
+        else:
+            line = "   " if rng.random() < 0.5 else ""
+        output.append(line)
+    output += ["Assinado digitalmente por Fulano", "Verifique a assinatura em https://example.org"]
+    return "\n".join(output)
+
+
+class Command(BaseCommand):
+    help = "Compara o tempo dos filtros de linha do OCR com a implementação anterior de process_image."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=100000, help="Linhas do texto sintético.")
+        parser.add_argument("--repeat", type=int, default=5, help="Execuções de cada implementação.")
+        parser.add_argument("--word-length", type=int, default=4)
+        parser.add_argument("--remove-signature-lines", action="store_true")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        text = make_ocr_text(options["lines"], random.Random(options["seed"]))
+        line_filters = get_line_filter_options(options["word_length"], options["remove_signature_lines"])
+
+        def legacy():
+            return legacy_filter_lines(text, options["word_length"], options["remove_signature_lines"])
+
+        def current():
+            return filter_lines(text, line_filters)
+
+        if legacy() != current():
+            self.stderr.write("Os resultados das implementações diferem.")
+            return
+
+        timings = {}
+        for name, function in (("anterior", legacy), ("atual", current)):
+            runs = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                function()
+                runs.append(time.perf_counter() - start)
+            timings[name] = min(runs)
+            self.stdout.write(f"{name}: {timings[name] * 1000:.1f} ms")
+
+        self.stdout.write(
+            f"{options['lines']} linhas ({len(text)} caracteres), resultados idênticos, "
+            f"{timings['anterior'] / timings['atual']:.1f}x mais rápido"
+        )
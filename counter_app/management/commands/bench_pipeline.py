@@ -0,0 +1,97 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from counter_app.benchmarks.corpus import KINDS, SAMPLES, generate_corpus
+from counter_app.benchmarks.runner import STAGES, check_text_layer, compare, run_benchmarks
+
+
+def _split(value):
+    return [item for item in value.split(",") if item]
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera um corpus sintético de PDFs e imagens e mede o tempo e o pico de memória de cada etapa "
+        "da extração, opcionalmente comparando com um baseline salvo. Verifica também se a engine "
+        "\"fast\" da camada de texto extrai as mesmas palavras que o pdfplumber em todo o corpus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=os.path.join(settings.BASE_DIR, "benchmarks", "corpus"),
+                            help="Diretório do corpus; é gerado se não existir.")
+        parser.add_argument("--kinds", default=",".join(KINDS), help=f"Tipos de PDF: {', '.join(KINDS)}.")
+        parser.add_argument("--pages", default="1,10", help="Números de páginas dos PDFs, separados por vírgula.")
+        parser.add_argument("--langs", default="por,eng", help=f"Idiomas: {', '.join(SAMPLES)}.")
+        parser.add_argument("--stages", default=",".join(STAGES), help="Etapas a medir.")
+        parser.add_argument("--repeat", type=int, default=3, help="Execuções de cada etapa por documento.")
+        parser.add_argument("--dpi", type=int, default=200, help="Resolução das páginas digitalizadas.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=os.path.join(settings.BASE_DIR, "benchmarks", "latest.json"),
+                            help="Arquivo JSON com os resultados.")
+        parser.add_argument("--baseline", help="Resultados anteriores (JSON) para comparação.")
+        parser.add_argument("--threshold", type=float, default=0.1,
+                            help="Aumento relativo de tempo ou memória considerado regressão.")
+        parser.add_argument("--fail-on-regression", action="store_true",
+                            help="Termina com erro se alguma etapa regredir.")
+
+    def handle(self, *args, **options):
+        kinds, langs, stages = _split(options["kinds"]), _split(options["langs"]), _split(options["stages"])
+        for name, values, valid in (("tipo", kinds, KINDS), ("idioma", langs, SAMPLES), ("etapa", stages, STAGES)):
+            unknown = [value for value in values if value not in valid]
+            if unknown:
+                raise CommandError(f"{name.capitalize()} desconhecido: {', '.join(unknown)}")
+        try:
+            page_counts = [int(pages) for pages in _split(options["pages"])]
+        except ValueError:
+            raise CommandError(f"Números de páginas inválidos: {options['pages']}")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        documents = generate_corpus(options["corpus"], kinds, page_counts, langs, options["seed"], options["dpi"])
+        self.stdout.write(f"Corpus com {len(documents)} documentos em {options['corpus']}")
+
+        def report(result):
+            if "error" in result:
+                self.stdout.write(f"{result['document']:<28} {result['stage']:<30} erro: {result['error']}")
+            else:
+                self.stdout.write(
+                    f"{result['document']:<28} {result['stage']:<30} {result['median'] * 1000:>10.1f} ms "
+                    f"{result['peak_rss_kb'] / 1024:>8.1f} MB"
+                )
+
+        results = run_benchmarks(options["corpus"], documents, stages, options["repeat"], report)
+        if baseline is not None:
+            results["comparison"] = compare(results, baseline, options["threshold"])
+        results["text_layer_differences"] = check_text_layer(options["corpus"], documents)
+        for row in results["text_layer_differences"]:
+            self.stdout.write(
+                f"{row['document']:<28} página {row['page']}: {row['fast_words']} palavras na engine fast, "
+                f"{row['pdfplumber_words']} no pdfplumber (primeira diferença na palavra {row['first_difference']})"
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(options["output"])), exist_ok=True)
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Resultados gravados em {options['output']}")
+        if results["text_layer_differences"]:
+            raise CommandError(
+                f"A engine fast da camada de texto diverge do pdfplumber em "
+                f"{len(results['text_layer_differences'])} páginas."
+            )
+
+        if baseline is None:
+            return
+        regressions = [row for row in results["comparison"] if row["regression"]]
+        for row in results["comparison"]:
+            self.stdout.write(
+                f"{row['document']:<28} {row['stage']:<30} tempo {row['time_ratio'] or 0:>5.2f}x "
+                f"memória {row['rss_ratio'] or 0:>5.2f}x{'  REGRESSÃO' if row['regression'] else ''}"
+            )
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{len(regressions)} etapas regrediram mais de {options['threshold']:.0%}.")
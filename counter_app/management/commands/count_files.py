@@ -0,0 +1,83 @@
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from counter_app.bulk import ResultWriter, Throughput, iter_sources, output_format, read_checkpoint, run_bulk
+from counter_app.linefilters import get_line_filter_options
+from counter_app.views import get_preprocess_pipelines
+
+
+class Command(BaseCommand):
+    help = (
+        "Conta palavras e caracteres de PDFs e imagens em arquivos, diretórios e arquivos .zip/.tar, "
+        "em paralelo, gravando um resultado por arquivo em JSONL ou CSV. Com --resume, retoma uma "
+        "execução interrompida a partir do arquivo de resultados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Arquivos, diretórios ou arquivos .zip/.tar(.gz).")
+        parser.add_argument("--output", required=True, help="Arquivo de resultados (.jsonl ou .csv).")
+        parser.add_argument("--format", choices=("jsonl", "csv"),
+                            help="Formato do arquivo de resultados; padrão pela extensão.")
+        parser.add_argument("--resume", action="store_true",
+                            help="Pula os arquivos já presentes em --output e acrescenta os demais.")
+        parser.add_argument("--langs", default="por", help="Idiomas do Tesseract, ex.: por+eng.")
+        parser.add_argument("--preprocess", default=settings.OCR_PREPROCESS_MODE,
+                            help="Modo de pré-processamento das imagens.")
+        parser.add_argument("--word-length", type=int, help="Tamanho mínimo de palavra dos filtros de linha.")
+        parser.add_argument("--remove-signature-lines", action="store_true",
+                            help="Remove as linhas de assinatura do final do texto.")
+        parser.add_argument("--language-routing", action="store_true",
+                            help="Aplica o OCR de cada página só com os idiomas do script detectado.")
+        parser.add_argument("--workers", type=int, default=settings.BATCH["WORKERS"], help="Número de processos.")
+        parser.add_argument("--progress-every", type=int, default=100,
+                            help="Mostra a vazão a cada N arquivos contados.")
+
+    def handle(self, *args, **options):
+        missing = [path for path in options["paths"] if not os.path.exists(path)]
+        if missing:
+            raise CommandError(f"Caminho não encontrado: {', '.join(missing)}")
+        if options["preprocess"] not in get_preprocess_pipelines():
+            raise CommandError(f"Modo de pré-processamento desconhecido: {options['preprocess']}")
+        try:
+            line_filters = get_line_filter_options(options["word_length"], options["remove_signature_lines"] or None)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output, fmt = options["output"], output_format(options["output"], options["format"])
+        done = read_checkpoint(output, fmt) if options["resume"] else set()
+        if done:
+            self.stdout.write(f"Retomando: {len(done)} arquivos já contados em {output}")
+
+        throughput = Throughput()
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with ResultWriter(output, fmt, append=options["resume"]) as writer:
+            results = run_bulk(
+                iter_sources(options["paths"]), options["langs"], options["preprocess"], line_filters,
+                options["language_routing"], options["workers"], done,
+            )
+            try:
+                for result in results:
+                    writer.write(result)
+                    throughput.add(result)
+                    if "error" in result:
+                        self.stderr.write(f"{result['source']}: {result['error']}")
+                    if options["progress_every"] and throughput.files % options["progress_every"] == 0:
+                        summary = throughput.as_dict()
+                        self.stdout.write(
+                            f"{summary['files']} arquivos ({summary['failed']} com erro), "
+                            f"{summary['files_per_second']} arquivos/s, {summary['pages_per_second']} páginas/s"
+                        )
+            except BrokenProcessPool:
+                raise CommandError(
+                    f"Um processo de contagem foi encerrado abruptamente (ex.: falta de memória) depois de "
+                    f"{throughput.files} arquivos. Os resultados já contados estão em {output}; rode de novo "
+                    f"com --resume para continuar, reduzindo --workers se preciso."
+                )
+
+        summary = throughput.as_dict()
+        self.stdout.write(json.dumps(summary, indent=2, ensure_ascii=False))
+        self.stdout.write(f"Resultados gravados em {output}")
@@ -0,0 +1,260 @@
+import hmac
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger(__name__)
+
+# Prefixo das etapas que medem a execução de programas externos.
+SUBPROCESS_PREFIX = "subprocess."
+
+REQUEST_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+
+class Timings:
+    """
+    Tempos por etapa e contadores de uma requisição (ou de um job, ou do OCR
+    de uma página em outro processo).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, stage, seconds, calls=1):
+        total = self.stages.setdefault(stage, [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data):
+        """Soma os tempos e contadores de as_dict() de outro Timings."""
+        for stage, values in data["stages"].items():
+            self.add(stage, values["seconds"], values["calls"])
+        for name, value in data["counters"].items():
+            self.count(name, value)
+
+    def as_dict(self):
+        return {
+            "stages": {
+                stage: {"seconds": round(seconds, 6), "calls": calls}
+                for stage, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])
+            },
+            "counters": dict(self.counters),
+        }
+
+
+_current = ContextVar("counter_timings", default=None)
+
+
+def current():
+    """Timings da requisição em andamento, ou None fora de collect()."""
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Coleta os tempos das etapas executadas no bloco, neste contexto."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Mede o bloco como a etapa `name` da coleta em andamento, se houver."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def count(name, value=1):
+    """Incrementa um contador (páginas, imagens, palavras...) da coleta em andamento."""
+    timings = _current.get()
+    if timings is not None:
+        timings.count(name, value)
+
+
+def merge(data):
+    """Soma à coleta em andamento os tempos medidos em outra thread ou processo."""
+    timings = _current.get()
+    if timings is not None and data:
+        timings.merge(data)
+
+
+# Totais do processo, expostos em /metrics. Cada processo (ex.: cada worker
+# do gunicorn) mantém os seus.
+_lock = threading.Lock()
+_stage_totals = {}
+_counter_totals = {}
+_requests = {}
+
+
+def observe(timings, view, status, seconds):
+    """Acumula nos totais do processo os tempos de uma requisição concluída."""
+    data = timings.as_dict()
+    with _lock:
+        for stage_name, values in data["stages"].items():
+            total = _stage_totals.setdefault(stage_name, [0.0, 0])
+            total[0] += values["seconds"]
+            total[1] += values["calls"]
+        for name, value in data["counters"].items():
+            _counter_totals[name] = _counter_totals.get(name, 0) + value
+        request = _requests.setdefault((view, status), {"count": 0, "sum": 0.0, "buckets": [0] * len(REQUEST_BUCKETS)})
+        request["count"] += 1
+        request["sum"] += seconds
+        for index, bound in enumerate(REQUEST_BUCKETS):
+            if seconds <= bound:
+                request["buckets"][index] += 1
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    """Totais do processo no formato de texto do Prometheus."""
+    with _lock:
+        stages = {name: list(values) for name, values in _stage_totals.items()}
+        counters = dict(_counter_totals)
+        requests = {key: {**value, "buckets": list(value["buckets"])} for key, value in _requests.items()}
+
+    lines = [
+        "# HELP counter_stage_seconds_total Tempo gasto em cada etapa da extração.",
+        "# TYPE counter_stage_seconds_total counter",
+    ]
+    lines += [
+        f'counter_stage_seconds_total{{stage="{_label(name)}"}} {seconds}'
+        for name, (seconds, _) in sorted(stages.items()) if not name.startswith(SUBPROCESS_PREFIX)
+    ]
+    lines += ["# HELP counter_stage_calls_total Execuções de cada etapa da extração.",
+              "# TYPE counter_stage_calls_total counter"]
+    lines += [
+        f'counter_stage_calls_total{{stage="{_label(name)}"}} {calls}'
+        for name, (_, calls) in sorted(stages.items()) if not name.startswith(SUBPROCESS_PREFIX)
+    ]
+    lines += ["# HELP counter_subprocess_seconds_total Tempo gasto em programas externos.",
+              "# TYPE counter_subprocess_seconds_total counter"]
+    lines += [
+        f'counter_subprocess_seconds_total{{command="{_label(name[len(SUBPROCESS_PREFIX):])}"}} {seconds}'
+        for name, (seconds, _) in sorted(stages.items()) if name.startswith(SUBPROCESS_PREFIX)
+    ]
+    lines += ["# HELP counter_subprocess_calls_total Execuções de programas externos.",
+              "# TYPE counter_subprocess_calls_total counter"]
+    lines += [
+        f'counter_subprocess_calls_total{{command="{_label(name[len(SUBPROCESS_PREFIX):])}"}} {calls}'
+        for name, (_, calls) in sorted(stages.items()) if name.startswith(SUBPROCESS_PREFIX)
+    ]
+    for name, value in sorted(counters.items()):
+        lines += [f"# TYPE counter_{name}_total counter", f"counter_{name}_total {value}"]
+
+    lines += ["# HELP counter_request_duration_seconds Duração das requisições.",
+              "# TYPE counter_request_duration_seconds histogram"]
+    for (view, status), request in sorted(requests.items()):
+        labels = f'view="{_label(view)}",status="{status}"'
+        for bound, value in zip(REQUEST_BUCKETS, request["buckets"]):
+            lines.append(f'counter_request_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+        lines.append(f'counter_request_duration_seconds_bucket{{{labels},le="+Inf"}} {request["count"]}')
+        lines.append(f"counter_request_duration_seconds_sum{{{labels}}} {request['sum']}")
+        lines.append(f"counter_request_duration_seconds_count{{{labels}}} {request['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_allowed(request):
+    """
+    Indica se a requisição pode ler /metrics: vem de um IP de
+    METRICS["ALLOWED_IPS"] ou traz o METRICS["TOKEN"] no cabeçalho
+    "Authorization: Bearer <token>".
+    """
+    config = settings.METRICS
+    if request.META.get("REMOTE_ADDR") in config["ALLOWED_IPS"]:
+        return True
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return bool(config["TOKEN"]) and scheme.lower() == "bearer" and hmac.compare_digest(
+        token.strip().encode(), config["TOKEN"].encode()
+    )
+
+
+def metrics_view(request):
+    """Exporta as métricas do processo para o Prometheus."""
+    if not settings.METRICS["ENABLED"]:
+        raise Http404()
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """
+    Mede cada requisição: abre uma coleta de tempos por etapa, acumula o
+    resultado nos totais do processo e grava uma linha JSON por requisição no
+    logger counter_app.metrics.
+
+    Funciona nos modos síncrono e assíncrono, para que views assíncronas
+    servidas por ASGI não sejam executadas em uma thread por causa dele.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS["ENABLED"]:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with collect() as timings:
+            response = self.get_response(request)
+        self._finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS["ENABLED"]:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        with collect() as timings:
+            response = await self.get_response(request)
+        self._finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def _finish(self, request, response, timings, seconds):
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else "other"
+        if view == "metrics":
+            return
+        observe(timings, view, response.status_code, seconds)
+        if settings.METRICS["TIMING_LOG"]:
+            logger.info(json.dumps({
+                "view": view,
+                "method": request.method,
+                "status": response.status_code,
+                "seconds": round(seconds, 6),
+                **timings.as_dict(),
+            }))
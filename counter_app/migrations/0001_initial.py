@@ -0,0 +1,55 @@
+# Generated by Django 6.1.2 on 2026-10-18 16:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Extraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lookup_key', models.CharField(max_length=64)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField()),
+                ('languages', models.CharField(max_length=100)),
+                ('preprocess', models.CharField(max_length=50)),
+                ('path', models.CharField(choices=[('text', 'Camada de texto'), ('ocr', 'OCR'), ('hybrid', 'Camada de texto e OCR')], max_length=10)),
+                ('qt_pages', models.PositiveIntegerField(default=0)),
+                ('qt_images', models.PositiveIntegerField(default=0)),
+                ('qt_words', models.PositiveIntegerField(default=0)),
+                ('qt_char_extracted', models.PositiveIntegerField(default=0)),
+                ('qt_char_cleaned', models.PositiveIntegerField(default=0)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('text_zlib', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lookup_key', 'created_at'], name='extraction_lookup_idx'), models.Index(fields=['file_hash', 'created_at'], name='extraction_hash_idx'), models.Index(fields=['created_at'], name='extraction_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PageCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.PositiveIntegerField()),
+                ('path', models.CharField(choices=[('text', 'Camada de texto'), ('ocr', 'OCR')], max_length=10)),
+                ('words', models.PositiveIntegerField(default=0)),
+                ('chars', models.PositiveIntegerField(default=0)),
+                ('chars_cleaned', models.PositiveIntegerField(default=0)),
+                ('extraction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='counter_app.extraction')),
+            ],
+            options={
+                'ordering': ['page'],
+                'constraints': [models.UniqueConstraint(fields=('extraction', 'page'), name='pagecount_extraction_page_unique')],
+            },
+        ),
+    ]
@@ -1,3 +1,75 @@
+import zlib
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class Extraction(models.Model):
+    """
+    Resultado de uma extração completa de um arquivo, com as opções usadas.
+
+    O texto fica comprimido com zlib em text_zlib (use a propriedade text).
+    lookup_key é o SHA-256 da chave do cache de resultados (hash do conteúdo,
+    idiomas, pré-processamento, filtros de linha e configurações da extração),
+    usado para servir de novo o mesmo arquivo com as mesmas opções sem extrair.
+    """
+
+    PATH_CHOICES = [
+        ("text", "Camada de texto"),
+        ("ocr", "OCR"),
+        ("hybrid", "Camada de texto e OCR"),
+    ]
+
+    lookup_key = models.CharField(max_length=64)
+    file_hash = models.CharField(max_length=64)
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    languages = models.CharField(max_length=100)
+    preprocess = models.CharField(max_length=50)
+    path = models.CharField(max_length=10, choices=PATH_CHOICES)
+    qt_pages = models.PositiveIntegerField(default=0)
+    qt_images = models.PositiveIntegerField(default=0)
+    qt_words = models.PositiveIntegerField(default=0)
+    qt_char_extracted = models.PositiveIntegerField(default=0)
+    qt_char_cleaned = models.PositiveIntegerField(default=0)
+    timings = models.JSONField(default=dict, blank=True)
+    text_zlib = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lookup_key", "created_at"], name="extraction_lookup_idx"),
+            models.Index(fields=["file_hash", "created_at"], name="extraction_hash_idx"),
+            models.Index(fields=["created_at"], name="extraction_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.languages}, {self.created_at:%Y-%m-%d %H:%M})"
+
+    @property
+    def text(self):
+        return zlib.decompress(self.text_zlib).decode("utf-8")
+
+    @text.setter
+    def text(self, value):
+        self.text_zlib = zlib.compress(value.encode("utf-8"), settings.RESULT_STORE["COMPRESSION_LEVEL"])
+
+
+class PageCount(models.Model):
+    """Contagens de uma página de uma extração e o caminho (camada de texto ou OCR) dela."""
+
+    extraction = models.ForeignKey(Extraction, on_delete=models.CASCADE, related_name="pages")
+    page = models.PositiveIntegerField()
+    path = models.CharField(max_length=10, choices=[("text", "Camada de texto"), ("ocr", "OCR")])
+    words = models.PositiveIntegerField(default=0)
+    chars = models.PositiveIntegerField(default=0)
+    chars_cleaned = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["extraction", "page"], name="pagecount_extraction_page_unique"),
+        ]
+        ordering = ["page"]
+
+    def __str__(self):
+        return f"{self.extraction_id}:{self.page}"
@@ -0,0 +1,162 @@
+import hashlib
+import io
+
+from PIL import Image
+from pdfminer.pdftypes import resolve1
+
+from .utils import pdf_name
+
+
+class UnsupportedImage(Exception):
+    """O stream da imagem usa um filtro ou espaço de cores que não sabemos decodificar."""
+
+
+# Filtros cujos dados, depois de decodificados os demais, já são um arquivo de
+# imagem que o Pillow abre diretamente.
+ENCODED_FILTERS = {"DCTDecode", "DCT", "JPXDecode"}
+
+UNSUPPORTED_FILTERS = {"JBIG2Decode"}
+
+COLOR_MODES = {
+    "DeviceGray": "L",
+    "CalGray": "L",
+    "DeviceRGB": "RGB",
+    "CalRGB": "RGB",
+    "DeviceCMYK": "CMYK",
+}
+
+ICC_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+
+# Formato cru do Pillow para os índices de uma imagem Indexed, por BitsPerComponent.
+INDEXED_RAWMODES = {1: "P;1", 2: "P;2", 4: "P;4", 8: "P"}
+
+INVERT = bytes(range(255, -1, -1))
+
+
+def image_hash(image):
+    """
+    Hash do conteúdo decodificado de uma imagem embutida, usado para
+    deduplicação. Usa os dados decodificados porque o pdfminer descarta os
+    bytes brutos do stream depois de decodificá-lo.
+    """
+    return hashlib.sha1(image["stream"].get_data()).hexdigest()
+
+
+def image_pixels(image):
+    """Número de pixels da imagem, pelas dimensões declaradas no stream."""
+    width, height = image["srcsize"]
+    return (width or 0) * (height or 0)
+
+
+def _color_mode(colorspace):
+    """
+    Retorna (modo do Pillow, paleta) para um espaço de cores PDF.
+
+    :raises UnsupportedImage: Para espaços de cores não tratados.
+    """
+    colorspace = resolve1(colorspace)
+    if isinstance(colorspace, list):
+        name = pdf_name(colorspace[0])
+        if name == "ICCBased":
+            components = resolve1(colorspace[1]).attrs.get("N", 3)
+            return ICC_MODES.get(components), None
+        if name == "Indexed":
+            base_mode, _ = _color_mode(colorspace[1])
+            lookup = resolve1(colorspace[3])
+            lookup = lookup.get_data() if hasattr(lookup, "get_data") else lookup
+            if isinstance(lookup, str):
+                lookup = lookup.encode("latin-1")
+            if base_mode not in ("L", "RGB"):
+                raise UnsupportedImage(f"Espaço de cores Indexed sobre {base_mode}")
+            return "P", (base_mode, bytes(lookup))
+        if len(colorspace) == 1:
+            return _color_mode(colorspace[0])
+        raise UnsupportedImage(f"Espaço de cores {name}")
+    name = pdf_name(colorspace)
+    if name not in COLOR_MODES:
+        raise UnsupportedImage(f"Espaço de cores {name}")
+    return COLOR_MODES[name], None
+
+
+def _decode_ranges(stream):
+    """Pares (Dmin, Dmax) do /Decode do stream, ou None se ele não existir."""
+    decode = resolve1(stream.attrs.get("Decode", stream.attrs.get("D")))
+    if not decode:
+        return None
+    values = [float(resolve1(value)) for value in decode]
+    return list(zip(values[0::2], values[1::2]))
+
+
+def _component_table(low, high):
+    """Tabela de 256 entradas que aplica um par do /Decode a uma componente de 8 bits."""
+    return [min(255, max(0, round((low + (high - low) * x / 255) * 255))) for x in range(256)]
+
+
+def _apply_decode(decoded, ranges):
+    """Aplica o /Decode às componentes de uma imagem L, RGB ou CMYK."""
+    bands = len(decoded.getbands())
+    if ranges is None or len(ranges) < bands or all(pair == (0, 1) for pair in ranges[:bands]):
+        return decoded
+    return decoded.point([value for low, high in ranges[:bands] for value in _component_table(low, high)])
+
+
+def decode_pdf_image(image):
+    """
+    Decodifica uma imagem embutida de um PDF (item de page.images do pdfplumber)
+    em uma imagem PIL, de acordo com o filtro real do stream.
+
+    JPEG e JPEG 2000 são abertos pelo Pillow; Flate, LZW, RunLength, ASCII e
+    CCITT são decodificados pelo pdfminer e os pixels montados conforme
+    BitsPerComponent e ColorSpace. O /Decode é aplicado (ex.: [1 0] em
+    máscaras e digitalizações invertidas), e imagens Indexed de 1, 2, 4 ou 8
+    bits recebem a paleta do espaço de cores.
+
+    :param image: Dicionário de imagem do pdfplumber.
+    :return: Imagem PIL.
+    :raises UnsupportedImage: Para JBIG2 e espaços de cores não tratados.
+    """
+    stream = image["stream"]
+    filters = [pdf_name(name) for name, _ in stream.get_filters()]
+    if filters and filters[-1] in UNSUPPORTED_FILTERS:
+        raise UnsupportedImage(f"Filtro {filters[-1]}")
+
+    data = stream.get_data()
+    ranges = _decode_ranges(stream)
+    if filters and filters[-1] in ENCODED_FILTERS:
+        decoded = Image.open(io.BytesIO(data))
+        # O /Decode não vale para JPEG 2000, e o Pillow já desfaz a inversão dos JPEG CMYK da Adobe
+        if filters[-1] == "JPXDecode" or (decoded.mode == "CMYK" and "adobe" in decoded.info):
+            return decoded
+        return _apply_decode(decoded, ranges)
+
+    width, height = image["srcsize"]
+    bits = image["bits"] or 1
+    if image.get("imagemask"):
+        mode, palette = "1", None
+    else:
+        mode, palette = _color_mode(image["colorspace"])
+        if palette is None and bits == 1 and mode == "L":
+            mode = "1"
+        elif palette is None and (bits != 8 or mode is None):
+            raise UnsupportedImage(f"{bits} bits por componente")
+
+    if mode == "1":
+        # Amostra 0 é preto e 1 é branco, como no modo "1" do Pillow; [1 0] inverte
+        if ranges and ranges[0][0] > ranges[0][1]:
+            data = data.translate(INVERT)
+        return Image.frombytes("1", (width, height), data)
+
+    if palette is not None:
+        if bits not in INDEXED_RAWMODES:
+            raise UnsupportedImage(f"Indexed com {bits} bits por componente")
+        decoded = Image.frombytes("P", (width, height), data, "raw", INDEXED_RAWMODES[bits])
+        if ranges:
+            # No Indexed o /Decode mapeia os índices ([0 hival] por padrão)
+            low, high = ranges[0]
+            maximum = (1 << bits) - 1
+            table = bytes(min(255, max(0, round(low + (high - low) * x / maximum))) for x in range(256))
+            decoded = Image.frombytes("P", (width, height), decoded.tobytes().translate(table))
+        base_mode, lookup = palette
+        decoded.putpalette(lookup, rawmode=base_mode)
+        return decoded
+    return _apply_decode(Image.frombytes(mode, (width, height), data), ranges)
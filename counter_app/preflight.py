@@ -0,0 +1,236 @@
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from PIL import Image
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from . import metrics
+
+
+# Assinaturas (magic bytes) dos tipos aceitos. O cabeçalho %PDF- pode vir
+# depois de lixo no início do arquivo, até PDF_HEADER_WINDOW bytes.
+SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"PK\x03\x04", "zip"),
+)
+
+PDF_HEADER_WINDOW = 1024
+
+# Extensões aceitas para cada tipo identificado pelo conteúdo.
+EXTENSIONS = {
+    "pdf": ("pdf",),
+    "jpeg": ("jpg", "jpeg"),
+    "png": ("png",),
+    "gif": ("gif",),
+    "bmp": ("bmp",),
+    "tiff": ("tiff",),
+    "zip": ("zip",),
+}
+
+
+class PreflightError(ValueError):
+    """O arquivo foi recusado antes da extração; `status` é o código HTTP sugerido."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _size_error():
+    limit = settings.UPLOAD_LIMITS["MAX_BYTES"]
+    return PreflightError(f"Arquivo maior que o limite de {limit // (1024 * 1024)} MB.", status=413)
+
+
+def sniff_type(head):
+    """
+    Identifica o tipo do arquivo pelos primeiros bytes.
+
+    :param head: Início do arquivo (ao menos PDF_HEADER_WINDOW bytes, se houver).
+    :return: Tipo ("pdf", "jpeg", "png", "gif", "bmp", "tiff" ou "zip") ou None.
+    """
+    if b"%PDF-" in head[:PDF_HEADER_WINDOW]:
+        return "pdf"
+    for signature, kind in SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def check_file_type(name, head):
+    """
+    Confere se o conteúdo do arquivo é de um tipo aceito e corresponde à
+    extensão do nome, que decide o caminho de extração.
+
+    :return: Tipo identificado por sniff_type.
+    :raises PreflightError: Se o tipo não for reconhecido ou não corresponder à extensão.
+    """
+    kind = sniff_type(head)
+    if kind is None:
+        raise PreflightError("Tipo de arquivo não suportado.", status=415)
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    if extension not in EXTENSIONS[kind]:
+        raise PreflightError(
+            f"O conteúdo do arquivo ({kind}) não corresponde à extensão .{extension}.", status=415
+        )
+    return kind
+
+
+def check_page_limit(pages):
+    """
+    :raises PreflightError: Se o PDF tiver mais de UPLOAD_LIMITS["MAX_PAGES"] páginas.
+    """
+    limit = settings.UPLOAD_LIMITS["MAX_PAGES"]
+    if pages > limit:
+        raise PreflightError(f"PDF excede o limite de {limit} páginas.", status=413)
+
+
+def pdf_page_count(file, limit=None):
+    """
+    Conta as páginas de um PDF no próprio processo percorrendo a árvore de
+    páginas como o pdfplumber (PDFPage.create_pages), sem interpretar o
+    conteúdo delas. O /Count da árvore não é usado: ele vem do próprio
+    arquivo e pode declarar menos páginas do que as que serão processadas.
+
+    :param file: Objeto de arquivo posicionado em qualquer ponto; volta ao início.
+    :param limit: Para de contar ao passar deste número de páginas.
+    :raises PreflightError: Se o PDF não puder ser lido.
+    """
+    try:
+        pages = PDFPage.create_pages(PDFDocument(PDFParser(file)))
+        return sum(1 for _ in (pages if limit is None else islice(pages, limit + 1)))
+    except Exception as e:
+        raise PreflightError(f"PDF inválido: {e}")
+    finally:
+        file.seek(0)
+
+
+def image_dimensions(file):
+    """
+    Lê largura e altura de uma imagem só pelo cabeçalho, sem decodificar os pixels.
+
+    :raises PreflightError: Se a imagem não puder ser lida.
+    """
+    try:
+        with Image.open(file) as image:
+            return image.size
+    except Exception as e:
+        raise PreflightError(f"Imagem inválida: {e}")
+    finally:
+        file.seek(0)
+
+
+def preflight(file):
+    """
+    Verifica um arquivo enviado antes da extração: tamanho, tipo pelo
+    conteúdo, número de páginas (PDF) ou de pixels (imagens), comparados com
+    settings.UPLOAD_LIMITS.
+
+    :param file: Arquivo enviado (UploadedFile ou File).
+    :return: Dicionário {"kind", "bytes", "pages", "pixels"}.
+    :raises PreflightError: Se o arquivo for recusado.
+    """
+    limits = settings.UPLOAD_LIMITS
+    with metrics.stage("preflight"):
+        size = file.size
+        if size > limits["MAX_BYTES"]:
+            raise _size_error()
+        file.seek(0)
+        head = file.read(PDF_HEADER_WINDOW)
+        file.seek(0)
+        kind = check_file_type(file.name, head)
+
+        pages, pixels = 1, None
+        if kind == "pdf":
+            pages = pdf_page_count(file, limits["MAX_PAGES"])
+            check_page_limit(pages)
+        elif kind != "zip":
+            width, height = image_dimensions(file)
+            pixels = width * height
+            if pixels > limits["MAX_PIXELS"]:
+                raise PreflightError(
+                    f"Imagem de {width}x{height} pixels excede o limite de {limits['MAX_PIXELS']} pixels.",
+                    status=413,
+                )
+
+    return {"kind": kind, "bytes": size, "pages": pages, "pixels": pixels}
+
+
+def needs_async(upload, pages=None):
+    """
+    Indica se um arquivo verificado por preflight passa dos limites do
+    processamento síncrono e deve ir para a fila de jobs.
+
+    :param upload: Resultado de preflight.
+    :param pages: Páginas que serão processadas, quando só um intervalo ou
+        uma amostra do documento é pedido; padrão o documento inteiro.
+    """
+    limits = settings.UPLOAD_LIMITS
+    if pages is not None:
+        return pages > limits["SYNC_MAX_PAGES"]
+    return upload["pages"] > limits["SYNC_MAX_PAGES"] or upload["bytes"] > limits["SYNC_MAX_BYTES"]
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """
+    Primeiro handler de upload: recusa um arquivo quando os primeiros bytes
+    não são de um tipo aceito, e interrompe a requisição quando um arquivo
+    passa de UPLOAD_LIMITS["MAX_BYTES"], antes que os handlers seguintes
+    guardem o restante em memória ou em disco.
+
+    Um arquivo recusado pelo tipo é descartado (SkipFile) e os demais campos
+    e arquivos da requisição continuam sendo lidos; a recusa fica em
+    request.rejected_files, uma lista de (campo, nome do arquivo, erro). No
+    limite de tamanho o restante da requisição é lido e descartado, para que
+    a view ainda possa responder; o motivo fica em request.upload_error.
+    """
+
+    def handle_raw_input(self, *args, **kwargs):
+        self.request.rejected_files = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.content_length is not None and self.content_length > settings.UPLOAD_LIMITS["MAX_BYTES"]:
+            self._stop(_size_error())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and sniff_type(raw_data) is None:
+            self.request.rejected_files.append(
+                (self.field_name, self.file_name, PreflightError("Tipo de arquivo não suportado.", status=415))
+            )
+            raise SkipFile()
+        if start + len(raw_data) > settings.UPLOAD_LIMITS["MAX_BYTES"]:
+            self._stop(_size_error())
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def _stop(self, error):
+        self.request.upload_error = error
+        raise StopUpload(connection_reset=False)
+
+
+def upload_error(request, field):
+    """
+    Motivo de um arquivo do campo `field` não estar em request.FILES: o
+    limite de tamanho da requisição ou a recusa do arquivo pelo tipo.
+
+    :return: PreflightError, ou None se nenhum arquivo do campo foi recusado.
+    """
+    error = getattr(request, "upload_error", None)
+    if error is not None:
+        return error
+    for rejected_field, _, error in getattr(request, "rejected_files", ()):
+        if rejected_field == field:
+            return error
+    return None
@@ -0,0 +1,179 @@
+import io
+import logging
+import time
+from functools import lru_cache
+
+from PIL import Image, ImageChops, ImageEnhance, ImageFilter, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_image(source):
+    """
+    Abre uma imagem a partir de um caminho, objeto de arquivo, bytes ou de uma
+    imagem PIL já aberta, sem gravar nada em disco.
+
+    :param source: Origem da imagem.
+    :return: Imagem PIL.
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+@lru_cache(maxsize=None)
+def _threshold_table(value):
+    """Tabela de 256 posições que binariza em `value` (acima vira branco)."""
+    return [255 if x > value else 0 for x in range(256)]
+
+
+def grayscale(image):
+    """Converte a imagem para escala de cinza."""
+    return ImageOps.grayscale(image)
+
+
+def sharpen(image):
+    """Aplica o filtro de nitidez do Pillow."""
+    return image.filter(ImageFilter.SHARPEN)
+
+
+def contrast(image, factor=2):
+    """Aumenta o contraste pelo fator informado."""
+    return ImageEnhance.Contrast(image).enhance(factor)
+
+
+def threshold(image, value=128):
+    """Binariza com limiar fixo, por tabela de consulta."""
+    return image.convert("L").point(_threshold_table(value), mode="1")
+
+
+def otsu_threshold_value(histogram):
+    """
+    Calcula o limiar de Otsu a partir do histograma de 256 posições.
+
+    :param histogram: Histograma de uma imagem em escala de cinza.
+    :return: Limiar que maximiza a variância entre as classes.
+    """
+    total = sum(histogram)
+    sum_total = sum(i * count for i, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best_value, best_variance = 0, -1
+    for value, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += value * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_total - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_value, best_variance = value, variance
+    return best_value
+
+
+def otsu(image):
+    """Binariza com o limiar de Otsu, calculado sobre o histograma da imagem."""
+    image = image.convert("L")
+    return image.point(_threshold_table(otsu_threshold_value(image.histogram())), mode="1")
+
+
+def adaptive(image, radius=15, offset=10):
+    """
+    Binariza comparando cada pixel com a média local da vizinhança.
+
+    A média vem de um BoxBlur e a comparação é feita com ImageChops e uma
+    tabela de consulta, sem percorrer os pixels em Python. Um pixel fica preto
+    quando é mais escuro que a média local por mais de `offset`.
+    """
+    image = image.convert("L")
+    mean = image.filter(ImageFilter.BoxBlur(radius))
+    difference = ImageChops.subtract(mean, image)
+    return difference.point([0 if x > offset else 255 for x in range(256)], mode="1")
+
+
+def scale(image, factor=None, min_dpi=300, target_dpi=300, min_size=1500, max_factor=3):
+    """
+    Amplia a imagem quando a resolução de origem é baixa.
+
+    Com `factor` a ampliação é fixa. Caso contrário usa o DPI gravado na imagem
+    (ampliando até target_dpi se estiver abaixo de min_dpi) ou, sem DPI, o
+    maior lado em pixels (ampliando até min_size). Imagens com resolução
+    suficiente passam sem alteração.
+    """
+    if factor is None:
+        dpi = image.info.get("dpi")
+        if dpi and dpi[0]:
+            factor = target_dpi / float(dpi[0]) if dpi[0] < min_dpi else 1
+        else:
+            longest = max(image.size)
+            factor = min_size / longest if longest < min_size else 1
+        factor = min(factor, max_factor)
+    if factor <= 1:
+        return image
+    size = (round(image.width * factor), round(image.height * factor))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+STAGES = {
+    "grayscale": grayscale,
+    "sharpen": sharpen,
+    "contrast": contrast,
+    "threshold": threshold,
+    "otsu": otsu,
+    "adaptive": adaptive,
+    "scale": scale,
+}
+
+
+# Pipelines padrão. "hard" e "legacy_soft" reproduzem preprocess_image_hard e
+# preprocess_image_soft; "soft" só amplia imagens de baixa resolução.
+PIPELINES = {
+    "hard": [("grayscale", {}), ("sharpen", {}), ("threshold", {"value": 128})],
+    "soft": [("grayscale", {}), ("scale", {}), ("contrast", {"factor": 2})],
+    "legacy_soft": [("grayscale", {}), ("scale", {"factor": 3}), ("contrast", {"factor": 2})],
+    "otsu": [("grayscale", {}), ("scale", {}), ("otsu", {})],
+    "adaptive": [("grayscale", {}), ("scale", {}), ("adaptive", {"radius": 15, "offset": 10})],
+    "none": [],
+}
+
+
+def run_pipeline(image, stages):
+    """
+    Aplica uma sequência de estágios a uma imagem, medindo cada um.
+
+    :param image: Imagem PIL.
+    :param stages: Lista de tuplas (nome do estágio, parâmetros).
+    :return: Tupla (imagem processada, lista de tuplas (estágio, segundos)).
+    """
+    timings = []
+    for name, params in stages:
+        start = time.perf_counter()
+        image = STAGES[name](image, **params)
+        timings.append((name, time.perf_counter() - start))
+    return image, timings
+
+
+def preprocess_image(image, mode, pipelines=None):
+    """
+    Pré-processa uma imagem com o pipeline nomeado e registra o tempo de cada
+    estágio no logger do módulo (nível DEBUG).
+
+    :param image: Imagem PIL.
+    :param mode: Nome do pipeline.
+    :param pipelines: Pipelines disponíveis; padrão PIPELINES.
+    :return: Tupla (imagem processada, lista de tuplas (estágio, segundos)).
+    """
+    pipelines = PIPELINES if pipelines is None else pipelines
+    if mode not in pipelines:
+        raise ValueError(f"Modo de pré-processamento desconhecido: {mode}")
+    image, timings = run_pipeline(image, pipelines[mode])
+    logger.debug(
+        "preprocess mode=%s %s", mode, " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings)
+    )
+    return image, timings
@@ -0,0 +1,178 @@
+import math
+
+from django.conf import settings
+from pdf2image import convert_from_path
+from pdfminer.pdftypes import PDFObjRef, resolve1
+
+from . import metrics
+from .concurrency import inner_workers
+from .utils import get_pdfinfo_as_dict, pdf_name
+
+# Diferença máxima de proporção para que uma imagem seja tratada como a
+# digitalização da página inteira.
+FULL_PAGE_ASPECT_TOLERANCE = 0.05
+
+
+def get_pdf_page_count(pdf_path):
+    """
+    Retorna o número de páginas de um PDF a partir da saída do `pdfinfo`.
+
+    :param pdf_path: Caminho para o arquivo PDF.
+    :return: Número de páginas.
+    """
+    pdf_info = get_pdfinfo_as_dict(pdf_path)
+    try:
+        return int(pdf_info["Pages"])
+    except (KeyError, ValueError):
+        raise RuntimeError("Não foi possível obter o número de páginas do PDF.")
+
+
+def language_dpi(lang):
+    """
+    DPI de rasterização para um conjunto de idiomas do Tesseract ("por+jpn"):
+    o maior entre os de settings.OCR_RASTER["LANGUAGE_DPI"], ou o DPI padrão.
+    """
+    config = settings.OCR_RASTER
+    return max(config["LANGUAGE_DPI"].get(code, config["DPI"]) for code in (lang or "").split("+"))
+
+
+def _iter_page_images(resources, visited):
+    """Dimensões (largura, altura) das imagens de um dicionário de recursos, incluindo Form XObjects."""
+    resources = resolve1(resources) or {}
+    for ref in (resolve1(resources.get("XObject")) or {}).values():
+        if isinstance(ref, PDFObjRef):
+            if ref.objid in visited:
+                continue
+            visited.add(ref.objid)
+        attrs = getattr(resolve1(ref), "attrs", {})
+        subtype = pdf_name(attrs.get("Subtype"))
+        if subtype == "Image":
+            yield resolve1(attrs.get("Width")) or 0, resolve1(attrs.get("Height")) or 0
+        elif subtype == "Form" and "Resources" in attrs:
+            yield from _iter_page_images(attrs["Resources"], visited)
+
+
+def scan_resolution(page):
+    """
+    Resolução da digitalização de uma página: o DPI da maior imagem com a
+    mesma proporção da página (em retrato ou paisagem), lido só do dicionário
+    de recursos, sem interpretar o conteúdo da página.
+
+    :param page: Página do pdfplumber.
+    :return: DPI, ou None se a página não tem uma imagem de página inteira.
+    """
+    width_in, height_in = float(page.width) / 72, float(page.height) / 72
+    if not width_in or not height_in:
+        return None
+    best = None
+    for width, height in _iter_page_images(page.page_obj.resources, set()):
+        if not width or not height:
+            continue
+        if abs(width / height - width_in / height_in) > FULL_PAGE_ASPECT_TOLERANCE * width_in / height_in:
+            width, height = height, width
+            if abs(width / height - width_in / height_in) > FULL_PAGE_ASPECT_TOLERANCE * width_in / height_in:
+                continue
+        dpi = min(width / width_in, height / height_in)
+        best = dpi if best is None else max(best, dpi)
+    return best
+
+
+def page_dpi(page, lang):
+    """
+    Escolhe o DPI de rasterização de uma página para o OCR.
+
+    Parte do DPI dos idiomas (language_dpi) e não passa da resolução da
+    digitalização, quando a página é uma imagem inteira: renderizar acima dela
+    só aumenta o custo do OCR. O resultado fica entre MIN_DPI e MAX_DPI, e
+    páginas grandes (plantas, pôsteres) são reduzidas para caber em
+    MAX_PIXELS.
+
+    :param page: Página do pdfplumber.
+    :param lang: Idiomas do Tesseract.
+    :return: DPI inteiro.
+    """
+    config = settings.OCR_RASTER
+    dpi = language_dpi(lang)
+    scanned = scan_resolution(page)
+    if scanned:
+        dpi = min(dpi, scanned)
+    dpi = min(max(dpi, config["MIN_DPI"]), config["MAX_DPI"])
+
+    area = float(page.width) * float(page.height) / (72 * 72)
+    if area and config["MAX_PIXELS"]:
+        dpi = min(dpi, math.sqrt(config["MAX_PIXELS"] / area))
+    return max(1, int(dpi))
+
+
+def get_page_dpis(pdf, lang, pages=None):
+    """
+    DPI de rasterização de cada página (page_dpi).
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :param pages: Números das páginas (1-based); padrão todas.
+    :return: Dicionário {página: DPI}.
+    """
+    if pages is None:
+        pages = range(1, len(pdf.pages) + 1)
+    return {page: page_dpi(pdf.pages[page - 1], lang) for page in pages}
+
+
+def _raster_runs(pages, dpi):
+    """Agrupa as páginas em sequências consecutivas com o mesmo DPI."""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][-1] + 1 and dpi.get(page) == dpi.get(runs[-1][-1]):
+            runs[-1].append(page)
+        else:
+            runs.append([page])
+    return runs
+
+
+def iter_page_windows(pdf_path, window, first_page=1, last_page=None, pages=None, dpi=None):
+    """
+    Rasteriza um PDF em janelas de páginas, uma janela por vez.
+
+    Cada janela é renderizada pelo poppler direto em memória, em escala de
+    cinza e sem compressão (PGM), com settings.OCR_RASTER["THREAD_COUNT"]
+    processos do pdftoppm. Nada é gravado em disco nem recodificado em JPEG,
+    e só as imagens da janela corrente ficam em memória, então o uso de
+    memória fica limitado ao tamanho da janela e não ao tamanho do documento.
+
+    :param pdf_path: Caminho para o arquivo PDF.
+    :param window: Número de páginas renderizadas por vez.
+    :param first_page: Primeira página (1-based).
+    :param last_page: Última página; padrão é a última do documento.
+    :param pages: Lista de páginas (1-based, crescente) no lugar do intervalo.
+    :param dpi: DPI de todas as páginas ou dicionário {página: DPI}
+        (get_page_dpis); padrão settings.OCR_RASTER["DPI"].
+    :return: Gerador de listas de tuplas (número da página, imagem PIL); o
+        DPI usado fica em image.info["dpi"].
+    """
+    if pages is None:
+        if last_page is None:
+            last_page = get_pdf_page_count(pdf_path)
+        pages = range(first_page, last_page + 1)
+    pages = list(pages)
+    window = max(1, window)
+    config = settings.OCR_RASTER
+    if not isinstance(dpi, dict):
+        dpi = dict.fromkeys(pages, dpi or config["DPI"])
+
+    for start in range(0, len(pages), window):
+        window_pages = pages[start:start + window]
+        images = []
+        for run in _raster_runs(window_pages, dpi):
+            run_dpi = dpi[run[0]]
+            with metrics.stage("rasterize"):
+                run_images = convert_from_path(
+                    pdf_path,
+                    dpi=run_dpi,
+                    first_page=run[0],
+                    last_page=run[-1],
+                    grayscale=config["GRAYSCALE"],
+                    thread_count=min(inner_workers(config["THREAD_COUNT"]), len(run)),
+                )
+            for image in run_images:
+                image.info["dpi"] = (run_dpi, run_dpi)
+            images += run_images
+        yield list(zip(window_pages, images))
@@ -0,0 +1,111 @@
+import math
+import statistics
+
+
+# Valores críticos da distribuição t de Student para 95% (bicaudal), por
+# graus de liberdade; acima de 120 usa a normal.
+T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+    10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+PAGE_MODES = ("all", "range", "sample")
+
+
+def _t_value(degrees):
+    if degrees > 120:
+        return 1.96
+    return T_95[max(key for key in T_95 if key <= degrees)]
+
+
+def parse_page_range(spec, total):
+    """
+    Interpreta um intervalo de páginas como "1-5, 8, 10-".
+
+    :param spec: Páginas e intervalos separados por vírgula; "N-" vai até o fim.
+    :param total: Número de páginas do documento.
+    :return: Lista ordenada de páginas (1-based), sem repetições.
+    :raises ValueError: Se o intervalo for inválido ou estiver fora do documento.
+    """
+    pages = set()
+    for part in (spec or "").replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                first, last = int(first or 1), int(last or total)
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"Intervalo de páginas inválido: {part}")
+        if first < 1 or last > total or first > last:
+            raise ValueError(f"Intervalo de páginas fora do documento ({total} páginas): {part}")
+        pages.update(range(first, last + 1))
+    if not pages:
+        raise ValueError("Nenhuma página selecionada.")
+    return sorted(pages)
+
+
+def sample_pages(total, size):
+    """
+    Escolhe `size` páginas igualmente espaçadas, no centro de cada faixa.
+
+    :return: Lista ordenada de páginas (1-based); todas se size >= total.
+    """
+    if size >= total:
+        return list(range(1, total + 1))
+    return [int((index + 0.5) * total / size) + 1 for index in range(size)]
+
+
+def select_pages(selection, total):
+    """
+    Resolve a seleção de páginas de uma requisição.
+
+    :param selection: {"mode": "all"|"range"|"sample", "range": str, "size": int}.
+    :param total: Número de páginas do documento.
+    :return: Lista de páginas (1-based), ou None para todas.
+    """
+    mode = selection.get("mode", "all")
+    if mode == "range":
+        return parse_page_range(selection.get("range"), total)
+    if mode == "sample":
+        return sample_pages(total, selection["size"])
+    if mode != "all":
+        raise ValueError(f"Modo de seleção de páginas desconhecido: {mode}")
+    return None
+
+
+def estimate_total(values, total):
+    """
+    Extrapola para o documento inteiro o total de uma contagem medida em uma
+    amostra de páginas, com intervalo de confiança de 95%.
+
+    Usa a média por página da amostra, o erro padrão com correção para
+    população finita e o valor crítico da distribuição t. O limite inferior
+    nunca fica abaixo do que já foi contado na amostra.
+
+    :param values: Contagem de cada página amostrada.
+    :param total: Número de páginas do documento.
+    :return: Dicionário {"estimate", "low", "high"}.
+    """
+    size = len(values)
+    observed = sum(values)
+    if size == 0:
+        return {"estimate": 0, "low": 0, "high": 0}
+    mean = observed / size
+    if size >= total or size == 1:
+        margin = 0 if size >= total else math.inf
+    else:
+        standard_error = statistics.stdev(values) / math.sqrt(size) * math.sqrt((total - size) / (total - 1))
+        margin = total * _t_value(size - 1) * standard_error
+
+    estimate = round(mean * total)
+    if math.isinf(margin):
+        # Uma página só não permite estimar a variância: sem limite superior
+        return {"estimate": estimate, "low": observed, "high": None}
+    return {
+        "estimate": estimate,
+        "low": max(observed, round(mean * total - margin)),
+        "high": round(mean * total + margin),
+    }
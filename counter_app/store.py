@@ -0,0 +1,147 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from . import metrics
+from .models import Extraction, PageCount
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    """True se o histórico de resultados estiver ligado em settings.RESULT_STORE."""
+    return settings.RESULT_STORE["ENABLED"]
+
+
+def lookup_key(cache_key):
+    """SHA-256 da chave do cache de resultados, de tamanho fixo para o índice."""
+    return hashlib.sha256(cache_key.encode()).hexdigest()
+
+
+def extraction_path(page_routes):
+    """Caminho de extração do documento ("text", "ocr" ou "hybrid") a partir dos caminhos das páginas."""
+    paths = {route["path"] for route in page_routes}
+    if len(paths) == 1:
+        return paths.pop()
+    return "hybrid" if paths else "ocr"
+
+
+def find_extraction(cache_key):
+    """
+    Procura a extração mais recente do mesmo arquivo com as mesmas opções.
+
+    Só lê a extração e as contagens por página (duas consultas, pelo índice
+    de lookup_key), sem passar pelo pdfplumber nem pelo OCR.
+
+    :param cache_key: Chave de make_cache_key.
+    :return: Dicionário com os campos de RESULT_FIELDS, page_routes e
+        page_counts, ou None se não houver extração gravada.
+    """
+    if not is_enabled() or not settings.RESULT_STORE["LOOKUP"]:
+        return None
+    try:
+        with metrics.stage("result_store"):
+            extraction = (
+                Extraction.objects.filter(lookup_key=lookup_key(cache_key)).order_by("-created_at").first()
+            )
+            if extraction is None:
+                return None
+            pages = list(extraction.pages.values("page", "path", "words", "chars", "chars_cleaned"))
+            text = extraction.text
+    except DatabaseError as e:
+        logger.warning("Erro consultando o histórico de resultados: %s", e)
+        return None
+
+    return {
+        "text_extracted": text,
+        "qt_pages": extraction.qt_pages,
+        "qt_images": extraction.qt_images,
+        "qt_words": extraction.qt_words,
+        "qt_char_extracted": extraction.qt_char_extracted,
+        "qt_char_cleaned": extraction.qt_char_cleaned,
+        "page_routes": [{"page": page["page"], "path": page["path"]} for page in pages],
+        "page_counts": [
+            {field: page[field] for field in ("page", "words", "chars", "chars_cleaned")} for page in pages
+        ],
+        "text_id": extraction.lookup_key,
+    }
+
+
+def find_text(text_id):
+    """
+    Texto da extração mais recente com o lookup_key informado.
+
+    :param text_id: lookup_key (text_id do resultado de cached_extract_file).
+    :return: Texto, ou None se não houver extração gravada.
+    """
+    if not is_enabled():
+        return None
+    try:
+        with metrics.stage("result_store"):
+            extraction = (
+                Extraction.objects.filter(lookup_key=text_id).only("text_zlib").order_by("-created_at").first()
+            )
+            return extraction.text if extraction is not None else None
+    except DatabaseError as e:
+        logger.warning("Erro consultando o histórico de resultados: %s", e)
+        return None
+
+
+def save_extraction(cache_key, digest, file, lang, preprocess, result, timings=None):
+    """
+    Grava uma extração completa e as contagens por página, estas com um
+    único bulk_create em lotes de RESULT_STORE["BATCH_SIZE"].
+
+    Falhas do banco (ex.: migrações não aplicadas) só são registradas, sem
+    interromper a requisição.
+
+    :param cache_key: Chave de make_cache_key.
+    :param digest: SHA-256 do conteúdo do arquivo.
+    :param file: Arquivo extraído (nome e tamanho).
+    :param result: Dicionário de extract_file.
+    :param timings: Tempos das etapas (metrics.Timings.as_dict), se coletados.
+    :return: A Extraction gravada, ou None.
+    """
+    if not is_enabled():
+        return None
+    path_by_page = {route["page"]: route["path"] for route in result["page_routes"]}
+    extraction = Extraction(
+        lookup_key=lookup_key(cache_key),
+        file_hash=digest,
+        file_name=file.name[:255],
+        file_size=file.size,
+        languages=lang,
+        preprocess=preprocess,
+        path=extraction_path(result["page_routes"]),
+        qt_pages=result["qt_pages"],
+        qt_images=result["qt_images"],
+        qt_words=result["qt_words"],
+        qt_char_extracted=result["qt_char_extracted"],
+        qt_char_cleaned=result["qt_char_cleaned"],
+        timings=(timings or {}).get("stages", {}),
+    )
+    extraction.text = result["text_extracted"]
+    try:
+        with metrics.stage("result_store"), transaction.atomic():
+            extraction.save()
+            PageCount.objects.bulk_create(
+                [
+                    PageCount(
+                        extraction=extraction,
+                        page=page["page"],
+                        path=path_by_page.get(page["page"], "ocr"),
+                        words=page["words"],
+                        chars=page["chars"],
+                        chars_cleaned=page["chars_cleaned"],
+                    )
+                    for page in result["page_counts"]
+                ],
+                batch_size=settings.RESULT_STORE["BATCH_SIZE"],
+            )
+    except DatabaseError as e:
+        logger.warning("Erro gravando o histórico de resultados: %s", e)
+        return None
+    return extraction
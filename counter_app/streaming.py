@@ -0,0 +1,149 @@
+import asyncio
+import json
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .concurrency import Overloaded, run_extraction
+from .jobs import JobCancelled
+
+
+def sse_event(event, data):
+    """Formata um evento server-sent events com dados em JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ExtractionStream:
+    """
+    Executa uma extração em segundo plano e entrega o progresso como eventos
+    server-sent events, à medida que cada página termina. A extração começa
+    com start (uma thread própria, servido por WSGI) ou start_limited (o
+    executor de concurrency.run_extraction, servido por ASGI).
+
+    Eventos: "page" ({"page", "total", "path", "words", "chars",
+    "chars_cleaned", "text"} e os totais acumulados em "totals"), "done" (o
+    resultado, sem o texto se ele já foi enviado página a página ou se pode
+    ser carregado depois por text_id) e "error" ({"message"}). Sem eventos por
+    HEARTBEAT segundos, envia um comentário para manter a conexão aberta.
+
+    Se o cliente desconecta, a extração é interrompida na página seguinte.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.totals = {"qt_pages": 0, "qt_words": 0, "qt_char_extracted": 0, "qt_char_cleaned": 0}
+        self.target = (func, args, kwargs)
+        self.thread = None
+        self.task = None
+
+    def start(self):
+        """Executa a extração em uma thread própria."""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def start_limited(self):
+        """
+        Agenda a extração com concurrency.run_extraction, que a limita às
+        vagas de ASYNC_COUNTER junto com as de counter_async. Chamar com o
+        event loop rodando, depois de concurrency.check_capacity.
+        """
+        self.task = asyncio.ensure_future(self._run_limited())
+        return self
+
+    async def _run_limited(self):
+        try:
+            await run_extraction(self._run)
+        except Overloaded as e:
+            # A fila encheu entre check_capacity e o agendamento
+            self.queue.put(("error", {"message": f"Erro: {e}"}))
+            self.queue.put(None)
+
+    def _run(self):
+        func, args, kwargs = self.target
+        if self.cancelled.is_set():
+            # Cliente desconectado enquanto esperava por uma vaga
+            self.queue.put(None)
+            return
+        try:
+            # Os tempos das etapas vão para o histórico de resultados e, com
+            # METRICS["DEBUG_PANEL"], para o evento "done"
+            with metrics.collect() as timings:
+                result = func(*args, progress=self._progress, **kwargs)
+            if settings.METRICS["DEBUG_PANEL"]:
+                result = {**result, "timings": timings.as_dict()}
+            self.queue.put(("done", result))
+        except JobCancelled:
+            pass
+        except Exception as e:
+            self.queue.put(("error", {"message": f"Erro: {e}"}))
+        finally:
+            connections.close_all()
+            self.queue.put(None)
+
+    def _progress(self, page, total):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        self.queue.put(("page", {**page, "total": total}))
+
+    def _format(self, item):
+        kind, data = item
+        if kind == "page":
+            self.totals["qt_pages"] += 1
+            self.totals["qt_words"] += data["word_count"]
+            self.totals["qt_char_extracted"] += data["chars"]
+            self.totals["qt_char_cleaned"] += data["chars_cleaned"]
+            data = {
+                **{field: data[field] for field in ("page", "total", "path", "words", "chars", "chars_cleaned")},
+                "text": data["text"],
+                "totals": dict(self.totals),
+            }
+        elif kind == "done":
+            data = {key: value for key, value in data.items() if key != "text_extracted"}
+            # Sem páginas enviadas (resultado em cache ou imagem), o texto vai
+            # junto, a menos que possa ser carregado por text_id
+            if not self.totals["qt_pages"] and not data["text_id"]:
+                data["text_extracted"] = item[1]["text_extracted"]
+        return sse_event(kind, data)
+
+    def next_chunk(self):
+        """
+        Próximo trecho da resposta: um evento, um comentário de keep-alive ou
+        None quando a extração terminou.
+        """
+        if self.finished:
+            return None
+        try:
+            item = self.queue.get(timeout=settings.STREAMING["HEARTBEAT"])
+        except queue.Empty:
+            return ": keep-alive\n\n"
+        if item is None:
+            self.finished = True
+            return None
+        return self._format(item)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        try:
+            while (chunk := self.next_chunk()) is not None:
+                yield chunk
+        finally:
+            self.cancel()
+
+    async def __aiter__(self):
+        try:
+            while (chunk := await sync_to_async(self.next_chunk, thread_sensitive=False)()) is not None:
+                yield chunk
+        finally:
+            self.cancel()
+            # Ainda esperando por uma vaga: sai da fila
+            if self.task is not None and not self.task.done():
+                self.task.cancel()
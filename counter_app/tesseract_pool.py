@@ -0,0 +1,219 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pytesseract
+from django.conf import settings
+
+from .concurrency import inner_workers
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolUnavailable(Exception):
+    """O pool não aceitou a tarefa ou não respondeu dentro do TIMEOUT."""
+
+
+# APIs do Tesseract de cada processo do pool, uma por conjunto de idiomas (e
+# modo de segmentação), criadas na primeira imagem de cada conjunto e
+# reaproveitadas.
+_apis = OrderedDict()
+_max_language_sets = 1
+
+
+def _init_worker(max_language_sets):
+    global _max_language_sets
+    _max_language_sets = max_language_sets
+
+
+def _get_api(lang, psm=None):
+    """
+    API do Tesseract com os modelos de `lang` carregados. Mantém no máximo
+    MAX_LANGUAGE_SETS conjuntos por processo, liberando o usado há mais tempo.
+    """
+    api = _apis.pop((lang, psm), None)
+    if api is None:
+        options = {"lang": lang}
+        if psm is not None:
+            options["psm"] = psm
+        tessdata = os.environ.get("TESSDATA_PREFIX")
+        if tessdata:
+            options["path"] = tessdata
+        api = tesserocr.PyTessBaseAPI(**options)
+    _apis[(lang, psm)] = api
+    while len(_apis) > _max_language_sets:
+        _, oldest = _apis.popitem(last=False)
+        oldest.End()
+    return api
+
+
+def _image_to_string(image, lang):
+    api = _get_api(lang)
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+
+def _image_to_osd(image):
+    api = _get_api("osd", tesserocr.PSM.OSD_ONLY)
+    api.SetImage(image)
+    osd = api.DetectOrientationScript()
+    if not osd:
+        return None
+    return {"script": osd["script_name"], "script_conf": osd["script_conf"]}
+
+
+def _ping():
+    return os.getpid()
+
+
+class TesseractPool:
+    """
+    Pool de processos de OCR que mantêm os modelos dos idiomas já carregados.
+    Um único pool de `processes` processos atende todos os conjuntos de
+    idiomas, então o total de processos não cresce com os idiomas pedidos. As
+    imagens chegam aos processos serializadas em memória, sem arquivos
+    temporários, e cada processo é reciclado após `max_tasks` imagens.
+    """
+
+    def __init__(self, processes, max_tasks, max_language_sets, timeout):
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.checked_at = time.monotonic()
+        self.pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(max_language_sets,), maxtasksperchild=max_tasks
+        )
+
+    def _apply(self, func, args):
+        """
+        :raises PoolUnavailable: Se o pool estiver fechado ou não responder a tempo.
+        :raises Exception: O erro do Tesseract com esta imagem, vindo do processo.
+        """
+        try:
+            result = self.pool.apply_async(func, args)
+        except ValueError as e:
+            raise PoolUnavailable(e)
+        try:
+            return result.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            raise PoolUnavailable(f"sem resposta em {self.timeout} s")
+
+    def image_to_string(self, image, lang):
+        return self._apply(_image_to_string, (image, lang))
+
+    def image_to_osd(self, image):
+        return self._apply(_image_to_osd, (image,))
+
+    def is_healthy(self, timeout=5):
+        """Verifica se um processo do pool responde dentro de `timeout` segundos."""
+        try:
+            self.pool.apply_async(_ping).get(timeout)
+        except Exception:
+            return False
+        self.checked_at = time.monotonic()
+        return True
+
+    def close(self):
+        self.pool.terminate()
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """True se o pool estiver ligado em settings.TESSERACT_POOL e o tesserocr instalado."""
+    return settings.TESSERACT_POOL["ENABLED"] and tesserocr is not None
+
+
+def get_pool():
+    """
+    Retorna o pool do processo, criando-o se preciso.
+
+    Recria o pool se ele falhar na verificação periódica de saúde ou se tiver
+    sido herdado de outro processo por fork.
+    """
+    global _pool
+    config = settings.TESSERACT_POOL
+    with _lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _pool = None
+        if _pool is not None and time.monotonic() - _pool.checked_at > config["HEALTH_CHECK_INTERVAL"]:
+            if not _pool.is_healthy():
+                logger.warning("Pool do Tesseract não respondeu, recriando.")
+                _pool.close()
+                _pool = None
+        if _pool is None:
+            _pool = TesseractPool(
+                inner_workers(config["PROCESSES"]), config["MAX_TASKS_PER_WORKER"], config["MAX_LANGUAGE_SETS"],
+                config["TIMEOUT"],
+            )
+        return _pool
+
+
+@atexit.register
+def discard_pool():
+    """Fecha e descarta o pool do processo."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None and pool.pid == os.getpid():
+        pool.close()
+
+
+def image_to_string(image, lang):
+    """
+    Extrai o texto de uma imagem PIL.
+
+    Usa o pool persistente quando habilitado; se ele não estiver disponível ou
+    falhar, recorre ao pytesseract, que executa o `tesseract` a cada chamada.
+    Só um pool fechado ou sem resposta é descartado: o erro de uma imagem (ou
+    de um idioma sem modelo) não derruba o pool usado pelas outras requisições.
+
+    :param image: Imagem PIL já pré-processada.
+    :param lang: Idiomas do Tesseract (ex.: "por+eng").
+    :return: Texto extraído.
+    """
+    if is_enabled():
+        try:
+            return get_pool().image_to_string(image, lang)
+        except PoolUnavailable as e:
+            logger.warning("Pool do Tesseract indisponível, descartando e usando pytesseract: %s", e)
+            discard_pool()
+        except Exception as e:
+            logger.warning("Erro no pool do Tesseract para %s, usando pytesseract: %s", lang, e)
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+def image_to_osd(image):
+    """
+    Detecta o script de uma imagem PIL com o OSD do Tesseract.
+
+    Usa o pool persistente quando habilitado, com o modelo osd carregado em
+    cada processo, como image_to_string; sem ele, recorre ao
+    pytesseract.image_to_osd, que executa o `tesseract` a cada chamada.
+
+    :param image: Imagem PIL da página.
+    :return: Dicionário com script e script_conf, ou None se o pool não
+        detectar o script (ex.: página com pouco texto).
+    :raises pytesseract.TesseractError: Se o OSD do pytesseract falhar.
+    """
+    if is_enabled():
+        try:
+            return get_pool().image_to_osd(image)
+        except PoolUnavailable as e:
+            logger.warning("Pool do Tesseract indisponível, descartando e usando pytesseract: %s", e)
+            discard_pool()
+        except Exception as e:
+            logger.warning("Erro no OSD do pool do Tesseract, usando pytesseract: %s", e)
+    osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+    return {"script": osd.get("script"), "script_conf": osd.get("script_conf")}
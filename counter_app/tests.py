@@ -1,3 +1,1205 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+import pdfplumber
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+from . import concurrency, jobs, langroute, store, tesseract_pool, textlayer
+from .benchmarks.corpus import PdfWriter, build_pdf
+from .bulk import ResultWriter, read_checkpoint
+from .cache import DiskResultCache, get_result_cache, pixels_hash
+from .counting import TextAccumulator, count_characters
+from .models import Extraction, PageCount
+from .pdf_images import decode_pdf_image
+from .preflight import PreflightError, preflight
+from .sampling import estimate_total
+from .utils import preprocess_image_hard, preprocess_image_soft, validate_pdf, validate_pdf_native
+from .raster import get_page_dpis, iter_page_windows, page_dpi
+from .views import (SharedUploadPath, cached_extract_file, counter_async, counter_stream_async, extract_file,
+                    extract_text_from_pdf_images, iter_ocr_pages, iter_pdf_text_pages, ocr_executor)
+
+
+NO_RESULT_CACHE = {"BACKEND": None, "LOCATION": None, "MAX_SIZE": 0, "ALIAS": "default", "TIMEOUT": None}
+
+
+def text_pdf(pages, kind="text", lang="por"):
+    """PDF sintético do corpus de benchmark, com `pages` páginas."""
+    return build_pdf(kind, lang, pages)[0]
+
+
+class EstimateTotalTests(SimpleTestCase):
+    def test_single_page_sample_has_no_upper_bound(self):
+        self.assertEqual(estimate_total([120], 50), {"estimate": 6000, "low": 120, "high": None})
+
+    def test_sample_covering_document_is_exact(self):
+        self.assertEqual(estimate_total([10, 20, 30], 3), {"estimate": 60, "low": 60, "high": 60})
+
+    def test_low_bound_is_at_least_observed(self):
+        result = estimate_total([10, 200, 15], 30)
+        self.assertGreaterEqual(result["low"], 225)
+        self.assertGreater(result["high"], result["estimate"])
+
+
+class NoResultCacheMixin:
+    """
+    Desliga o cache de resultados, cujo backend é criado uma vez por
+    processo, e o histórico no banco, que os processos dos pools não veem.
+    """
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(
+            RESULT_CACHE=NO_RESULT_CACHE, RESULT_STORE={**settings.RESULT_STORE, "ENABLED": False}
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        get_result_cache.cache_clear()
+        self.addCleanup(get_result_cache.cache_clear)
+
+
+def upload(name, content, content_type="application/pdf"):
+    return SimpleUploadedFile(name, content, content_type=content_type)
+
+
+class PageSamplingViewTests(NoResultCacheMixin, TestCase):
+    def test_sample_of_one_page(self):
+        response = self.client.post("/", {
+            "uploaded_file": upload("doc.pdf", text_pdf(5)), "languages": "por",
+            "page_mode": "sample", "sample_size": "1",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context.get("error"), response.context.get("message"))
+        self.assertIsNotNone(response.context["estimate"])
+
+
+class UploadRejectionTests(NoResultCacheMixin, TestCase):
+    def test_batch_rejects_only_the_unknown_file(self):
+        response = self.client.post("/batch/", {
+            "files": [upload("a.pdf", text_pdf(1)), upload("notes.txt", b"just some notes", "text/plain")],
+            "languages": "por",
+        })
+        self.assertEqual(response.status_code, 200)
+        files = {item["file_name"]: item for item in response.json()["files"]}
+        self.assertNotIn("error", files["a.pdf"])
+        self.assertGreater(files["a.pdf"]["qt_words"], 0)
+        self.assertIn("Tipo de arquivo não suportado", files["notes.txt"]["error"])
+        self.assertEqual(response.json()["total"]["failed"], 1)
+
+    def test_single_file_view_reports_rejection(self):
+        response = self.client.post("/jobs/", {"uploaded_file": upload("notes.txt", b"notes", "text/plain")})
+        self.assertEqual(response.status_code, 415)
+
+    @override_settings(UPLOAD_LIMITS={**settings.UPLOAD_LIMITS, "MAX_BYTES": 1024})
+    def test_oversized_file(self):
+        response = self.client.post("/jobs/", {"uploaded_file": upload("a.pdf", text_pdf(3))})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("Arquivo maior que o limite", response.json()["error"])
+
+    @override_settings(UPLOAD_LIMITS={**settings.UPLOAD_LIMITS, "MAX_PAGES": 2})
+    def test_too_many_pages(self):
+        response = self.client.post("/jobs/", {"uploaded_file": upload("a.pdf", text_pdf(3))})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("limite de 2 páginas", response.json()["error"])
+
+    @override_settings(UPLOAD_LIMITS={**settings.UPLOAD_LIMITS, "MAX_PAGES": 2})
+    def test_page_count_ignores_declared_count(self):
+        lying = text_pdf(3).replace(b"/Count 3", b"/Count 1")
+        with pdfplumber.open(io.BytesIO(lying)) as pdf:
+            self.assertEqual(len(pdf.pages), 3)
+        response = self.client.post("/jobs/", {"uploaded_file": upload("a.pdf", lying)})
+        self.assertEqual(response.status_code, 413)
+        with self.assertRaisesRegex(PreflightError, "limite de 2 páginas"):
+            extract_file(upload("a.pdf", lying), "por")
+
+
+class PreprocessValidationTests(NoResultCacheMixin, TestCase):
+    def test_rejects_unknown_mode(self):
+        for url, field in (("/batch/", "files"), ("/jobs/", "uploaded_file")):
+            with mock.patch("counter_app.views.submit_job") as submit:
+                response = self.client.post(url, {field: upload("a.pdf", text_pdf(1)), "preprocess": "nenhum"})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Modo de pré-processamento desconhecido", response.json()["error"])
+            submit.assert_not_called()
+
+    def test_batch_accepts_known_mode(self):
+        response = self.client.post("/batch/", {"files": upload("a.pdf", text_pdf(1)), "preprocess": "none"})
+        self.assertEqual(response.status_code, 200)
+
+
+class RequestLanguageTests(NoResultCacheMixin, TestCase):
+    def test_rejects_unknown_language(self):
+        for url, field in (("/", "uploaded_file"), ("/batch/", "files"), ("/jobs/", "uploaded_file")):
+            with mock.patch("counter_app.views.submit_job") as submit, \
+                    mock.patch("counter_app.views.cached_extract_file") as extract:
+                response = self.client.post(url, {field: upload("a.pdf", text_pdf(1)), "languages": ["por", "xyz"]})
+            submit.assert_not_called()
+            extract.assert_not_called()
+            if url == "/":
+                self.assertIn("Idioma desconhecido: xyz", response.context["message"])
+            else:
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("Idioma desconhecido: xyz", response.json()["error"])
+
+
+class CachedTextIdTests(TestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        override = override_settings(
+            RESULT_CACHE={**NO_RESULT_CACHE, "BACKEND": "disk", "LOCATION": location.name, "MAX_SIZE": 10 ** 8},
+            STREAMING={**settings.STREAMING, "INLINE_TEXT_MAX": 1000, "TEXT_PAGE_SIZE": 500},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        get_result_cache.cache_clear()
+        self.addCleanup(get_result_cache.cache_clear)
+        self.pdf = text_pdf(2)
+
+    def post(self, url="/"):
+        return self.client.post(url, {"uploaded_file": upload("doc.pdf", self.pdf), "languages": "por"})
+
+    def test_cache_hit_keeps_text_id(self):
+        first, second = self.post(), self.post()
+        self.assertFalse(first.context["from_cache"])
+        self.assertTrue(second.context["from_cache"])
+        for response in (first, second):
+            self.assertIsNotNone(response.context.get("text_id"))
+            self.assertLessEqual(len(response.context["text_extracted"]), 500)
+
+    def test_stream_cache_hit_does_not_inline_text(self):
+        self.post()
+        response = self.post("/stream/")
+        body = b"".join(response.streaming_content).decode()
+        done = json.loads(body.split("event: done\ndata: ", 1)[1].split("\n", 1)[0])
+        self.assertTrue(done["from_cache"])
+        self.assertIsNotNone(done["text_id"])
+        self.assertNotIn("text_extracted", done)
+
+
+class ResultStoreTests(TestCase):
+    def setUp(self):
+        override = override_settings(
+            RESULT_CACHE=NO_RESULT_CACHE, RESULT_STORE={**settings.RESULT_STORE, "ENABLED": True, "BATCH_SIZE": 2}
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        get_result_cache.cache_clear()
+        self.addCleanup(get_result_cache.cache_clear)
+        self.pdf = text_pdf(3)
+
+    def extract(self):
+        return cached_extract_file(upload("doc.pdf", self.pdf), "por")
+
+    def test_saves_extraction_and_page_counts(self):
+        result = self.extract()
+        extraction = Extraction.objects.get()
+        self.assertEqual(result["text_id"], extraction.lookup_key)
+        self.assertEqual((extraction.file_name, extraction.file_size), ("doc.pdf", len(self.pdf)))
+        self.assertEqual((extraction.languages, extraction.path), ("por", "text"))
+        for field in ("qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned"):
+            self.assertEqual(getattr(extraction, field), result[field], field)
+
+        pages = list(PageCount.objects.filter(extraction=extraction).order_by("page")
+                     .values("page", "words", "chars", "chars_cleaned"))
+        self.assertEqual(pages, result["page_counts"])
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(set(extraction.pages.values_list("path", flat=True)), {"text"})
+
+    def test_compressed_text_round_trips(self):
+        result = self.extract()
+        extraction = Extraction.objects.get()
+        self.assertLess(len(extraction.text_zlib), len(result["text_extracted"].encode()))
+        self.assertEqual(zlib.decompress(extraction.text_zlib).decode(), result["text_extracted"])
+        self.assertEqual(Extraction.objects.get().text, result["text_extracted"])
+        self.assertEqual(store.find_text(result["text_id"]), result["text_extracted"])
+
+        extraction.text = "ação e informação\n"
+        extraction.save()
+        self.assertEqual(Extraction.objects.get().text, "ação e informação\n")
+
+    def test_same_file_is_served_from_store(self):
+        first = self.extract()
+        with mock.patch("counter_app.views.extract_file") as extract:
+            second = self.extract()
+        extract.assert_not_called()
+        self.assertTrue(second["from_cache"])
+        for field in ("text_extracted", "qt_pages", "qt_words", "qt_char_cleaned", "page_counts", "text_id"):
+            self.assertEqual(second[field], first[field], field)
+        self.assertEqual(Extraction.objects.count(), 1)
+
+
+class ResultCacheKeyTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        override = override_settings(
+            RESULT_CACHE={**NO_RESULT_CACHE, "BACKEND": "disk", "LOCATION": location.name, "MAX_SIZE": 10 ** 8},
+            RESULT_STORE={**settings.RESULT_STORE, "ENABLED": False},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        get_result_cache.cache_clear()
+        self.addCleanup(get_result_cache.cache_clear)
+        self.pdf = text_pdf(1)
+
+    def from_cache(self, lang="por"):
+        return cached_extract_file(upload("doc.pdf", self.pdf), lang)["from_cache"]
+
+    def test_language_order_shares_entry(self):
+        self.assertFalse(self.from_cache("por+eng"))
+        self.assertTrue(self.from_cache("eng+por"))
+        self.assertFalse(self.from_cache("por"))
+
+    def test_extraction_settings_change_key(self):
+        self.assertFalse(self.from_cache())
+        changes = {
+            "TEXT_LAYER": {**settings.TEXT_LAYER, "ENGINE": "pdfplumber"},
+            "OCR_RASTER": {**settings.OCR_RASTER, "DPI": 300},
+            "PDF_PAGE_ROUTING": not settings.PDF_PAGE_ROUTING,
+            "PDF_VALIDATION_BACKEND": "subprocess",
+        }
+        for name, value in changes.items():
+            # Uma falta no cache chega ao extract_file
+            with self.subTest(name), self.settings(**{name: value}), \
+                    mock.patch("counter_app.views.extract_file", side_effect=RuntimeError("extraído")), \
+                    self.assertRaisesMessage(RuntimeError, "extraído"):
+                self.from_cache()
+        self.assertTrue(self.from_cache())
+
+
+class StreamLimiterTests(NoResultCacheMixin, TestCase):
+    def request(self):
+        return AsyncRequestFactory().post("/stream/", {
+            "uploaded_file": upload("doc.pdf", text_pdf(2)), "languages": "por",
+        })
+
+    async def test_stream_runs_through_extraction_limiter(self):
+        with mock.patch("counter_app.streaming.run_extraction", wraps=concurrency.run_extraction) as run:
+            response = await counter_stream_async(self.request())
+            body = "".join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("event: done", body)
+        run.assert_called_once()
+
+    @override_settings(ASYNC_COUNTER={**settings.ASYNC_COUNTER, "MAX_WAITING": 0})
+    async def test_stream_full_queue_returns_503(self):
+        with mock.patch("counter_app.concurrency._semaphore", asyncio.Semaphore(0)):
+            response = await counter_stream_async(self.request())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertIn("event: error", response.content.decode())
+
+
+class AsyncCounterTests(NoResultCacheMixin, TestCase):
+    async def test_preflight_runs_off_event_loop(self):
+        on_loop = []
+
+        def checked_preflight(file):
+            try:
+                on_loop.append(asyncio.get_running_loop() is not None)
+            except RuntimeError:
+                on_loop.append(False)
+            return preflight(file)
+
+        request = AsyncRequestFactory().post("/", {"uploaded_file": upload("doc.pdf", text_pdf(2)), "languages": "por"})
+        with mock.patch("counter_app.views.preflight", side_effect=checked_preflight):
+            response = await counter_async(request)
+        self.assertEqual(on_loop, [False])
+        self.assertEqual(response.status_code, 200)
+
+
+class FakeTessBaseAPI:
+    """
+    PyTessBaseAPI que devolve o idioma e o processo em vez de fazer OCR, e
+    script latino no OSD de imagens que não estão em branco.
+    """
+
+    def __init__(self, lang, path=None, psm=None):
+        if lang == "xyz":
+            raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+        self.lang = lang
+        self.psm = psm
+
+    def SetImage(self, image):
+        if self.lang == "slow":
+            time.sleep(2)
+        self.image = image
+
+    def GetUTF8Text(self):
+        return f"{self.lang} {os.getpid()}"
+
+    def DetectOrientationScript(self):
+        if (self.lang, self.psm) != ("osd", 0) or self.image.getextrema() == (255, 255):
+            return None
+        return {"orient_deg": 0, "orient_conf": 3.0, "script_name": "Latin", "script_conf": 7.5}
+
+    def End(self):
+        pass
+
+
+@override_settings(TESSERACT_POOL={**settings.TESSERACT_POOL, "ENABLED": True, "PROCESSES": 1})
+class TesseractPoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            tesseract_pool, "tesserocr", SimpleNamespace(PyTessBaseAPI=FakeTessBaseAPI, PSM=SimpleNamespace(OSD_ONLY=0))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(tesseract_pool.discard_pool)
+
+    def test_one_pool_serves_every_language_set(self):
+        image = Image.new("L", (8, 8))
+        results = [tesseract_pool.image_to_string(image, lang) for lang in ("por", "eng", "por+eng", "jpn", "por")]
+        self.assertEqual([text.split()[0] for text in results], ["por", "eng", "por+eng", "jpn", "por"])
+        self.assertEqual(len({text.split()[1] for text in results}), 1)
+        self.assertIs(tesseract_pool.get_pool(), tesseract_pool.get_pool())
+
+    @mock.patch("pytesseract.image_to_string", return_value="pytesseract")
+    def test_image_error_keeps_pool(self, image_to_string):
+        image = Image.new("L", (8, 8))
+        pool = tesseract_pool.get_pool()
+        self.assertEqual(tesseract_pool.image_to_string(image, "xyz"), "pytesseract")
+        self.assertIs(tesseract_pool.get_pool(), pool)
+        self.assertTrue(tesseract_pool.image_to_string(image, "por").startswith("por "))
+
+    @override_settings(TESSERACT_POOL={**settings.TESSERACT_POOL, "ENABLED": True, "PROCESSES": 1, "TIMEOUT": 0.2})
+    @mock.patch("pytesseract.image_to_string", return_value="pytesseract")
+    def test_timeout_discards_pool(self, image_to_string):
+        pool = tesseract_pool.get_pool()
+        self.assertEqual(tesseract_pool.image_to_string(Image.new("L", (8, 8)), "slow"), "pytesseract")
+        self.assertIsNot(tesseract_pool.get_pool(), pool)
+
+    @mock.patch("pytesseract.image_to_osd")
+    def test_script_detection_runs_in_pool(self, image_to_osd):
+        pool = tesseract_pool.get_pool()
+        self.assertEqual(langroute.detect_script(Image.new("L", (8, 8))), ("Latin", 7.5))
+        # Sem script detectado não há nova tentativa com o pytesseract
+        self.assertEqual(langroute.detect_script(Image.new("L", (8, 8), 255)), (None, 0))
+        image_to_osd.assert_not_called()
+        self.assertIs(tesseract_pool.get_pool(), pool)
+
+    @override_settings(TESSERACT_POOL={**settings.TESSERACT_POOL, "ENABLED": False})
+    @mock.patch("pytesseract.image_to_osd", return_value={"script": "Han", "script_conf": 4.25, "rotate": 0})
+    def test_script_detection_without_pool(self, image_to_osd):
+        self.assertEqual(langroute.detect_script(Image.new("L", (8, 8))), ("Han", 4.25))
+        image_to_osd.assert_called_once()
+
+
+class DiskResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.location = location.name
+
+    def entry_names(self):
+        return sorted(name for name in os.listdir(self.location) if name.endswith(".json"))
+
+    def test_set_does_not_scan_directory_below_limit(self):
+        cache = DiskResultCache(self.location, 10 ** 6)
+        cache.set("first", {"text": "x"})
+        with mock.patch("counter_app.cache.os.scandir", wraps=os.scandir) as scandir:
+            for i in range(20):
+                cache.set(f"key{i}", {"text": "x" * 100})
+        scandir.assert_not_called()
+        self.assertEqual(cache.get("key3"), {"text": "x" * 100})
+
+    def test_evicts_least_recently_used_over_limit(self):
+        value = {"text": "x" * 1000}
+        cache = DiskResultCache(self.location, 3500)
+        for key in ("a", "b", "c"):
+            cache.set(key, value)
+        os.utime(cache._path("a"), (0, 0))
+        os.utime(cache._path("b"), (1, 1))
+        cache.set("d", value)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("d"), value)
+        self.assertEqual(len(self.entry_names()), 3)
+        self.assertLessEqual(cache.size, 3500)
+
+    def test_overwrite_does_not_grow_size(self):
+        cache = DiskResultCache(self.location, 10 ** 6)
+        cache.set("a", {"text": "x" * 1000})
+        size = cache.size
+        cache.set("a", {"text": "y" * 1000})
+        self.assertEqual(cache.size, size)
+
+
+def exit_worker(*args):
+    """Substitui run_job: o processo do pool morre sem gravar o status."""
+    os._exit(1)
+
+
+class BrokenExecutor:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool()
+
+
+class JobTests(NoResultCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.location = location.name
+        override = override_settings(JOBS={**settings.JOBS, "LOCATION": self.location, "WORKERS": 1})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.shutdown_executor)
+
+    def shutdown_executor(self):
+        if jobs._executor is not None and jobs._executor is not jobs._broken:
+            jobs._executor.shutdown()
+        jobs._executor = jobs._broken = None
+
+    def submit(self, pages=2):
+        return self.client.post("/jobs/", {"uploaded_file": upload("doc.pdf", text_pdf(pages)), "languages": "por"})
+
+    def wait(self, job_id):
+        for _ in range(300):
+            status = jobs.get_job_status(job_id)
+            if status["status"] in jobs.FINISHED:
+                return status
+            time.sleep(0.1)
+        self.fail(f"Job {job_id} não terminou: {status}")
+
+    def test_broken_pool_is_recreated(self):
+        jobs._executor = BrokenExecutor()
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        status = self.wait(response.json()["job_id"])
+        self.assertEqual(status["status"], "done", status)
+        self.assertEqual([page["page"] for page in status["pages"]], [1, 2])
+
+    def test_pool_that_stays_broken_returns_503(self):
+        with mock.patch.object(jobs, "_get_executor", BrokenExecutor):
+            response = self.submit()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(os.listdir(self.location), [])
+
+    def test_worker_death_marks_job_failed(self):
+        with mock.patch.object(jobs, "run_job", exit_worker):
+            job_id = self.submit().json()["job_id"]
+            status = self.wait(job_id)
+        self.assertEqual(status["status"], "error")
+        self.assertEqual(self.wait(self.submit(1).json()["job_id"])["status"], "done")
+
+    def test_progress_writes_only_counters(self):
+        job_id = "progress"
+        upload_path = self.make_upload(job_id)
+
+        written = []
+        write_status = jobs._write_status
+        with mock.patch.object(jobs, "_write_status", lambda *args: written.append(json.dumps(args[1])) or
+                               write_status(*args)):
+            jobs.run_job(job_id, upload_path, "doc.pdf", "por")
+        written = [json.loads(status) for status in written]
+        progress = [status for status in written if status["status"] == "running"]
+        self.assertEqual([status["pages_done"] for status in progress], [0, 1, 2, 3])
+        self.assertTrue(all("pages" not in status for status in progress))
+        self.assertEqual(written[-1]["status"], "done")
+        self.assertEqual(len(written[-1]["pages"]), 3)
+
+    def make_upload(self, job_id, pages=3):
+        upload_path = os.path.join(self.location, job_id, "upload.pdf")
+        os.makedirs(os.path.dirname(upload_path))
+        with open(upload_path, "wb") as f:
+            f.write(text_pdf(pages))
+        jobs._write_status(job_id, {"job_id": job_id, "status": "queued", "pages_done": 0, "pages_total": None})
+        return upload_path
+
+    def test_cache_hit_reports_pages(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        with override_settings(RESULT_CACHE={**NO_RESULT_CACHE, "BACKEND": "disk", "LOCATION": location.name,
+                                             "MAX_SIZE": 10 ** 8}):
+            get_result_cache.cache_clear()
+            self.addCleanup(get_result_cache.cache_clear)
+            for job_id in ("first", "second"):
+                jobs.run_job(job_id, self.make_upload(job_id), "doc.pdf", "por")
+        first, second = jobs.get_job_status("first"), jobs.get_job_status("second")
+        self.assertTrue(second["result"]["from_cache"])
+        self.assertEqual((second["pages_done"], second["pages_total"]), (3, 3))
+        self.assertEqual(second["pages"], first["pages"])
+
+    def test_upload_is_written_outside_lock(self):
+        file = upload("doc.pdf", text_pdf(1))
+        chunks = file.chunks
+
+        def checked_chunks(*args, **kwargs):
+            self.assertFalse(jobs._lock.locked())
+            return chunks(*args, **kwargs)
+
+        with mock.patch.object(file, "chunks", checked_chunks):
+            job_id = jobs.submit_job(file, "por")
+        self.assertEqual(self.wait(job_id)["status"], "done")
+
+    def test_cleanup_removes_expired_jobs(self):
+        def make_job(job_id, status, finished_at=None):
+            os.makedirs(os.path.join(self.location, job_id))
+            jobs._write_status(job_id, {"job_id": job_id, "status": status, "finished_at": finished_at})
+
+        old = time.time() - settings.JOBS["TTL"] - 60
+        make_job("old-done", "done", old)
+        make_job("old-error", "error", old)
+        make_job("recent-done", "done", time.time())
+        make_job("running", "running")
+        self.assertEqual(jobs.cleanup_jobs(), 2)
+        self.assertEqual(sorted(os.listdir(self.location)), ["recent-done", "running"])
+
+
+class BreakingExecutor:
+    """ProcessPoolExecutor que executa `runs` arquivos na thread e depois quebra."""
+
+    runs = 1
+
+    def __init__(self, max_workers=None, **kwargs):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        if self.submitted >= self.runs:
+            raise BrokenProcessPool("processo encerrado")
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class CountFilesTests(NoResultCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.output = os.path.join(self.directory, "out", "results.jsonl")
+        os.makedirs(os.path.join(self.directory, "docs"))
+        for name in ("a.pdf", "b.pdf", "c.pdf"):
+            with open(os.path.join(self.directory, "docs", name), "wb") as f:
+                f.write(text_pdf(1))
+
+    def source(self, name):
+        return os.path.join(self.directory, "docs", name)
+
+    def test_checkpoint_skips_only_succeeded_files(self):
+        for fmt, path in (("jsonl", self.output), ("csv", self.output.replace(".jsonl", ".csv"))):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with ResultWriter(path, fmt) as writer:
+                writer.write({"source": self.source("a.pdf"), "file_name": "a.pdf", "qt_words": 10})
+                writer.write({"source": self.source("b.pdf"), "file_name": "b.pdf", "error": "Erro: falhou"})
+            self.assertEqual(read_checkpoint(path, fmt), {self.source("a.pdf")})
+
+    def test_broken_pool_keeps_checkpoint_and_resume_finishes(self):
+        with mock.patch("counter_app.bulk.ProcessPoolExecutor", BreakingExecutor), \
+                self.assertRaisesMessage(CommandError, "--resume"):
+            call_command("count_files", os.path.join(self.directory, "docs"), output=self.output, stdout=mock.Mock())
+        self.assertEqual(read_checkpoint(self.output, "jsonl"), {self.source("a.pdf")})
+
+        with mock.patch.object(BreakingExecutor, "runs", 10), \
+                mock.patch("counter_app.bulk.ProcessPoolExecutor", BreakingExecutor):
+            call_command("count_files", os.path.join(self.directory, "docs"), output=self.output, resume=True,
+                         stdout=mock.Mock())
+        self.assertEqual(read_checkpoint(self.output, "jsonl"), {
+            self.source(name) for name in ("a.pdf", "b.pdf", "c.pdf")
+        })
+
+
+def render_pages(pdf_path, dpi, first_page, last_page, **kwargs):
+    """convert_from_path sem o poppler: renderiza as páginas com o pdfplumber."""
+    with pdfplumber.open(pdf_path) as pdf:
+        return [
+            pdf.pages[number - 1].to_image(resolution=dpi).original.convert("L")
+            for number in range(first_page, last_page + 1)
+        ]
+
+
+def pdf_info(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return {"Pages": str(len(pdf.pages))}
+
+
+def fake_ocr(image, lang=None):
+    """Texto que depende dos pixels da página, para detectar páginas trocadas."""
+    digest = pixels_hash(image)
+    return f"pagina {digest[:8]} {lang}\nlinha {digest[8:16]} com palavras\n"
+
+
+class FakeRasterMixin(NoResultCacheMixin):
+    """
+    Rasteriza com o pdfplumber e troca o Tesseract por fake_ocr. As chamadas
+    ao poppler ficam em self.rendered, como (caminho, primeira, última página).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.rendered = []
+
+        def recording_render(pdf_path, dpi, first_page, last_page, **kwargs):
+            self.rendered.append((pdf_path, first_page, last_page))
+            return render_pages(pdf_path, dpi, first_page, last_page)
+
+        for target, replacement in (
+            ("counter_app.raster.convert_from_path", recording_render),
+            ("counter_app.raster.get_pdfinfo_as_dict", pdf_info),
+            ("pytesseract.image_to_string", fake_ocr),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ParallelOcrTests(FakeRasterMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        file = tempfile.NamedTemporaryFile(suffix=".pdf")
+        self.addCleanup(file.close)
+        file.write(text_pdf(5, kind="scanned"))
+        file.flush()
+        self.pdf_path = file.name
+
+    def extract(self, workers, window):
+        stats = {}
+        text, pages, images = extract_text_from_pdf_images(
+            self.pdf_path, "por", workers=workers, window=window, stats=stats, dpi=30
+        )
+        return text.text, text.qt_words, text.qt_char_cleaned, pages, images, stats["page_counts"]
+
+    def test_parallel_matches_serial(self):
+        serial = self.extract(workers=1, window=1)
+        self.assertEqual(serial[3], 5)
+        self.assertEqual(len(set(serial[0].split("\n"))), 10)
+        self.assertEqual(self.extract(workers=3, window=2), serial)
+
+    def test_scanned_pdf_does_not_run_pdfinfo(self):
+        with mock.patch("counter_app.raster.get_pdfinfo_as_dict") as pdfinfo:
+            result = extract_file(upload("doc.pdf", text_pdf(3, kind="scanned")), "por")
+        pdfinfo.assert_not_called()
+        self.assertEqual(result["qt_pages"], 3)
+        self.assertEqual({route["path"] for route in result["page_routes"]}, {"ocr"})
+
+    def test_routed_cache_key_follows_router_languages(self):
+        cache = {}
+        fake_cache = SimpleNamespace(get=cache.get, set=cache.__setitem__)
+        with mock.patch("counter_app.views.get_result_cache", return_value=fake_cache), \
+                mock.patch("counter_app.langroute.detect_script", return_value=("Latin", 10.0)):
+            pages = {}
+            for latin in (["eng"], ["por"], ["por"]):
+                with mock.patch("counter_app.langroute.LanguageRouter.state", return_value=latin):
+                    pages[latin[0]] = list(iter_ocr_pages(
+                        self.pdf_path, "eng+por", workers=1, last_page=1, dpi=30, language_routing=True
+                    ))[0]
+                    self.assertEqual(pages[latin[0]]["languages"], latin[0])
+        self.assertIn("por", pages["por"]["text"])
+        self.assertTrue(pages["por"]["from_cache"])
+        self.assertEqual(len(cache), 2)
+
+
+class PageWindowTests(FakeRasterMixin, SimpleTestCase):
+    def test_windows_are_rendered_lazily_in_order(self):
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as file:
+            file.write(text_pdf(5, kind="scanned"))
+            file.flush()
+            windows = iter_page_windows(file.name, 2, dpi=30)
+            first = next(windows)
+            self.assertEqual([page for page, _ in first], [1, 2])
+            self.assertEqual([(first_page, last_page) for _, first_page, last_page in self.rendered], [(1, 2)])
+            rest = [[page for page, _ in window] for window in windows]
+        self.assertEqual(rest, [[3, 4], [5]])
+        self.assertEqual([(first_page, last_page) for _, first_page, last_page in self.rendered],
+                         [(1, 2), (3, 4), (5, 5)])
+
+
+class PageCacheTests(FakeRasterMixin, SimpleTestCase):
+    def test_second_run_is_served_from_page_cache(self):
+        cache = {}
+        fake_cache = SimpleNamespace(get=cache.get, set=cache.__setitem__)
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as file, \
+                mock.patch("counter_app.views.get_result_cache", return_value=fake_cache), \
+                mock.patch("pytesseract.image_to_string", side_effect=fake_ocr) as ocr:
+            file.write(text_pdf(3, kind="scanned"))
+            file.flush()
+            first = list(iter_ocr_pages(file.name, "por", workers=1, window=2, dpi=30))
+            self.assertEqual(ocr.call_count, 3)
+            second = list(iter_ocr_pages(file.name, "por", workers=1, window=2, dpi=30))
+        self.assertEqual(ocr.call_count, 3)
+        self.assertEqual([page["from_cache"] for page in first], [False] * 3)
+        self.assertEqual([page["from_cache"] for page in second], [True] * 3)
+        self.assertEqual([page["text"] for page in second], [page["text"] for page in first])
+
+
+class HybridRoutingTests(FakeRasterMixin, SimpleTestCase):
+    def test_mixed_pdf_routes_each_page(self):
+        result = extract_file(upload("mixed.pdf", text_pdf(4, kind="mixed")), "por")
+        self.assertEqual([route["path"] for route in result["page_routes"]], ["text", "ocr", "text", "ocr"])
+        # Só as páginas escaneadas são rasterizadas
+        rendered = sorted(page for _, first_page, last_page in self.rendered
+                          for page in range(first_page, last_page + 1))
+        self.assertEqual(rendered, [2, 4])
+        self.assertEqual(result["text_extracted"].count("pagina "), 2)
+        self.assertEqual(result["qt_pages"], 4)
+
+
+class SharedUploadPathTests(FakeRasterMixin, SimpleTestCase):
+    def test_in_memory_upload_is_written_once_and_removed(self):
+        file = upload("doc.pdf", text_pdf(1))
+        with SharedUploadPath(file) as shared:
+            path = shared.path
+            self.assertEqual(shared.path, path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), text_pdf(1))
+        self.assertEqual(shared.writes, 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_upload_on_disk_is_used_in_place(self):
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as temp:
+            temp.write(text_pdf(1))
+            temp.flush()
+            file = mock.Mock(temporary_file_path=lambda: temp.name)
+            with SharedUploadPath(file) as shared:
+                self.assertEqual(shared.path, temp.name)
+            self.assertEqual(shared.writes, 0)
+            self.assertTrue(os.path.exists(temp.name))
+
+    @override_settings(OCR_PAGE_WINDOW=1)
+    def test_extraction_shares_one_copy(self):
+        extract_file(upload("doc.pdf", text_pdf(3, kind="scanned")), "por")
+        paths = {path for path, _, _ in self.rendered}
+        self.assertEqual(len(self.rendered), 3)
+        self.assertEqual(len(paths), 1)
+        self.assertFalse(os.path.exists(paths.pop()))
+
+
+def one_page_pdf(content, media_box=b"[0 0 612 792]", page_entries=b"", encoding=b"", xobjects=(), info=None,
+                 xmp=None):
+    """
+    PDF de uma página com a fonte Helvetica (/F1) e, opcionalmente, Form
+    XObjects ({nome: (BBox, Matrix, conteúdo)}) que também a usam, um
+    dicionário Info (entradas em bytes) e um pacote XMP no catálogo.
+    """
+    writer = PdfWriter()
+    font = writer.add(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+        b" /Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding %s >> >>" % encoding
+    )
+    resources = b"/Font << /F1 %d 0 R >>" % font
+    forms = [
+        b"/%s %d 0 R" % (name, writer.add_stream(
+            b"/Type /XObject /Subtype /Form /BBox %s /Matrix %s /Resources << %s >>" % (bbox, matrix, resources), data
+        ))
+        for name, (bbox, matrix, data) in dict(xobjects).items()
+    ]
+    if forms:
+        resources += b" /XObject << %s >>" % b" ".join(forms)
+    contents = writer.add_stream(b"", content)
+    pages_id = writer.reserve()
+    page = writer.add(
+        b"<< /Type /Page /Parent %d 0 R /MediaBox %s %s /Resources << %s >> /Contents %d 0 R >>"
+        % (pages_id, media_box, page_entries, resources, contents)
+    )
+    writer.add(b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page, pages_id)
+    catalog = b"/Type /Catalog /Pages %d 0 R" % pages_id
+    if xmp is not None:
+        catalog += b" /Metadata %d 0 R" % writer.add_stream(b"/Type /Metadata /Subtype /XML", xmp)
+    info_id = writer.add(b"<< %s >>" % info) if info is not None else None
+    return writer.write(writer.add(b"<< %s >>" % catalog), info_id)
+
+
+def xmp_packet(creator_tool=None, creators=()):
+    """Pacote XMP com xmp:CreatorTool e dc:creator."""
+    tool = f"<xmp:CreatorTool>{creator_tool}</xmp:CreatorTool>" if creator_tool else ""
+    items = "".join(f"<rdf:li>{creator}</rdf:li>" for creator in creators)
+    dc = f"<dc:creator><rdf:Seq>{items}</rdf:Seq></dc:creator>" if creators else ""
+    return (
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/"'
+        f' xmlns:dc="http://purl.org/dc/elements/1.1/">{tool}{dc}</rdf:Description></rdf:RDF></x:xmpmeta>'
+    ).encode()
+
+
+def fake_validation_tools(info, xmp):
+    """
+    subprocess.run com a saída do `pdffonts` e do `exiftool` para os PDFs de
+    one_page_pdf: o exiftool lista as tags do Info (grupo PDF) antes das do
+    XMP, com dc:creator também como "Creator" e os autores separados por vírgula.
+    """
+    lines = [f"{name:<32}: {value}" for name, value in info]
+    if xmp.get("creator_tool"):
+        lines.append(f"{'Creator Tool':<32}: {xmp['creator_tool']}")
+    if xmp.get("creators"):
+        lines.append(f"{'Creator':<32}: {', '.join(xmp['creators'])}")
+    outputs = {
+        "pdffonts": "name type encoding\n---\n" + f"{'Helvetica':<34}{'Type 1':<18}{'WinAnsi':<14} no no no 1 0",
+        "exiftool": "\n".join(lines),
+    }
+    return lambda command, **kwargs: SimpleNamespace(returncode=0, stdout=outputs[command[0]], stderr="")
+
+
+def baseline_preprocess_image_hard(image_path):
+    """preprocess_image_hard antes dos pipelines, com o limiar aplicado por lambda."""
+    image = Image.open(image_path)
+    sharpened_image = ImageOps.grayscale(image).filter(ImageFilter.SHARPEN)
+    return sharpened_image.point(lambda x: 255 if x > 128 else 0, mode='1')
+
+
+def baseline_preprocess_image_soft(image_path):
+    image = Image.open(image_path).convert("L")
+    return ImageEnhance.Contrast(
+        image.resize((image.width * 3, image.height * 3), Image.Resampling.LANCZOS)
+    ).enhance(2)
+
+
+class PreprocessingTests(SimpleTestCase):
+    def setUp(self):
+        # Gradiente com ruído, para que o limiar e a nitidez mudem pixels dos dois lados de 128
+        rng = random.Random(0)
+        image = Image.new("RGB", (97, 61))
+        image.putdata([
+            ((x * 5 + rng.randrange(60)) % 256, (y * 4 + rng.randrange(60)) % 256, rng.randrange(256))
+            for y in range(61) for x in range(97)
+        ])
+        self.png = io.BytesIO()
+        image.save(self.png, "PNG")
+
+    def assertSameImage(self, image, expected):
+        self.assertEqual((image.mode, image.size), (expected.mode, expected.size))
+        self.assertEqual(image.tobytes(), expected.tobytes())
+
+    def test_hard_is_bit_identical_to_baseline(self):
+        expected = baseline_preprocess_image_hard(io.BytesIO(self.png.getvalue()))
+        self.assertSameImage(preprocess_image_hard(io.BytesIO(self.png.getvalue())), expected)
+
+    def test_legacy_soft_is_bit_identical_to_baseline(self):
+        expected = baseline_preprocess_image_soft(io.BytesIO(self.png.getvalue()))
+        self.assertSameImage(preprocess_image_soft(io.BytesIO(self.png.getvalue())), expected)
+
+
+def image_pdf(*images, media_box=b"[0 0 612 792]"):
+    """
+    PDF de uma página que desenha as imagens dadas, cada uma como
+    (entradas do dicionário, dados do stream), em Image XObjects.
+    """
+    writer = PdfWriter()
+    names = [b"/Im%d %d 0 R" % (i, writer.add_stream(b"/Type /XObject /Subtype /Image " + entries, data))
+             for i, (entries, data) in enumerate(images)]
+    content = b" ".join(b"q 100 0 0 100 %d 500 cm /Im%d Do Q" % (50 + 110 * i, i) for i in range(len(images)))
+    contents = writer.add_stream(b"", content)
+    pages_id = writer.reserve()
+    page = writer.add(
+        b"<< /Type /Page /Parent %d 0 R /MediaBox %s /Resources << /XObject << %s >> >>"
+        b" /Contents %d 0 R >>" % (pages_id, media_box, b" ".join(names), contents)
+    )
+    writer.add(b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page, pages_id)
+    return writer.write(writer.add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id))
+
+
+def flate_image(mode_entries, size, pixels, extra=b""):
+    """Entradas e dados de uma imagem Flate com os bytes crus `pixels`."""
+    width, height = size
+    return (b"/Width %d /Height %d %s /Filter /FlateDecode %s" % (width, height, mode_entries, extra),
+            zlib.compress(pixels))
+
+
+class PdfImageDecodingTests(NoResultCacheMixin, SimpleTestCase):
+    GRAY = b"/ColorSpace /DeviceGray /BitsPerComponent 8"
+
+    def decode(self, *images):
+        with pdfplumber.open(io.BytesIO(image_pdf(*images))) as pdf:
+            return [decode_pdf_image(image) for image in pdf.pages[0].images]
+
+    def test_flate_rgb(self):
+        pixels = bytes(range(36))
+        [image] = self.decode(flate_image(b"/ColorSpace /DeviceRGB /BitsPerComponent 8", (4, 3), pixels))
+        self.assertEqual((image.mode, image.size, image.tobytes()), ("RGB", (4, 3), pixels))
+
+    def test_dct(self):
+        source = Image.linear_gradient("L").resize((32, 16))
+        jpeg = io.BytesIO()
+        source.save(jpeg, "JPEG")
+        [image] = self.decode((b"/Width 32 /Height 16 %s /Filter /DCTDecode" % self.GRAY, jpeg.getvalue()))
+        self.assertEqual(image.tobytes(), Image.open(io.BytesIO(jpeg.getvalue())).tobytes())
+
+    def test_decode_array_inverts_gray(self):
+        pixels = bytes([0, 10, 200, 255])
+        [image] = self.decode(flate_image(self.GRAY, (2, 2), pixels, b"/Decode [1 0]"))
+        self.assertEqual(image.tobytes(), bytes([255, 245, 55, 0]))
+
+    def test_decode_array_inverts_bilevel(self):
+        rows = bytes([0b10100000, 0b01000000])
+        [plain, inverted] = self.decode(
+            flate_image(b"/ColorSpace /DeviceGray /BitsPerComponent 1", (3, 2), rows),
+            flate_image(b"/ColorSpace /DeviceGray /BitsPerComponent 1", (3, 2), rows, b"/Decode [1 0]"),
+        )
+        self.assertEqual(list(plain.convert("L").getdata()), [255, 0, 255, 0, 255, 0])
+        self.assertEqual(list(inverted.convert("L").getdata()), [0, 255, 0, 255, 0, 255])
+
+    def test_one_bit_indexed_palette(self):
+        # Paleta invertida: índice 0 é branco, 1 é preto
+        entries = b"/ColorSpace [/Indexed /DeviceRGB 1 <FFFFFF000000>] /BitsPerComponent 1"
+        [image] = self.decode(flate_image(entries, (3, 2), bytes([0b10100000, 0b01000000])))
+        self.assertEqual(list(image.convert("L").getdata()), [0, 255, 0, 255, 0, 255])
+
+    @override_settings(EMBEDDED_IMAGE_MIN_PIXELS=100)
+    def test_duplicate_and_tiny_images(self):
+        text = flate_image(self.GRAY, (20, 20), bytes(range(200)) * 2)
+        tiny = flate_image(self.GRAY, (5, 5), bytes(25))
+        stats = {}
+        with pdfplumber.open(io.BytesIO(image_pdf(text, text, tiny))) as pdf, \
+                mock.patch("counter_app.views.process_image", return_value=("imagem ", 1)) as ocr:
+            [page] = iter_pdf_text_pages(pdf, "por", stats=stats)
+        ocr.assert_called_once()
+        self.assertEqual(ocr.call_args.args[0].size, (20, 20))
+        self.assertEqual((page["qt_images"], page["word_count"]), (2, 2))
+        self.assertEqual((stats["embedded_images_deduped"], stats["embedded_images_skipped"]), (1, 1))
+
+
+class PageDpiTests(SimpleTestCase):
+    def page_dpi(self, lang="por", media_box=b"[0 0 612 792]", scan=None):
+        """page_dpi da página de um PDF com uma imagem `scan` (largura, altura) ocupando a página inteira."""
+        images = [(b"/Width %d /Height %d /ColorSpace /DeviceGray /BitsPerComponent 8" % scan, b"")] if scan else []
+        with pdfplumber.open(io.BytesIO(image_pdf(*images, media_box=media_box))) as pdf:
+            return page_dpi(pdf.pages[0], lang)
+
+    def test_language_dpi(self):
+        self.assertEqual(self.page_dpi("por"), 200)
+        self.assertEqual(self.page_dpi("por+jpn"), 400)
+
+    @override_settings(OCR_RASTER={**settings.OCR_RASTER, "MAX_DPI": 300})
+    def test_clamped_to_max_dpi(self):
+        self.assertEqual(self.page_dpi("jpn"), 300)
+
+    def test_never_above_scan_resolution(self):
+        self.assertEqual(self.page_dpi(scan=(1530, 1980)), 180)
+        # Digitalização em paisagem de uma página em retrato
+        self.assertEqual(self.page_dpi(scan=(1980, 1530)), 180)
+        self.assertEqual(self.page_dpi(scan=(2550, 3300)), 200)
+
+    def test_low_resolution_scan_is_raised_to_min_dpi(self):
+        self.assertEqual(self.page_dpi(scan=(850, 1100)), 150)
+
+    def test_large_page_fits_max_pixels(self):
+        # A0 (841 x 1189 mm): a 150 DPI teria 34,8 milhões de pixels
+        media_box = b"[0 0 2384 3370]"
+        dpi = self.page_dpi(media_box=media_box)
+        self.assertLess(dpi, settings.OCR_RASTER["MIN_DPI"])
+        self.assertLessEqual((2384 / 72 * dpi) * (3370 / 72 * dpi), settings.OCR_RASTER["MAX_PIXELS"])
+        self.assertGreater((2384 / 72 * (dpi + 1)) * (3370 / 72 * (dpi + 1)), settings.OCR_RASTER["MAX_PIXELS"])
+        with self.settings(OCR_RASTER={**settings.OCR_RASTER, "MAX_PIXELS": 0}):
+            self.assertEqual(self.page_dpi(media_box=media_box), 200)
+
+    def test_get_page_dpis(self):
+        with pdfplumber.open(io.BytesIO(text_pdf(3))) as pdf:
+            self.assertEqual(get_page_dpis(pdf, "kor"), {1: 400, 2: 400, 3: 400})
+            self.assertEqual(get_page_dpis(pdf, "por", pages=[2]), {2: 200})
+
+
+class TextAccumulatorTests(SimpleTestCase):
+    PAGES = [
+        "Primeira página\ncom  dois espaços\te tab\n",
+        "",
+        "\r\nlinha Windows\r\n\n\n",
+        "   ",
+        "sem quebra final",
+        "não\u00a0separável e acentuação: ção\n",
+        "\t\t",
+    ]
+
+    def test_counts_match_join_then_count(self):
+        text = TextAccumulator()
+        for number, page in enumerate(self.PAGES, start=1):
+            text.add(page, len(page.split()))
+            # Contagem de antes: junta as páginas e remove quebras, tabulações e espaços
+            joined = "".join(self.PAGES[:number])
+            cleaned = joined.replace("\n", "").replace("\r", "").replace("\t", "").replace(" ", "")
+            self.assertEqual(text.text, joined)
+            self.assertEqual((text.qt_char_extracted, text.qt_char_cleaned), (len(joined), len(cleaned)))
+            self.assertEqual(count_characters(joined), (len(joined), len(cleaned)))
+        self.assertEqual(text.qt_words, sum(len(page.split()) for page in self.PAGES))
+
+
+class ValidationParityTests(SimpleTestCase):
+    CASES = {
+        "info": ([("Creator", "inss"), ("Author", "inss")], {"creator_tool": "PDF24 Creator"}, False),
+        "xmp": ([("Author", "inss")], {"creator_tool": "PDF24 Creator", "creators": ["inss"]}, False),
+        "xmp_wins": (
+            [("Creator", "inss"), ("Author", "inss")], {"creator_tool": "PDF24 Creator", "creators": ["Fulano"]}, True
+        ),
+        "xmp_wins_scanned": (
+            [("Creator", "Fulano"), ("Author", "inss")], {"creator_tool": "PDF24 Creator", "creators": ["inss"]}, False
+        ),
+        "several_creators": (
+            [("Author", "inss")], {"creator_tool": "PDF24 Creator", "creators": ["inss", "outro"]}, True
+        ),
+    }
+
+    def test_native_matches_exiftool(self):
+        for name, (info, xmp, valid) in self.CASES.items():
+            with self.subTest(name), tempfile.NamedTemporaryFile(suffix=".pdf") as file:
+                file.write(one_page_pdf(
+                    b"BT /F1 10 Tf 50 700 Td (Texto) Tj ET",
+                    info=b" ".join(b"/%s (%s)" % (key.encode(), value.encode()) for key, value in info),
+                    xmp=xmp_packet(xmp.get("creator_tool"), xmp.get("creators", ())),
+                ))
+                file.flush()
+                with pdfplumber.open(file.name) as pdf:
+                    native = validate_pdf_native(pdf)
+                if shutil.which("exiftool") and shutil.which("pdffonts"):
+                    subprocess_path = validate_pdf(file.name)
+                else:
+                    with mock.patch("counter_app.utils.subprocess.run", fake_validation_tools(info, xmp)):
+                        subprocess_path = validate_pdf(file.name)
+                self.assertEqual((native, subprocess_path), (valid, valid))
+
+
+class TextLayerEngineTests(SimpleTestCase):
+    def assertEnginesMatch(self, data, expected_words):
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            self.assertEqual(textlayer.compare_engines(pdf), [])
+            words = [text for text, _ in textlayer.page_words(textlayer.read_page(pdf, pdf.pages[0])[0])]
+        self.assertEqual(words, expected_words)
+
+    def test_rotated_text(self):
+        self.assertEnginesMatch(one_page_pdf(
+            b"BT /F1 10 Tf 1 0 0 1 50 700 Tm (Upright words) Tj ET"
+            b" BT /F1 10 Tf 0 1 -1 0 100 300 Tm (Rotated up) Tj ET"
+            b" BT /F1 10 Tf 0 -1 1 0 300 600 Tm (Rotated down) Tj ET",
+            page_entries=b"/Rotate 90",
+        ), ["Upright", "words", "Rotated", "up", "nwod", "detatoR"])
+
+    def test_form_xobject(self):
+        self.assertEnginesMatch(one_page_pdf(
+            b"BT /F1 10 Tf 1 0 0 1 50 700 Tm (Page text) Tj ET q 1 0 0 1 100 100 cm /X1 Do Q /X1 Do",
+            xobjects={b"X1": (b"[0 0 300 300]", b"[1 0 0 1 20 30]", b"BT /F1 12 Tf 10 200 Td (Form text) Tj ET")},
+        ), ["Page", "text", "Form", "text", "Form", "text"])
+
+    def test_media_box_with_non_zero_origin(self):
+        self.assertEnginesMatch(one_page_pdf(
+            b"BT /F1 10 Tf 1 0 0 1 120 730 Tm (Shifted origin) Tj ET"
+            b" BT /F1 10 Tf 1 0 0 1 120 500 Tm (Lower line) Tj ET",
+            media_box=b"[100 50 712 842]",
+        ), ["Shifted", "origin", "Lower", "line"])
+
+    def test_ligatures(self):
+        self.assertEnginesMatch(one_page_pdf(
+            b"BT /F1 10 Tf 1 0 0 1 50 700 Tm (\\200nal o\\201ce \\202ow) Tj ET",
+            encoding=b"/Differences [128 /fi /ffi /fl]",
+        ), ["final", "office", "flow"])
+
+
+class BenchLineFiltersTests(SimpleTestCase):
+    def test_reports_both_implementations(self):
+        for signature_lines in (False, True):
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command("bench_linefilters", lines=500, repeat=1, remove_signature_lines=signature_lines,
+                         stdout=stdout, stderr=stderr)
+            output = stdout.getvalue()
+            self.assertEqual(stderr.getvalue(), "")
+            self.assertRegex(output, r"anterior: [\d.]+ ms")
+            self.assertRegex(output, r"atual: [\d.]+ ms")
+            self.assertIn("500 linhas", output)
+            self.assertIn("resultados idênticos", output)
+
+
+class BenchPipelineTests(SimpleTestCase):
+    def test_measures_stages_and_compares_baseline(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        options = {"corpus": os.path.join(directory, "corpus"), "kinds": "text", "pages": "2", "langs": "por",
+                   "stages": "validate_pdf_native,process_pdf", "repeat": 1}
+        baseline = os.path.join(directory, "baseline.json")
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("bench_pipeline", output=baseline, stdout=stdout, stderr=stderr, **options)
+        self.assertEqual(stderr.getvalue(), "")
+        self.assertIn("Resultados gravados em", stdout.getvalue())
+
+        with open(baseline, encoding="utf-8") as f:
+            results = json.load(f)
+        self.assertEqual(results["text_layer_differences"], [])
+        self.assertEqual({row["stage"] for row in results["results"]}, {"validate_pdf_native", "process_pdf"})
+        for row in results["results"]:
+            self.assertNotIn("error", row)
+            self.assertEqual(len(row["runs"]), 1)
+        process_pdf = next(row for row in results["results"] if row["stage"] == "process_pdf")
+        self.assertEqual(process_pdf["output"]["qt_pages"], 2)
+        self.assertEqual(process_pdf["output"]["qt_words"], process_pdf["expected_words"])
+
+        stdout = io.StringIO()
+        call_command("bench_pipeline", output=os.path.join(directory, "latest.json"), baseline=baseline,
+                     threshold=1000, fail_on_regression=True, stdout=stdout, stderr=stderr, **options)
+        self.assertEqual(stderr.getvalue(), "")
+        self.assertRegex(stdout.getvalue(), r"process_pdf\s+tempo\s+[\d.]+x memória\s+[\d.]+x\n")
+
+    def test_rejects_unknown_stage(self):
+        with self.assertRaisesMessage(CommandError, "Etapa desconhecido: ocr"):
+            call_command("bench_pipeline", stages="ocr", stdout=io.StringIO())
+
+
+def inner_parallelism():
+    """Executado em um processo do pool: OCR serial? e processos da camada de texto."""
+    with ocr_executor(8) as executor:
+        return executor is None, concurrency.inner_workers(8)
+
+
+class WorkerBudgetTests(SimpleTestCase):
+    def test_file_pool_runs_inner_levels_serially_when_it_uses_every_core(self):
+        with ProcessPoolExecutor(**concurrency.file_pool_options(os.cpu_count() or 1)) as executor:
+            self.assertEqual(executor.submit(inner_parallelism).result(), (True, 1))
+
+    @mock.patch("counter_app.concurrency.os.cpu_count", return_value=8)
+    def test_file_pool_divides_cores(self, cpu_count):
+        self.assertEqual(concurrency.file_pool_options(2)["initargs"], (4,))
+        self.assertEqual(concurrency.file_pool_options(16)["initargs"], (1,))
+
+    def test_no_limit_outside_file_pools(self):
+        self.assertEqual(concurrency.inner_workers(8), 8)
+
+
+@override_settings(METRICS={**settings.METRICS, "ENABLED": True, "ALLOWED_IPS": ["10.0.0.1"], "TOKEN": "segredo"})
+class MetricsAccessTests(SimpleTestCase):
+    def test_allowed_ip(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+    def test_token(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.2", headers={"Authorization": "Bearer segredo"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_rejects_other_clients(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.2").status_code, 403)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.2", headers={"Authorization": "Bearer outro"})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS={**settings.METRICS, "ALLOWED_IPS": [], "TOKEN": ""})
+    def test_empty_token_never_matches(self):
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer "})
+        self.assertEqual(response.status_code, 403)
+
+
+class TimingLogTests(SimpleTestCase):
+    def test_off_by_default(self):
+        self.assertFalse(settings.METRICS["TIMING_LOG"])
+        with self.assertNoLogs("counter_app.metrics", "INFO"):
+            self.client.get("/")
+
+    @override_settings(METRICS={**settings.METRICS, "TIMING_LOG": True})
+    def test_one_json_line_per_request(self):
+        with self.assertLogs("counter_app.metrics", "INFO") as logs:
+            self.client.get("/")
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(json.loads(logs.records[0].getMessage())["view"], "counter")
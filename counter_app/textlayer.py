@@ -0,0 +1,325 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+
+import pdfplumber
+from django.conf import settings
+from pdfminer.pdfdevice import PDFTextDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFPageInterpreter
+from pdfminer.utils import apply_matrix_rect
+from pdfplumber.utils import resolve_all
+
+from . import metrics
+from .concurrency import inner_workers
+
+
+ENGINES = ("fast", "pdfplumber")
+
+# Tolerâncias padrão do page.extract_words() do pdfplumber.
+X_TOLERANCE = 3
+Y_TOLERANCE = 3
+
+# Ligaduras expandidas pelo extract_words (expand_ligatures=True).
+LIGATURES = {
+    "ﬀ": "ff",
+    "ﬃ": "ffi",
+    "ﬄ": "ffl",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬆ": "st",
+    "ﬅ": "st",
+}
+
+# Campos das tuplas de caractere de PageReader.chars.
+TEXT, X0, X1, TOP, BOTTOM, UPRIGHT = range(6)
+
+
+def get_engine():
+    """Engine de extração da camada de texto em settings.TEXT_LAYER["ENGINE"]."""
+    engine = settings.TEXT_LAYER["ENGINE"]
+    if engine not in ENGINES:
+        raise ValueError(f"Engine de camada de texto desconhecida: {engine}")
+    return engine
+
+
+class PageReader(PDFTextDevice):
+    """
+    Device do pdfminer que só guarda o necessário para contar palavras: uma
+    tupla (texto, x0, x1, top, bottom, upright) por caractere, nas mesmas
+    coordenadas dos caracteres do pdfplumber, e as imagens da página.
+
+    Não cria LTChar, LTFigure, linhas ou curvas, nem os dicionários de
+    page.chars, e ignora os caminhos (paint_path) por completo.
+
+    :param page: Página do pdfplumber (altura e MediaBox das coordenadas).
+    :param chars: Guarda os caracteres.
+    :param images: Guarda as imagens, com as chaves de page.images usadas
+        em pdf_images (stream, srcsize, bits, colorspace, imagemask).
+    """
+
+    def __init__(self, rsrcmgr, page, chars=True, images=True):
+        super().__init__(rsrcmgr)
+        self.height = page.height
+        self.mb_x0, self.mb_top = page.mediabox[:2]
+        self.collect_chars = chars
+        self.collect_images = images
+        self.chars = []
+        self.images = []
+
+    def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate):
+        # Mesma geometria de pdfminer.layout.LTChar e de Page.process_object
+        adv = font.char_width(cid) * fontsize * scaling
+        if not self.collect_chars:
+            return adv
+        try:
+            text = font.to_unichr(cid)
+        except PDFUnicodeNotDefined:
+            text = f"(cid:{cid})"
+        if font.is_vertical():
+            vx, vy = font.char_disp(cid)
+            vx = fontsize * 0.5 if vx is None else vx * fontsize * 0.001
+            vy = (1000 - vy) * fontsize * 0.001
+            bbox = (-vx, vy + rise + adv, -vx + fontsize, vy + rise)
+        else:
+            descent = font.get_descent() * fontsize
+            bbox = (0, descent + rise, adv, descent + rise + fontsize)
+        a, b, c, d, _, _ = matrix
+        x0, y0, x1, y1 = apply_matrix_rect(matrix, bbox)
+        if x1 < x0:
+            x0, x1 = x1, x0
+        if y1 < y0:
+            y0, y1 = y1, y0
+        if self.mb_x0 != 0:
+            x0, x1 = x0 + self.mb_x0, x1 + self.mb_x0
+        self.chars.append((
+            text, x0, x1, (self.height - y1) + self.mb_top, (self.height - y0) + self.mb_top,
+            a * d * scaling > 0 and b * c <= 0,
+        ))
+        return adv
+
+    def render_image(self, name, stream):
+        if not self.collect_images:
+            return
+        colorspace = resolve_all(stream.get_any(("CS", "ColorSpace")))
+        self.images.append({
+            "name": name,
+            "stream": stream,
+            "srcsize": resolve_all((stream.get_any(("W", "Width")), stream.get_any(("H", "Height")))),
+            "imagemask": resolve_all(stream.get_any(("IM", "ImageMask"))),
+            "bits": resolve_all(stream.get_any(("BPC", "BitsPerComponent"), 1)),
+            "colorspace": colorspace if isinstance(colorspace, list) else [colorspace],
+        })
+
+
+def read_page(pdf, page, chars=True, images=True):
+    """
+    Interpreta o conteúdo de uma página com PageReader.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :param page: Página do mesmo documento.
+    :return: Tupla (caracteres, imagens) de PageReader.
+    """
+    reader = PageReader(pdf.rsrcmgr, page, chars, images)
+    PDFPageInterpreter(pdf.rsrcmgr, reader).process_page(page.page_obj)
+    return reader.chars, reader.images
+
+
+def _clusters(chars, index, tolerance):
+    """
+    Agrupa os caracteres em linhas pelo campo `index`, como cluster_objects
+    do pdfplumber: valores a até `tolerance` do anterior ficam no mesmo grupo.
+    """
+    cluster, last = -1, None
+    by_value = {}
+    for value in sorted({char[index] for char in chars}):
+        if last is None or value > last + tolerance:
+            cluster += 1
+        by_value[value] = cluster
+        last = value
+    ordered = sorted(chars, key=lambda char: by_value[char[index]])
+    return [list(line) for _, line in groupby(ordered, key=lambda char: by_value[char[index]])]
+
+
+def _split_words(line, start, end, across, tolerance, line_tolerance):
+    """
+    Divide uma linha ordenada em palavras, como WordExtractor.iter_chars_to_words:
+    espaços terminam a palavra e um caractere começa outra se estiver antes do
+    anterior, a mais de `tolerance` do fim dele ou a mais de `line_tolerance`
+    na outra direção.
+    """
+    words, word = [], []
+    for char in line:
+        text = char[TEXT]
+        if text.isspace():
+            if word:
+                words.append(word)
+            word = []
+        elif not text:
+            # Como split_at_punctuation vazio: caractere vazio é uma palavra
+            if word:
+                words.append(word)
+            words.append([char])
+            word = []
+        elif word and (
+            char[start] < word[-1][start]
+            or char[start] > word[-1][end] + tolerance
+            or abs(char[across] - word[-1][across]) > line_tolerance
+        ):
+            words.append(word)
+            word = [char]
+        else:
+            word.append(char)
+    if word:
+        words.append(word)
+    return words
+
+
+def page_words(chars, x_tolerance=X_TOLERANCE, y_tolerance=Y_TOLERANCE):
+    """
+    Palavras de uma página a partir dos caracteres de read_page, com as
+    mesmas regras e na mesma ordem de page.extract_words() com os parâmetros
+    padrão: sequências de caracteres com o mesmo upright, linhas agrupadas
+    por top (ou x0, no texto girado), caracteres ordenados por x0 (ou top).
+
+    :return: Lista de tuplas (texto, upright).
+    """
+    words = []
+    for upright, run in groupby(chars, itemgetter(UPRIGHT)):
+        run = list(run)
+        if upright:
+            lines = _clusters(run, TOP, y_tolerance)
+            sort_key, split = itemgetter(X0), (X0, X1, TOP, x_tolerance, y_tolerance)
+        else:
+            lines = _clusters(run, X0, x_tolerance)
+            sort_key, split = itemgetter(TOP, BOTTOM), (TOP, BOTTOM, X0, y_tolerance, x_tolerance)
+        for line in lines:
+            line.sort(key=sort_key)
+            for word in _split_words(line, *split):
+                words.append(("".join(LIGATURES.get(char[TEXT], char[TEXT]) for char in word), upright))
+    return words
+
+
+def words_text(words):
+    """Texto da página como em iter_pdf_text_pages: palavras separadas por espaço, giradas invertidas."""
+    return " ".join(text if upright else text[::-1] for text, upright in words) + " "
+
+
+# Documento aberto em cada processo do pool de iter_pages, reaproveitado
+# (com as fontes já carregadas) por todos os blocos do processo.
+_worker_pdf = None
+
+
+def _open_worker_pdf(path):
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(path)
+
+
+def _read_chunk(page_numbers):
+    """read_page e page_words em um processo do pool, devolvendo também os tempos das etapas."""
+    pdf, results = _worker_pdf, []
+    with metrics.collect() as timings:
+        for page_number in page_numbers:
+            with metrics.stage("extract_words"):
+                chars, images = read_page(pdf, pdf.pages[page_number - 1])
+                words = page_words(chars)
+            results.append((words, len(images)))
+    return results, timings.as_dict()
+
+
+def use_workers(page_count, workers=None):
+    """
+    True se as páginas devem ser lidas em paralelo: engine "fast", mais de um
+    processo e mais de TEXT_LAYER["CHUNK_PAGES"] páginas.
+    """
+    workers = inner_workers(settings.TEXT_LAYER["WORKERS"] if workers is None else workers)
+    return get_engine() == "fast" and workers > 1 and page_count > settings.TEXT_LAYER["CHUNK_PAGES"]
+
+
+def _iter_extract_words(pdf, pages):
+    """Palavras e imagens de cada página com page.extract_words() e page.images do pdfplumber."""
+    for page_number in pages:
+        page = pdf.pages[page_number - 1]
+        with metrics.stage("extract_words"):
+            words = [(word["text"], word["upright"]) for word in page.extract_words()]
+        yield page_number, words, page.images
+
+
+def iter_pages(pdf, pages, pdf_path=None, workers=None):
+    """
+    Lê as palavras e as imagens de cada página da camada de texto com a
+    engine de settings.TEXT_LAYER.
+
+    Na engine "fast", com pdf_path e use_workers, as páginas são divididas em
+    blocos de TEXT_LAYER["CHUNK_PAGES"] lidos em processos, que abrem o PDF
+    uma vez cada e devolvem só as palavras; as imagens das páginas que têm
+    alguma são lidas depois no processo atual, sem os caracteres.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :param pages: Números das páginas (1-based) a ler, em ordem.
+    :param pdf_path: Caminho do mesmo PDF, necessário para ler em paralelo.
+    :param workers: Número de processos; padrão settings.TEXT_LAYER["WORKERS"].
+    :return: Gerador de tuplas (página, palavras (texto, upright), imagens) em ordem.
+    """
+    if get_engine() == "pdfplumber":
+        yield from _iter_extract_words(pdf, pages)
+        return
+    pages = list(pages)
+    workers = inner_workers(settings.TEXT_LAYER["WORKERS"] if workers is None else workers)
+    if pdf_path is None or not use_workers(len(pages), workers):
+        for page_number in pages:
+            with metrics.stage("extract_words"):
+                chars, images = read_page(pdf, pdf.pages[page_number - 1])
+                words = page_words(chars)
+            yield page_number, words, images
+        return
+
+    size = settings.TEXT_LAYER["CHUNK_PAGES"]
+    chunks = [pages[start:start + size] for start in range(0, len(pages), size)]
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)), initializer=_open_worker_pdf, initargs=(pdf_path,)
+    )
+    try:
+        futures = [executor.submit(_read_chunk, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            results, timings = future.result()
+            metrics.merge(timings)
+            for page_number, (words, image_count) in zip(chunk, results):
+                images = []
+                if image_count:
+                    _, images = read_page(pdf, pdf.pages[page_number - 1], chars=False)
+                yield page_number, words, images
+    finally:
+        # Se a extração é interrompida, os blocos que não começaram são descartados
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def compare_engines(pdf, pages=None):
+    """
+    Compara, página a página, as palavras de page_words com as de
+    page.extract_words() do pdfplumber.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :param pages: Números das páginas (1-based); padrão todas.
+    :return: Lista de dicionários {"page", "fast_words", "pdfplumber_words",
+        "first_difference"} das páginas com alguma diferença.
+    """
+    if pages is None:
+        pages = range(1, len(pdf.pages) + 1)
+    differences = []
+    for page_number in pages:
+        page = pdf.pages[page_number - 1]
+        fast = page_words(read_page(pdf, page, images=False)[0])
+        reference = [(word["text"], word["upright"]) for word in page.extract_words()]
+        if fast != reference:
+            index = next(
+                (i for i, (a, b) in enumerate(zip(fast, reference)) if a != b), min(len(fast), len(reference))
+            )
+            differences.append({
+                "page": page_number,
+                "fast_words": len(fast),
+                "pdfplumber_words": len(reference),
+                "first_difference": index,
+            })
+        page.close()
+    return differences
@@ -1,7 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from .views import counter
+from .metrics import metrics_view
+from .views import (batch_counter, counter, counter_async, counter_stream, counter_stream_async, job_cancel,
+                    job_status, job_submit, result_text)
 
 
 urlpatterns = [
-    path('', counter, name='counter'),
+    path('', counter_async if settings.ASYNC_COUNTER["ENABLED"] else counter, name='counter'),
+    path('stream/', counter_stream_async if settings.ASYNC_COUNTER["ENABLED"] else counter_stream,
+         name='counter_stream'),
+    path('text/<str:text_id>/', result_text, name='result_text'),
+    path('batch/', batch_counter, name='batch_counter'),
+    path('jobs/', job_submit, name='job_submit'),
+    path('jobs/<uuid:job_id>/', job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/cancel/', job_cancel, name='job_cancel'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
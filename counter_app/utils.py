@@ -1,5 +1,11 @@
+import html
+import re
 import subprocess
-from PIL import Image, ImageEnhance, ImageOps, ImageFilter
+from pdfminer.pdftypes import PDFObjRef, resolve1
+from pdfminer.psparser import PSLiteral
+
+from . import metrics
+from .preprocessing import load_image, preprocess_image
 
 
 def get_pdfinfo_as_dict(pdf_path):
@@ -10,12 +16,13 @@ def get_pdfinfo_as_dict(pdf_path):
     :return: Dicionário contendo as informações do PDF.
     """
     try:
-        result = subprocess.run(
-            ["pdfinfo", pdf_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        with metrics.stage("subprocess.pdfinfo"):
+            result = subprocess.run(
+                ["pdfinfo", pdf_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
 
         if result.returncode != 0:
             raise RuntimeError(f"Erro ao executar pdfinfo: {result.stderr.strip()}")
@@ -44,12 +51,13 @@ def get_pdf_fonts_and_encodings_as_dict(pdf_path):
     """
     try:
         # Executa o comando `pdffonts`
-        result = subprocess.run(
-            ["pdffonts", pdf_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        with metrics.stage("subprocess.pdffonts"):
+            result = subprocess.run(
+                ["pdffonts", pdf_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
 
         if result.returncode != 0:
             raise RuntimeError(f"Erro ao executar pdffonts: {result.stderr.strip()}")
@@ -114,12 +122,13 @@ def get_file_metadata_as_dict(file_path):
     :return: Dicionário contendo os metadados do arquivo.
     """
     try:
-        result = subprocess.run(
-            ["exiftool", file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        with metrics.stage("subprocess.exiftool"):
+            result = subprocess.run(
+                ["exiftool", file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
 
         if result.returncode != 0:
             raise RuntimeError(f"Erro ao executar exiftool: {result.stderr.strip()}")
@@ -162,24 +171,167 @@ def validate_pdf(file_path):
         raise RuntimeError(f"Erro ao validar arquivo PDF: {e}")
 
 
+def pdf_name(value):
+    """Converte um nome PDF (PSLiteral, bytes ou str) em str."""
+    value = resolve1(value)
+    if isinstance(value, PSLiteral):
+        value = value.name
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    return value
+
+
+def _iter_pdf_fonts(resources, visited):
+    """Percorre as fontes de um dicionário de recursos, incluindo Form XObjects e fontes Type3."""
+    resources = resolve1(resources) or {}
+    for ref in (resolve1(resources.get("Font")) or {}).values():
+        if isinstance(ref, PDFObjRef):
+            if ref.objid in visited:
+                continue
+            visited.add(ref.objid)
+        font = resolve1(ref)
+        if isinstance(font, dict):
+            yield font
+            if "Resources" in font:
+                yield from _iter_pdf_fonts(font["Resources"], visited)
+
+    for ref in (resolve1(resources.get("XObject")) or {}).values():
+        if isinstance(ref, PDFObjRef):
+            if ref.objid in visited:
+                continue
+            visited.add(ref.objid)
+        xobject = resolve1(ref)
+        attrs = getattr(xobject, "attrs", {})
+        if pdf_name(attrs.get("Subtype")) == "Form" and "Resources" in attrs:
+            yield from _iter_pdf_fonts(attrs["Resources"], visited)
+
+
+def _font_encoding_name(font):
+    """
+    Reproduz a coluna `encoding` do pdffonts: o nome da CMap para fontes
+    Type0, "Custom" quando há um array /Differences e o nome base caso contrário.
+    """
+    encoding = resolve1(font.get("Encoding"))
+    if pdf_name(font.get("Subtype")) == "Type0":
+        return pdf_name(encoding) if encoding is not None else ""
+    if isinstance(encoding, dict):
+        if "Differences" in encoding:
+            return "Custom"
+        encoding = encoding.get("BaseEncoding")
+    if encoding is None:
+        return "Builtin" if pdf_name(font.get("Subtype")) == "Type3" else "Standard"
+    name = pdf_name(encoding)
+    return name[:-len("Encoding")] if name.endswith("Encoding") else name
+
+
+def get_pdf_fonts_and_encodings_from_pdf(pdf):
+    """
+    Lê as fontes e encodings de um PDF já aberto com o pdfplumber, no mesmo
+    formato de get_pdf_fonts_and_encodings_as_dict, sem executar o `pdffonts`.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :return: Dicionário com as fontes e seus encodings.
+    """
+    visited = set()
+    fonts_and_encodings = []
+    for page in pdf.pages:
+        for font in _iter_pdf_fonts(page.page_obj.resources, visited):
+            font_name = pdf_name(font.get("BaseFont")) or "[none]"
+            fonts_and_encodings.append({"font_name": font_name, "encoding": _font_encoding_name(font)})
+    return {"fonts": fonts_and_encodings}
+
+
+def get_pdf_metadata_from_pdf(pdf):
+    """
+    Lê Creator, Author e CreatorTool de um PDF já aberto com o pdfplumber, com as
+    mesmas chaves de get_file_metadata_as_dict, sem executar o `exiftool`.
+
+    O `exiftool` lista as tags XMP depois das do dicionário Info e
+    get_file_metadata_as_dict fica com a última, então aqui também o
+    dc:creator do XMP prevalece sobre o /Creator do Info.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :return: Dicionário com creator, author e creator_tool presentes no documento.
+    """
+    metadata = {}
+    for key in ("Creator", "Author"):
+        if pdf.metadata.get(key):
+            metadata[key.lower()] = str(pdf.metadata[key]).strip()
+
+    xmp = resolve1(pdf.doc.catalog.get("Metadata"))
+    if xmp is not None:
+        xml = xmp.get_data().decode("utf-8", errors="ignore")
+        match = re.search(r"<xmp:CreatorTool>(.*?)</xmp:CreatorTool>|xmp:CreatorTool=\"(.*?)\"", xml, re.DOTALL)
+        if match:
+            metadata["creator_tool"] = html.unescape(match.group(1) or match.group(2) or "").strip()
+        match = re.search(r"<dc:creator>(.*?)</dc:creator>", xml, re.DOTALL)
+        if match:
+            # Vários autores saem separados por vírgula, como no exiftool
+            creators = [html.unescape(li).strip() for li in re.findall(r"<rdf:li[^>]*>(.*?)</rdf:li>", match.group(1))]
+            if creators:
+                metadata["creator"] = ", ".join(creators)
+    return metadata
+
+
+def validate_pdf_pages_native(pdf):
+    """
+    Valida cada página de um PDF já aberto com o pdfplumber.
+
+    Os metadados continuam valendo para o documento inteiro: se Creator, Author
+    e CreatorTool indicarem um documento escaneado, nenhuma página é válida.
+    As fontes são verificadas página a página, considerando só as fontes
+    usadas pela própria página.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :return: Lista com um booleano por página; True se a página é válida.
+    """
+    try:
+        if not validate_pdf_creator_author_creator_tool(get_pdf_metadata_from_pdf(pdf)):
+            return [False] * len(pdf.pages)
+
+        routes = []
+        for page in pdf.pages:
+            fonts = [
+                {"font_name": pdf_name(font.get("BaseFont")) or "[none]", "encoding": _font_encoding_name(font)}
+                for font in _iter_pdf_fonts(page.page_obj.resources, set())
+            ]
+            routes.append(validate_pdf_fonts_and_encodings({"fonts": fonts}))
+        return routes
+
+    except Exception as e:
+        raise RuntimeError(f"Erro ao validar arquivo PDF: {e}")
+
+
+def validate_pdf_native(pdf):
+    """
+    Valida um PDF já aberto com o pdfplumber com os mesmos critérios de
+    validate_pdf, lendo fontes e metadados do próprio documento.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :return: True se o arquivo é válido, False caso contrário.
+    """
+    try:
+        fonts_info = get_pdf_fonts_and_encodings_from_pdf(pdf)
+        file_info = get_pdf_metadata_from_pdf(pdf)
+
+        return validate_pdf_fonts_and_encodings(fonts_info) and validate_pdf_creator_author_creator_tool(file_info)
+
+    except Exception as e:
+        raise RuntimeError(f"Erro ao validar arquivo PDF: {e}")
+
+
 def preprocess_image_hard(image_path):
-    image = Image.open(image_path)
-    # Converter para escala de cinza
-    gray_image = ImageOps.grayscale(image)
-    # Aplicar filtro de nitidez
-    sharpened_image = gray_image.filter(ImageFilter.SHARPEN)
-    # Binarizar a imagem
-    threshold = 128
-    binary_image = sharpened_image.point(lambda x: 255 if x > threshold else 0, mode='1')
-    return binary_image
+    # Escala de cinza, nitidez e binarização com limiar fixo (pipeline "hard").
+    # Aceita caminho, objeto de arquivo, bytes ou imagem PIL.
+    image, _ = preprocess_image(load_image(image_path), "hard")
+    return image
 
 
 def preprocess_image_soft(image_path):
-    image = Image.open(image_path).convert("L")
-    enhanced_image = ImageEnhance.Contrast(
-            image.resize((image.width * 3, image.height * 3), Image.Resampling.LANCZOS)
-        ).enhance(2)
-    return enhanced_image
+    # Escala de cinza, ampliação de 3x e contraste (pipeline "legacy_soft").
+    # Aceita caminho, objeto de arquivo, bytes ou imagem PIL.
+    image, _ = preprocess_image(load_image(image_path), "legacy_soft")
+    return image
 
 
 # Exemplo de uso
@@ -1,129 +1,980 @@
+import logging
 import os
 import tempfile
-from functools import partial
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import repeat
 
 import pdfplumber
-import pytesseract
 
-from pdf2image import convert_from_path
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 
+from .cache import extraction_settings_key, file_hash, get_result_cache, make_cache_key, pixels_hash
+from .concurrency import Overloaded, check_capacity, file_pool_options, inner_workers, run_extraction
+from .counting import TextAccumulator, count_characters
+from .jobs import JobsUnavailable, QueueFull, cancel_job, get_job_status, submit_job
+from .langroute import LanguageRouter, route_languages
+from .linefilters import filter_lines, get_line_filter_options
+from .pdf_images import decode_pdf_image, image_hash, image_pixels
+from .preflight import PreflightError, check_page_limit, needs_async, preflight, upload_error
+from .preprocessing import PIPELINES, load_image, preprocess_image
+from . import metrics, store, tesseract_pool, textlayer
+from .raster import get_page_dpis, get_pdf_page_count, iter_page_windows, language_dpi
+from .sampling import PAGE_MODES, estimate_total, select_pages
+from .streaming import ExtractionStream, sse_event
 from .utils import (get_pdf_fonts_and_encodings_as_dict, 
                     get_file_metadata_as_dict,
                     validate_pdf_fonts_and_encodings, 
                     validate_pdf_creator_author_creator_tool,
                     validate_pdf,
-                    preprocess_image_hard,
-                    preprocess_image_soft
+                    validate_pdf_native,
+                    validate_pdf_pages_native,
                     )
 
 
+logger = logging.getLogger(__name__)
+
+
+class SharedUploadPath:
+    """
+    Caminho no disco de um arquivo enviado, compartilhado por todas as etapas
+    de uma requisição.
+
+    Se o upload já está no disco (TemporaryUploadedFile ou File aberto de um
+    caminho) o próprio arquivo é usado; caso contrário ele é gravado em um
+    temporário uma única vez, na primeira vez que `path` é lido.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.writes = 0
+        self._path = None
+        self._temp_file = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            if hasattr(self.file, "temporary_file_path"):
+                self._path = self.file.temporary_file_path()
+            elif isinstance(getattr(getattr(self.file, "file", None), "name", None), str) and \
+                    os.path.isfile(self.file.file.name):
+                self._path = self.file.file.name
+            else:
+                self._temp_file = tempfile.NamedTemporaryFile(delete=True, suffix=".pdf")
+                for chunk in self.file.chunks():
+                    self._temp_file.write(chunk)
+                self._temp_file.flush()
+                self.file.seek(0)
+                self._path = self._temp_file.name
+                self.writes += 1
+        return self._path
+
+    def close(self):
+        if self._temp_file is not None:
+            self._temp_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def handle_uploaded_file(file, callback):
-    """Grava o arquivo enviado em um temporário e executa o callback."""
-    with tempfile.NamedTemporaryFile(delete=True, suffix=".pdf") as temp_file:
-        for chunk in file.chunks():
-            temp_file.write(chunk)
-        temp_file.flush()
-        return callback(temp_file.name)
+    """Executa o callback com o caminho do arquivo enviado no disco."""
+    with SharedUploadPath(file) as upload:
+        return callback(upload.path)
 
 
-def process_pdf(file, lang):
-    """Processa um arquivo PDF para extrair texto e contar palavras, imagens e páginas."""
-    text_extracted = ""
-    qt_pages, qt_images, qt_words = 0, 0, 0
+def iter_pdf_text_pages(pdf, lang, preprocess=None, pages=None, stats=None, line_filters=None,
+                        pdf_path=None):
+    """
+    Extrai o texto de cada página de um PDF aberto com o pdfplumber, incluindo
+    o OCR das imagens embutidas na página. As palavras vêm da engine de
+    settings.TEXT_LAYER (textlayer.iter_pages).
 
-    with pdfplumber.open(file) as pdf:
-        qt_pages = len(pdf.pages)
-        for page in pdf.pages:
-            words = page.extract_words()
-            qt_words += len(words)
-            text_extracted += " ".join(
-                word["text"][::-1] if not word["upright"] else word["text"]
-                for word in words
-            ) + " "
-
-            for image in page.images:
+    As imagens embutidas são decodificadas conforme o filtro do stream. Imagens
+    menores que settings.EMBEDDED_IMAGE_MIN_PIXELS são ignoradas, e imagens
+    repetidas (ex.: logotipos em todas as páginas) passam pelo OCR uma única
+    vez, com o resultado reaproveitado nas demais ocorrências.
+
+    :param pdf: Documento aberto com pdfplumber.open.
+    :param lang: Idiomas do Tesseract, usados nas imagens embutidas.
+    :param preprocess: Modo de pré-processamento das imagens.
+    :param pages: Números das páginas (1-based) a processar; padrão todas.
+    :param stats: Dicionário opcional que recebe disk_writes_avoided e as
+        contagens embedded_images_skipped, embedded_images_deduped e
+        embedded_images_failed.
+    :param line_filters: Opções dos filtros de linha do OCR (get_line_filter_options).
+    :param pdf_path: Caminho do PDF (ou SharedUploadPath), usado para ler as
+        páginas em paralelo com a engine "fast" de settings.TEXT_LAYER.
+    :return: Gerador de dicionários {"page", "text", "word_count", "qt_images"} em ordem.
+    """
+    if pages is None:
+        pages = range(1, len(pdf.pages) + 1)
+    if isinstance(pdf_path, SharedUploadPath):
+        # Só grava o upload em disco se as páginas forem mesmo lidas em paralelo
+        pdf_path = pdf_path.path if textlayer.use_workers(len(pages)) else None
+    if stats is None:
+        stats = {}
+    for key in ("disk_writes_avoided", "embedded_images_skipped", "embedded_images_deduped",
+                "embedded_images_failed"):
+        stats.setdefault(key, 0)
+    image_results = {}
+
+    for page_number, words, images in textlayer.iter_pages(pdf, pages, pdf_path):
+        qt_images, qt_words = 0, len(words)
+        parts = [textlayer.words_text(words)]
+
+        for image in images:
+            if image_pixels(image) < settings.EMBEDDED_IMAGE_MIN_PIXELS:
+                stats["embedded_images_skipped"] += 1
+                continue
+
+            digest = image_hash(image)
+            if digest in image_results:
+                stats["embedded_images_deduped"] += 1
+            else:
                 try:
-                    with tempfile.NamedTemporaryFile(delete=True, suffix=".jpg") as temp_img:
-                        temp_img.write(image["stream"].get_rawdata())
-                        temp_img.flush()
-                        text, img_words = process_image(temp_img.name, lang)
-                        if text:
-                            text_extracted += text
-                            qt_words += img_words
-                            qt_images += 1
+                    with metrics.stage("decode_image"):
+                        decoded = decode_pdf_image(image)
+                    image_results[digest] = process_image(decoded, lang, preprocess, line_filters)
+                    stats["disk_writes_avoided"] += 1
                 except Exception as e:
-                    print(f"Erro processando imagem de PDF: {e}")
+                    logger.warning("Erro processando imagem de PDF: %s", e)
+                    image_results[digest] = ("", 0)
+                    stats["embedded_images_failed"] += 1
+
+            text, img_words = image_results[digest]
+            if text:
+                parts.append(text)
+                qt_words += img_words
+                qt_images += 1
+
+        yield {"page": page_number, "text": "".join(parts), "word_count": qt_words, "qt_images": qt_images}
+
+
+def process_pdf(file, lang, preprocess=None, progress=None, pdf=None, stats=None, line_filters=None,
+                pdf_path=None):
+    """
+    Processa um arquivo PDF para extrair texto e contar palavras, imagens e páginas.
+
+    :param progress: Callable opcional chamado a cada página com ({"page",
+        "word_count", "words", "chars", "chars_cleaned", "path", "text"},
+        total de páginas).
+    :param pdf: Documento já aberto com pdfplumber, reaproveitado em vez de
+        abrir o arquivo de novo (ex.: o mesmo usado em validate_pdf_native).
+    :param stats: Dicionário opcional que recebe disk_writes_avoided e
+        page_counts ({"page", "words", "chars", "chars_cleaned"} por página).
+    :param line_filters: Opções dos filtros de linha do OCR das imagens.
+    :param pdf_path: Caminho do PDF (ou SharedUploadPath) para a leitura das
+        páginas em paralelo; padrão o próprio file, se for um caminho.
+    :return: Tupla (TextAccumulator, páginas, imagens).
+    """
+    if pdf_path is None and isinstance(file, (str, os.PathLike)):
+        pdf_path = file
+    text = TextAccumulator()
+    qt_pages, qt_images = 0, 0
+    page_counts = []
+
+    with nullcontext(pdf) if pdf is not None else pdfplumber.open(file) as pdf:
+        qt_pages = len(pdf.pages)
+        for page in iter_pdf_text_pages(pdf, lang, preprocess, stats=stats, line_filters=line_filters,
+                                        pdf_path=pdf_path):
+            chars, chars_cleaned = text.qt_char_extracted, text.qt_char_cleaned
+            text.add(page["text"], page["word_count"])
+            qt_images += page["qt_images"]
+            page_counts.append({
+                "page": page["page"],
+                "words": page["word_count"],
+                "chars": text.qt_char_extracted - chars,
+                "chars_cleaned": text.qt_char_cleaned - chars_cleaned,
+            })
+
+            if progress is not None:
+                progress({**page_counts[-1], "word_count": page["word_count"], "path": "text", "text": page["text"]},
+                         qt_pages)
+
+    if stats is not None:
+        stats["page_counts"] = page_counts
+    return text, qt_pages, qt_images
+
 
-    return text_extracted, qt_pages, qt_images, qt_words
+def process_pdf_hybrid(pdf_path, pdf, routes, lang, preprocess=None, progress=None, stats=None,
+                       line_filters=None, pages=None, language_routing=False):
+    """
+    Processa um PDF página a página: as páginas com fontes válidas têm o texto
+    extraído pelo pdfplumber e apenas as demais são rasterizadas e passam por OCR.
+
+    :param pdf_path: Caminho do PDF, usado na rasterização.
+    :param pdf: O mesmo arquivo aberto com pdfplumber.open.
+    :param routes: Lista com um booleano por página; True usa a camada de texto.
+    :param stats: Dicionário opcional que recebe ocr_cache_hits, ocr_cache_misses,
+        page_routes ({"page", "path"} por página, com path "text" ou "ocr"),
+        page_counts ({"page", "words", "chars", "chars_cleaned"} por página) e
+        page_languages ({"page", "script", "languages"} por página com OCR).
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param pages: Números das páginas (1-based, em ordem) a processar; padrão todas.
+    :param language_routing: Escolhe os idiomas das páginas com OCR, como em iter_ocr_pages.
+    :return: Tupla (TextAccumulator, páginas, imagens), como process_pdf.
+    """
+    if pages is None:
+        pages = range(1, len(routes) + 1)
+    text_pages = [page for page in pages if routes[page - 1]]
+    ocr_pages_numbers = [page for page in pages if not routes[page - 1]]
+    text_iter = iter_pdf_text_pages(pdf, lang, preprocess, text_pages, stats, line_filters, pdf_path)
+    ocr_iter = iter_ocr_pages(
+        pdf_path, lang, preprocess=preprocess, pages=ocr_pages_numbers, line_filters=line_filters,
+        dpi=get_page_dpis(pdf, lang, ocr_pages_numbers), language_routing=language_routing,
+    )
+
+    text = TextAccumulator()
+    qt_pages, qt_images = len(pages), 0
+    page_routes, page_counts, page_languages, hits = [], [], [], 0
+    for page_number in pages:
+        valid = routes[page_number - 1]
+        chars, chars_cleaned = text.qt_char_extracted, text.qt_char_cleaned
+        if valid:
+            page = next(text_iter)
+            text.add(page["text"], page["word_count"])
+            qt_images += page["qt_images"]
+        else:
+            page = next(ocr_iter)
+            text.add(page["text"] + "\n", page["word_count"])
+            qt_images += 1
+            hits += page["from_cache"]
+            page_languages.append({"page": page_number, "script": page["script"], "languages": page["languages"]})
+        path = "text" if valid else "ocr"
+        page_routes.append({"page": page_number, "path": path})
+        page_counts.append({
+            "page": page_number,
+            "words": page["word_count"],
+            "chars": text.qt_char_extracted - chars,
+            "chars_cleaned": text.qt_char_cleaned - chars_cleaned,
+        })
+
+        if progress is not None:
+            progress({**page_counts[-1], "word_count": page["word_count"], "path": path, "text": page["text"]},
+                     qt_pages)
+
+    if stats is not None:
+        stats["ocr_cache_hits"] = stats.get("ocr_cache_hits", 0) + hits
+        stats["ocr_cache_misses"] = stats.get("ocr_cache_misses", 0) + len(ocr_pages_numbers) - hits
+        stats["page_routes"] = page_routes
+        stats["page_counts"] = page_counts
+        stats["page_languages"] = page_languages
+    return text, qt_pages, qt_images
 
 
-def process_image(file_path, lang="eng"):
-    """Processa uma imagem para extrair texto e contar palavras."""
-    remove_target_lines = False
-    word_length = 4
-    
+def get_preprocess_pipelines():
+    """Pipelines de pré-processamento: os padrões mais os de settings.OCR_PREPROCESS_PIPELINES."""
+    return {**PIPELINES, **settings.OCR_PREPROCESS_PIPELINES}
+
+
+def get_request_line_filters(data):
+    """
+    Lê as opções dos filtros de linha do OCR enviadas em um formulário.
+
+    :param data: request.POST, com word_length e remove_signature_lines
+        ("1", "on" ou "true" liga; qualquer outro valor desliga). Campos
+        ausentes usam os padrões de settings.
+    :return: Opções de get_line_filter_options.
+    """
+    remove_signature_lines = data.get("remove_signature_lines")
+    if remove_signature_lines is not None:
+        remove_signature_lines = remove_signature_lines.lower() in ("1", "on", "true")
+    return get_line_filter_options(data.get("word_length"), remove_signature_lines)
+
+
+def get_request_page_selection(data):
+    """
+    Lê a seleção de páginas enviada em um formulário.
+
+    :param data: request.POST, com page_mode ("all", "range" ou "sample"),
+        page_range (ex.: "1-10, 15") e sample_size (padrão
+        settings.PAGE_SAMPLING["SIZE"], limitado a MAX_SIZE).
+    :return: Dicionário {"mode", "range", "size"} para extract_file.
+    :raises ValueError: Se o modo ou o tamanho da amostra forem inválidos.
+    """
+    mode = data.get("page_mode") or "all"
+    if mode not in PAGE_MODES:
+        raise ValueError(f"Modo de seleção de páginas desconhecido: {mode}")
     try:
-        processed_image = preprocess_image_hard(file_path)
-        text_extracted = pytesseract.image_to_string(processed_image, lang=lang)
-
-        # Remove linhas com caracteres não alfanuméricos excessivos
-        lines = text_extracted.splitlines()
-        cleaned_lines = []
-        for line in lines:
-            non_alpha_count = sum(1 for char in line if not char.isalpha())
-            alpha_count = sum(1 for char in line if char.isalpha())
-            if alpha_count >= non_alpha_count:
-                cleaned_lines.append(line)
-        text_extracted = "\n".join(cleaned_lines) 
-
-        #Remove linhas que tem apenas palavras com menos caracteres que definido em word_length
-        lines = text_extracted.splitlines()
-        cleaned_lines = []
-        for line in lines:
-        # Ignorar linhas vazias ou com apenas espaços em branco
-            if line.strip():
-                words = line.split()
-                # Verificar se todas as palavras têm menos de N caracteres
-                if any(len(word) >= word_length for word in words):
-                    cleaned_lines.append(line)     
-        text_extracted = "\n".join(cleaned_lines)
-
-
-        # Remove target lines from the end of the text if they contain key words
-        if remove_target_lines:
-            key_words = ["assinado", "assinatura", "assinaturas"]
-            target_lines = 2
-            lines = [line.strip() for line in text_extracted.split("\n") if line.strip()]
-            def contains_key_words(line, words):
-                return any(word in line.lower() for word in words)
-            if len(lines) >= target_lines and all(contains_key_words(line, key_words) for line in lines[-target_lines:]):
-                lines = lines[:-target_lines]
-            text_extracted = "\n".join(lines)
-
-
-        qt_words = len(text_extracted.split())
+        size = int(data.get("sample_size") or settings.PAGE_SAMPLING["SIZE"])
+    except ValueError:
+        raise ValueError("Tamanho da amostra deve ser um número inteiro.")
+    if not 1 <= size <= settings.PAGE_SAMPLING["MAX_SIZE"]:
+        raise ValueError(f"Tamanho da amostra deve estar entre 1 e {settings.PAGE_SAMPLING['MAX_SIZE']}.")
+    page_range = (data.get("page_range") or "").strip()
+    if mode == "range" and not page_range:
+        raise ValueError("Informe o intervalo de páginas.")
+    return {"mode": mode, "range": page_range, "size": size}
+
+
+def get_request_language_routing(data):
+    """
+    Lê a opção de roteamento de idiomas do OCR enviada em um formulário.
+
+    :param data: request.POST, com language_routing ("1", "on" ou "true"
+        liga; qualquer outro valor desliga). Ausente usa
+        settings.OCR_LANGUAGE_ROUTING["ENABLED"].
+    :return: Booleano.
+    """
+    language_routing = data.get("language_routing")
+    if language_routing is None:
+        return settings.OCR_LANGUAGE_ROUTING["ENABLED"]
+    return language_routing.lower() in ("1", "on", "true")
+
+
+def get_request_languages(data, default=""):
+    """
+    Lê os idiomas do OCR enviados em um formulário.
+
+    :param data: request.POST, com um campo languages por idioma (ids de LANGUAGES).
+    :param default: Idiomas usados quando nenhum é enviado.
+    :return: Idiomas no formato do Tesseract (ex.: "por+eng").
+    :raises ValueError: Se algum idioma não estiver em LANGUAGES.
+    """
+    codes = data.getlist("languages")
+    known = {language["id"] for language in LANGUAGES}
+    unknown = [code for code in codes if code not in known]
+    if unknown:
+        raise ValueError(f"Idioma desconhecido: {', '.join(unknown)}")
+    return "+".join(codes) or default
+
+
+def get_request_preprocess(data):
+    """
+    Lê o modo de pré-processamento enviado em um formulário.
+
+    :param data: request.POST, com preprocess (ausente usa settings.OCR_PREPROCESS_MODE).
+    :return: Nome de um dos pipelines de get_preprocess_pipelines.
+    :raises ValueError: Se o modo for desconhecido.
+    """
+    preprocess = data.get("preprocess") or settings.OCR_PREPROCESS_MODE
+    if preprocess not in get_preprocess_pipelines():
+        raise ValueError(f"Modo de pré-processamento desconhecido: {preprocess}")
+    return preprocess
+
+
+def _ocr_image(source, lang, preprocess=None, line_filters=None, routing=False, latin=None):
+    """
+    Pré-processa uma imagem, escolhe os idiomas se houver roteamento, aplica
+    o OCR e filtra as linhas do texto.
+
+    :return: Tupla (texto, palavras, {"script", "languages"}).
+    """
+    with metrics.stage("preprocess"):
+        processed_image, _ = preprocess_image(
+            load_image(source), preprocess or settings.OCR_PREPROCESS_MODE, get_preprocess_pipelines()
+        )
+    detection = {"script": None, "languages": lang}
+    if routing:
+        with metrics.stage("language_routing"):
+            detection = route_languages(processed_image, lang, latin)
+    with metrics.stage("tesseract"):
+        text_extracted = tesseract_pool.image_to_string(processed_image, detection["languages"])
+
+    # Remove linhas com caracteres não alfanuméricos excessivos, linhas só
+    # com palavras curtas e, se pedido, as linhas de assinatura do final
+    with metrics.stage("line_filters"):
+        text_extracted = filter_lines(text_extracted, line_filters)
+
+    return text_extracted, len(text_extracted.split()), detection
+
 
+def process_image(file_path, lang="eng", preprocess=None, line_filters=None):
+    """
+    Processa uma imagem para extrair texto e contar palavras.
+
+    :param file_path: Caminho, objeto de arquivo, bytes ou imagem PIL.
+    :param line_filters: Opções dos filtros aplicados às linhas do texto
+        (get_line_filter_options); padrão as de settings.
+    """
+    try:
+        text_extracted, qt_words, _ = _ocr_image(file_path, lang, preprocess, line_filters)
         return text_extracted, qt_words
     except Exception as e:
         raise ValueError(f"Erro extraindo texto da imagem: {e}")
 
 
-def extract_text_from_pdf_images(pdf_path, lang):
-    """Extrai texto das imagens geradas a partir de um PDF."""
-    report = []
-    with tempfile.TemporaryDirectory() as temp_dir:
-        images = convert_from_path(pdf_path, output_folder=temp_dir, fmt="JPEG")
-        for i, image in enumerate(images):
-            image_file = os.path.join(temp_dir, f"page_{i + 1}.jpg")
-            image.save(image_file, "JPEG")
-            text, qt_words = process_image(image_file, lang)
-            report.append({"page": i + 1, "text": text, "word_count": qt_words})
+def process_image_routed(file_path, lang="eng", preprocess=None, line_filters=None, latin=None):
+    """
+    Como process_image, mas aplica o OCR só com os idiomas de `lang` que
+    usam o script detectado na imagem (langroute.route_languages).
+
+    :param latin: Idiomas latinos já identificados no documento, ou None.
+    :return: Tupla (texto, palavras, {"script", "languages"}).
+    """
+    try:
+        return _ocr_image(file_path, lang, preprocess, line_filters, routing=True, latin=latin)
+    except Exception as e:
+        raise ValueError(f"Erro extraindo texto da imagem: {e}")
+
+
+@contextmanager
+def ocr_executor(workers=None):
+    """
+    Cria o pool usado no OCR das páginas.
+
+    Com o pool persistente do Tesseract habilitado o OCR já roda nos processos
+    dele, então as páginas são distribuídas por threads, que só pré-processam
+    e aguardam o resultado.
+
+    :param workers: Número de processos; padrão settings.OCR_WORKERS, limitado
+        à parte do processo em um pool de lote (concurrency.inner_workers).
+    :return: Um executor, ou None quando o OCR deve ser serial.
+    """
+    workers = inner_workers(settings.OCR_WORKERS if workers is None else workers)
+    if workers <= 1:
+        yield None
+        return
+    executor_class = ThreadPoolExecutor if tesseract_pool.is_enabled() else ProcessPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        yield executor
+
+
+def _ocr_one(image, lang, preprocess, line_filters, routing):
+    if routing is None:
+        return process_image(image, lang, preprocess, line_filters)
+    return process_image_routed(image, lang, preprocess, line_filters, routing["latin"])
+
+
+def _ocr_page(image, lang, preprocess, line_filters, routing=None):
+    """process_image em um processo ou thread do pool, devolvendo também os tempos das etapas."""
+    with metrics.collect() as timings:
+        result = _ocr_one(image, lang, preprocess, line_filters, routing)
+    return result, timings.as_dict()
+
+
+def ocr_pages(images, lang, executor=None, preprocess=None, line_filters=None, routing=None):
+    """
+    Aplica OCR em uma sequência de imagens de páginas, em paralelo por página.
 
-    text_extracted = "\n".join(f"{page['text']}" for page in report)
-    qt_pages = len(report)
-    qt_words = sum(page["word_count"] for page in report)
-    return text_extracted, qt_pages, qt_pages, qt_words
+    :param images: Imagens PIL (ou caminhos), na ordem das páginas.
+    :param lang: Idiomas do Tesseract (ex.: "por+eng").
+    :param executor: Pool criado por ocr_executor; None processa em série.
+    :param preprocess: Modo de pré-processamento das imagens.
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param routing: None, ou {"latin": idiomas latinos identificados} para
+        escolher os idiomas de cada página com process_image_routed.
+    :return: Lista de tuplas (texto, palavras), ou (texto, palavras,
+        {"script", "languages"}) com routing, na mesma ordem das imagens.
+    """
+    if executor is None:
+        return [_ocr_one(image, lang, preprocess, line_filters, routing) for image in images]
+    results = []
+    for result, timings in executor.map(
+        _ocr_page, images, repeat(lang), repeat(preprocess), repeat(line_filters), repeat(routing)
+    ):
+        metrics.merge(timings)
+        results.append(result)
+    return results
+
+
+def iter_ocr_pages(pdf_path, lang, workers=None, window=None, preprocess=None, last_page=None, pages=None,
+                   line_filters=None, dpi=None, language_routing=False):
+    """
+    Rasteriza e aplica OCR em um PDF janela a janela.
+
+    Cada página rasterizada tem seus pixels hasheados e o resultado do OCR é
+    reaproveitado do cache de resultados quando a mesma página já foi
+    processada com os mesmos idiomas, pré-processamento e filtros de linha.
+
+    :param pdf_path: Caminho para o arquivo PDF.
+    :param lang: Idiomas do Tesseract.
+    :param workers: Número de processos de OCR; padrão settings.OCR_WORKERS.
+    :param window: Páginas renderizadas por vez; padrão settings.OCR_PAGE_WINDOW.
+    :param preprocess: Modo de pré-processamento das imagens.
+    :param last_page: Última página a processar; padrão é a última do documento.
+    :param pages: Números das páginas (1-based) a processar, no lugar de last_page.
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param dpi: DPI ou dicionário {página: DPI} de get_page_dpis; padrão o
+        DPI dos idiomas (language_dpi).
+    :param language_routing: Aplica o OCR de cada página só com os idiomas do
+        script detectado (langroute.LanguageRouter), quando há mais de um.
+    :return: Gerador de dicionários {"page", "text", "word_count", "from_cache",
+        "script", "languages"} em ordem; script é None sem roteamento.
+    """
+    if window is None:
+        window = settings.OCR_PAGE_WINDOW
+    preprocess = preprocess or settings.OCR_PREPROCESS_MODE
+    line_filters = line_filters or get_line_filter_options()
+    cache = get_result_cache()
+    if dpi is None:
+        dpi = language_dpi(lang)
+    router = LanguageRouter(lang) if language_routing and "+" in lang else None
+
+    with ocr_executor(workers) as executor:
+        for window_pages in iter_page_windows(pdf_path, window, last_page=last_page, pages=pages, dpi=dpi):
+            routing = None if router is None else {"latin": router.state()}
+            # Com roteamento os idiomas da página dependem do script (função dos pixels) e dos
+            # idiomas latinos já fixados pelo LanguageRouter, que entram na chave
+            kind = "page" if routing is None else f"page:routed:{'+'.join(routing['latin'] or ())}"
+            cached, keys = {}, {}
+            if cache is not None:
+                with metrics.stage("ocr_cache"):
+                    for page, image in window_pages:
+                        keys[page] = make_cache_key(kind, pixels_hash(image), lang, preprocess, line_filters)
+                        result = cache.get(keys[page])
+                        if result is not None:
+                            cached[page] = tuple(result)
+
+            missing = [(page, image) for page, image in window_pages if page not in cached]
+            results = ocr_pages(
+                [image for _, image in missing], lang, executor, preprocess, line_filters, routing
+            )
+            for (page, _), result in zip(missing, results):
+                if cache is not None:
+                    cache.set(keys[page], list(result))
+
+            results = dict(zip((page for page, _ in missing), results))
+            for page, _ in window_pages:
+                text, qt_words, *detection = cached.get(page) or results[page]
+                detection = detection[0] if detection else {"script": None, "languages": lang}
+                if router is not None:
+                    router.observe(detection, text)
+                yield {"page": page, "text": text, "word_count": qt_words, "from_cache": page in cached, **detection}
+
+
+def extract_text_from_pdf_images(pdf_path, lang, workers=None, window=None, preprocess=None, stats=None,
+                                 progress=None, line_filters=None, dpi=None, language_routing=False, page_count=None):
+    """
+    Extrai texto das imagens geradas a partir de um PDF.
+
+    :param stats: Dicionário opcional que recebe ocr_cache_hits, ocr_cache_misses,
+        page_counts ({"page", "words", "chars", "chars_cleaned"} por página) e
+        page_languages ({"page", "script", "languages"} por página).
+    :param progress: Callable opcional chamado a cada página com ({"page",
+        "word_count", "words", "chars", "chars_cleaned", "path", "text"},
+        total de páginas).
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param dpi: DPI de rasterização, como em iter_ocr_pages.
+    :param language_routing: Escolhe os idiomas por página, como em iter_ocr_pages.
+    :param page_count: Número de páginas, se já conhecido (ex.: len(pdf.pages));
+        sem ele, é lido com o `pdfinfo`.
+    :return: Tupla (TextAccumulator, páginas, imagens), como process_pdf.
+    """
+    total = get_pdf_page_count(pdf_path) if page_count is None else page_count
+    text = TextAccumulator()
+    qt_pages = hits = 0
+    page_counts, page_languages = [], []
+    for page in iter_ocr_pages(
+        pdf_path, lang, workers, window, preprocess, last_page=total, line_filters=line_filters, dpi=dpi,
+        language_routing=language_routing,
+    ):
+        # As páginas são separadas por uma quebra de linha
+        chars, chars_cleaned = text.qt_char_extracted, text.qt_char_cleaned
+        text.add("\n" + page["text"] if qt_pages else page["text"], page["word_count"])
+        qt_pages += 1
+        page_counts.append({
+            "page": page["page"],
+            "words": page["word_count"],
+            "chars": text.qt_char_extracted - chars,
+            "chars_cleaned": text.qt_char_cleaned - chars_cleaned,
+        })
+        hits += page["from_cache"]
+        page_languages.append({"page": page["page"], "script": page["script"], "languages": page["languages"]})
+        if progress is not None:
+            progress({**page_counts[-1], "word_count": page["word_count"], "path": "ocr", "text": page["text"]},
+                     total)
+
+    if stats is not None:
+        stats["ocr_cache_hits"] = stats.get("ocr_cache_hits", 0) + hits
+        stats["ocr_cache_misses"] = stats.get("ocr_cache_misses", 0) + qt_pages - hits
+        stats["page_counts"] = page_counts
+        stats["page_languages"] = page_languages
+    return text, qt_pages, qt_pages
+
+
+def check_pdf(pdf_path, pdf):
+    """
+    Decide se o PDF pode ter o texto extraído direto do pdfplumber.
+
+    Com settings.PDF_VALIDATION_BACKEND = "native" a validação usa o documento
+    já aberto; se ela falhar, recorre ao `pdffonts`/`exiftool` (validate_pdf).
+
+    :param pdf_path: Caminho do PDF (SharedUploadPath), lido só pelo `pdffonts`/`exiftool`.
+    :param pdf: O mesmo arquivo aberto com pdfplumber.open.
+    :return: True se o arquivo é válido, False caso contrário.
+    """
+    if settings.PDF_VALIDATION_BACKEND == "native":
+        try:
+            return validate_pdf_native(pdf)
+        except RuntimeError as e:
+            logger.warning("Erro na validação nativa do PDF, usando pdffonts/exiftool: %s", e)
+    return validate_pdf(pdf_path.path)
+
+
+def check_pdf_pages(pdf_path, pdf):
+    """
+    Decide, página a página, quais páginas podem ter o texto extraído direto
+    do pdfplumber e quais precisam de OCR.
+
+    Só a validação nativa distingue páginas; com o backend "subprocess", ou se
+    settings.PDF_PAGE_ROUTING estiver desligado, a decisão de check_pdf vale
+    para todas as páginas.
+
+    :return: Lista com um booleano por página; True usa a camada de texto.
+    """
+    if settings.PDF_VALIDATION_BACKEND == "native" and settings.PDF_PAGE_ROUTING:
+        try:
+            return validate_pdf_pages_native(pdf)
+        except RuntimeError as e:
+            logger.warning("Erro na validação nativa do PDF, usando pdffonts/exiftool: %s", e)
+        return [validate_pdf(pdf_path.path)] * len(pdf.pages)
+    return [check_pdf(pdf_path, pdf)] * len(pdf.pages)
+
+
+def extract_file(file, lang, preprocess=None, progress=None, line_filters=None, page_selection=None,
+                 language_routing=None):
+    """
+    Extrai o texto de um PDF ou imagem escolhendo o caminho de extração.
+
+    :param file: Arquivo enviado (UploadedFile).
+    :param lang: Idiomas do Tesseract.
+    :param preprocess: Modo de pré-processamento das imagens.
+    :param progress: Callable opcional de progresso por página.
+    :param line_filters: Opções dos filtros de linha do OCR.
+    :param page_selection: Seleção de páginas de get_request_page_selection.
+        Com "range" só as páginas do intervalo são processadas; com "sample",
+        só uma amostra de páginas igualmente espaçadas, e o resultado inclui
+        em estimate os totais do documento extrapolados da amostra. Ignorada
+        para imagens.
+    :param language_routing: Aplica o OCR de cada página ou imagem só com os
+        idiomas do script detectado; padrão settings.OCR_LANGUAGE_ROUTING["ENABLED"].
+    :return: Dicionário com text_extracted, qt_pages, qt_images, qt_words,
+        qt_char_extracted, qt_char_cleaned, as estatísticas do cache de OCR por
+        página, o caminho de cada página, os idiomas de cada página com OCR
+        (page_languages) e, para PDFs, as páginas processadas
+        (page_selection) e a estimativa (estimate, ou None).
+    """
+    if language_routing is None:
+        language_routing = settings.OCR_LANGUAGE_ROUTING["ENABLED"]
+    text = TextAccumulator()
+    qt_pages = qt_images = 0
+    stats = {
+        "ocr_cache_hits": 0,
+        "ocr_cache_misses": 0,
+        "page_routes": [],
+        "page_counts": [],
+        "page_languages": [],
+        "page_selection": None,
+        "disk_writes_avoided": 0,
+        "embedded_images_skipped": 0,
+        "embedded_images_deduped": 0,
+        "embedded_images_failed": 0,
+    }
+    estimate = None
+    if file.name.lower().endswith(".pdf"):
+        with SharedUploadPath(file) as pdf_path, pdfplumber.open(file) as pdf:
+            total_pages = len(pdf.pages)
+            check_page_limit(total_pages)
+            pages = select_pages(page_selection or {}, total_pages)
+            with metrics.stage("validate_pdf"):
+                routes = check_pdf_pages(pdf_path, pdf)
+            pdf_is_valid = all(routes)
+            # fonts_and_encodings = handle_uploaded_file(file, get_pdf_fonts_and_encodings_as_dict)
+            # creators_authors_info = handle_uploaded_file(file, get_file_metadata_as_dict)
+            # if validate_pdf_fonts_and_encodings(fonts_and_encodings) and validate_pdf_creator_author_creator_tool(creators_authors_info):
+            if pages is not None:
+                # Intervalo ou amostra: pdfplumber e rasterização só nas páginas escolhidas
+                text, qt_pages, qt_images = process_pdf_hybrid(
+                    pdf_path.path, pdf, routes, lang, preprocess, progress, stats, line_filters, pages,
+                    language_routing,
+                )
+                if page_selection["mode"] == "sample":
+                    estimate = {
+                        field: estimate_total([page[key] for page in stats["page_counts"]], total_pages)
+                        for field, key in (("qt_words", "words"), ("qt_char_extracted", "chars"),
+                                           ("qt_char_cleaned", "chars_cleaned"))
+                    }
+            elif pdf_is_valid:
+                text, qt_pages, qt_images = process_pdf(
+                    file, lang, preprocess, progress, pdf, stats, line_filters, pdf_path
+                )
+            elif any(routes):
+                text, qt_pages, qt_images = process_pdf_hybrid(
+                    pdf_path.path, pdf, routes, lang, preprocess, progress, stats, line_filters,
+                    language_routing=language_routing,
+                )
+            elif routes:
+                text, qt_pages, qt_images = extract_text_from_pdf_images(
+                    pdf_path.path, lang, preprocess=preprocess, stats=stats, progress=progress,
+                    line_filters=line_filters, dpi=get_page_dpis(pdf, lang), language_routing=language_routing,
+                    page_count=total_pages,
+                )
+
+            # Antes, a validação e o OCR gravavam cada um a sua cópia do upload
+            stats["disk_writes_avoided"] += (1 if pdf_is_valid else 2) - pdf_path.writes
+        if not stats["page_routes"]:
+            stats["page_routes"] = [
+                {"page": page, "path": "text" if valid else "ocr"} for page, valid in enumerate(routes, start=1)
+            ]
+        stats["page_selection"] = {
+            "mode": (page_selection or {}).get("mode", "all"),
+            "pages": pages if pages is not None else list(range(1, total_pages + 1)),
+            "total_pages": total_pages,
+        }
+    elif file.name.lower().endswith(("jpg", "jpeg", "png", "bmp", "gif", "tiff")):
+        if language_routing and "+" in lang:
+            text_extracted, qt_words, detection = process_image_routed(file, lang, preprocess, line_filters)
+            stats["page_languages"] = [{"page": 1, **detection}]
+        else:
+            text_extracted, qt_words = process_image(file, lang, preprocess, line_filters)
+        text.add(text_extracted, qt_words)
+        qt_images += 1
+        qt_pages += 1
+        stats["page_routes"] = [{"page": 1, "path": "ocr"}]
+        stats["page_counts"] = [{
+            "page": 1, "words": qt_words, "chars": text.qt_char_extracted, "chars_cleaned": text.qt_char_cleaned,
+        }]
+        if progress is not None:
+            progress({**stats["page_counts"][0], "word_count": qt_words, "path": "ocr", "text": text_extracted}, 1)
+    else:
+        raise ValueError("Tipo de arquivo não suportado.")
+
+    metrics.count("pages", qt_pages)
+    metrics.count("images", qt_images)
+    metrics.count("words", text.qt_words)
+    return {
+        "text_extracted": text.text,
+        "qt_pages": qt_pages,
+        "qt_images": qt_images,
+        "qt_words": text.qt_words,
+        "qt_char_extracted": text.qt_char_extracted,
+        "qt_char_cleaned": text.qt_char_cleaned,
+        "estimate": estimate,
+        **stats,
+    }
+
+
+RESULT_FIELDS = ("text_extracted", "qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned")
+
+# Campos guardados no cache de resultados: os totais e as contagens por página
+CACHED_FIELDS = RESULT_FIELDS + ("page_routes", "page_counts")
+
+
+def _stored_result(result):
+    """Completa um resultado do cache ou do histórico com os campos de extract_file que eles não guardam."""
+    if "qt_char_extracted" not in result:
+        # Entradas gravadas antes das contagens de caracteres irem para o cache
+        result["qt_char_extracted"], result["qt_char_cleaned"] = count_characters(result["text_extracted"])
+    return {
+        "estimate": None,
+        "ocr_cache_hits": 0,
+        "ocr_cache_misses": 0,
+        "page_routes": [],
+        "page_counts": [],
+        "page_languages": [],
+        "page_selection": None,
+        "disk_writes_avoided": 0,
+        "embedded_images_skipped": 0,
+        "embedded_images_deduped": 0,
+        "embedded_images_failed": 0,
+        "text_id": None,
+        **result,
+        "from_cache": True,
+    }
+
+
+def cached_extract_file(file, lang, preprocess=None, progress=None, line_filters=None, page_selection=None,
+                        language_routing=None):
+    """
+    Executa extract_file consultando antes o cache de resultados e o
+    histórico de extrações (store).
+
+    A chave combina o hash do conteúdo do arquivo, os idiomas, o modo de
+    pré-processamento, os filtros de linha e as configurações da extração
+    (extraction_settings_key), então o mesmo arquivo enviado com outros
+    idiomas, ou depois de mudar a engine da camada de texto ou o DPI, é
+    processado de novo. Intervalos e amostras de páginas não
+    passam pelo cache de resultados nem pelo histórico (só pelo cache de OCR
+    por página). Extrações completas são gravadas nos dois.
+
+    :return: Dicionário de extract_file acrescido de from_cache e text_id
+        (identificador do texto no histórico, para result_text, ou None).
+    """
+    preprocess = preprocess or settings.OCR_PREPROCESS_MODE
+    line_filters = line_filters or get_line_filter_options()
+    if language_routing is None:
+        language_routing = settings.OCR_LANGUAGE_ROUTING["ENABLED"]
+    cache = get_result_cache()
+    if (cache is None and not store.is_enabled()) or (page_selection or {}).get("mode", "all") != "all":
+        result = extract_file(file, lang, preprocess, progress, line_filters, page_selection, language_routing)
+        return {**result, "from_cache": False, "text_id": None}
+
+    with metrics.stage("result_cache"):
+        digest = file_hash(file)
+        kind = "file:routed" if language_routing and "+" in lang else "file"
+        key = make_cache_key(kind, digest, lang, preprocess, line_filters, extraction_settings_key())
+        result = cache.get(key) if cache is not None else None
+    if result is not None:
+        metrics.count("result_cache_hits")
+        if not store.is_enabled():
+            result = {**result, "text_id": None}
+        return _stored_result(result)
+
+    result = store.find_extraction(key)
+    if result is not None:
+        metrics.count("result_store_hits")
+        if cache is not None:
+            cache.set(key, {**{field: result[field] for field in CACHED_FIELDS}, "text_id": result["text_id"]})
+        return _stored_result(result)
+
+    result = extract_file(file, lang, preprocess, progress, line_filters, language_routing=language_routing)
+    text_id = None
+    if result["text_extracted"]:
+        timings = metrics.current()
+        if store.save_extraction(
+            key, digest, file, lang, preprocess, result, timings.as_dict() if timings is not None else None
+        ) is not None:
+            text_id = store.lookup_key(key)
+        # Com o text_id, os acertos do cache também carregam textos grandes por result_text
+        if cache is not None:
+            cache.set(key, {**{field: result[field] for field in CACHED_FIELDS}, "text_id": text_id})
+    return {**result, "from_cache": False, "text_id": text_id}
+
+
+LANGUAGES = [
+    {"id": "deu", "name": "Alemão"}, {"id": "kor", "name": "Coreano"},
+    {"id": "spa", "name": "Espanhol"}, {"id": "fra", "name": "Francês"},
+    {"id": "hin", "name": "Hindi"}, {"id": "eng", "name": "Inglês"},
+    {"id": "ita", "name": "Italiano"}, {"id": "jpn", "name": "Japonês"},
+    {"id": "por", "name": "Português"}
+]
+
+
+def _counter_context(request):
+    """Contexto inicial da página do contador, com os valores enviados no formulário."""
+    context = {
+        "languages_list": LANGUAGES,
+        "preprocess_modes": list(get_preprocess_pipelines()),
+        "preprocess": settings.OCR_PREPROCESS_MODE,
+        "line_filters": get_line_filter_options(),
+        "page_selection": {"mode": "all", "range": "", "size": settings.PAGE_SAMPLING["SIZE"]},
+        "language_routing": settings.OCR_LANGUAGE_ROUTING["ENABLED"],
+        "stream_url": reverse("counter_stream") if settings.STREAMING["ENABLED"] else "",
+    }
+    if request.method == "GET":
+        return context
+
+    file = request.FILES.get("uploaded_file")
+    lang = "+".join(request.POST.getlist("languages"))
+    context.update({
+        "file_name": "",
+        "preprocess": request.POST.get("preprocess") or settings.OCR_PREPROCESS_MODE,
+        "page_selection": {
+            "mode": request.POST.get("page_mode") or "all",
+            "range": request.POST.get("page_range", ""),
+            "size": request.POST.get("sample_size") or settings.PAGE_SAMPLING["SIZE"],
+        },
+        "selected_languages": [language["name"] for language in LANGUAGES if language["id"] in lang],
+        "selected_pages": None,
+        "total_pages": 0,
+        "estimate": None,
+        "job_id": None,
+        "error": False,
+        "message": "",
+        "qt_pages": 0,
+        "qt_images": 0,
+        "qt_words": 0,
+        "qt_char_extracted": 0,
+        "qt_char_cleaned": 0,
+        "from_cache": False,
+        "ocr_cache_hits": 0,
+        "ocr_cache_misses": 0,
+        "ocr_page_numbers": [],
+        "page_languages": [],
+        "disk_writes_avoided": 0,
+        "embedded_images_skipped": 0,
+        "embedded_images_deduped": 0,
+        "text_extracted": "",
+        "text_id": None,
+    })
+    if file is not None:
+        context["file_name"] = file.name[:40] + "..." if len(file.name) > 40 else file.name
+    return context
+
+
+def _counter_options(request, context):
+    """
+    Valida o formulário do contador e o arquivo enviado (preflight).
+
+    :return: Dicionário {"file", "lang", "preprocess", "line_filters",
+        "page_selection", "language_routing", "queue"}; queue indica que o arquivo vai para a fila
+        de jobs em vez de ser processado na requisição.
+    :raises ValueError: Se alguma opção ou o arquivo forem recusados.
+    """
+    lang = get_request_languages(request.POST)
+    preprocess = get_request_preprocess(request.POST)
+    context["line_filters"] = get_request_line_filters(request.POST)
+    context["page_selection"] = get_request_page_selection(request.POST)
+    context["language_routing"] = get_request_language_routing(request.POST)
+    file = request.FILES.get("uploaded_file")
+    if file is None:
+        raise upload_error(request, "uploaded_file") or ValueError("Arquivo não enviado.")
+
+    upload = preflight(file)
+    pages = None
+    if upload["kind"] == "pdf":
+        pages = select_pages(context["page_selection"], upload["pages"])
+    return {
+        "file": file,
+        "lang": lang,
+        "preprocess": preprocess,
+        "line_filters": context["line_filters"],
+        "page_selection": context["page_selection"],
+        "language_routing": context["language_routing"],
+        # Grande demais para a requisição: segue pela fila de jobs
+        "queue": needs_async(upload, None if pages is None else len(pages)),
+    }
+
+
+def _counter_result(context, file, result):
+    """Preenche o contexto da página com o resultado de cached_extract_file."""
+    context.update({field: result[field] for field in (
+        "qt_pages", "qt_images", "qt_words", "from_cache", "ocr_cache_hits", "ocr_cache_misses",
+        "disk_writes_avoided", "embedded_images_skipped", "embedded_images_deduped", "estimate",
+        "page_languages",
+    )})
+    if file.name.lower().endswith(".pdf"):
+        context["ocr_page_numbers"] = [route["page"] for route in result["page_routes"] if route["path"] == "ocr"]
+    if result["page_selection"] and result["page_selection"]["mode"] != "all":
+        context["selected_pages"] = result["page_selection"]["pages"]
+        context["total_pages"] = result["page_selection"]["total_pages"]
+
+    context["text_extracted"] = result["text_extracted"].strip()
+    if not result["text_extracted"]:
+        raise ValueError("Erro ao extrair texto.")
+    if result["text_id"] and len(result["text_extracted"]) > settings.STREAMING["INLINE_TEXT_MAX"]:
+        # Só a primeira página do texto vai no HTML; as demais são
+        # carregadas sob demanda por result_text
+        context["text_extracted"] = result["text_extracted"][:settings.STREAMING["TEXT_PAGE_SIZE"]].lstrip()
+        context["text_id"] = result["text_id"]
+
+    context["qt_char_extracted"] = result["qt_char_extracted"]
+    context["qt_char_cleaned"] = result["qt_char_cleaned"]
+
+
+def _render_counter(request, context, status=200):
+    """Renderiza a página do contador, com o painel de tempos se habilitado."""
+    timings = metrics.current()
+    context["debug_timings"] = None
+    if settings.METRICS["DEBUG_PANEL"] and timings is not None:
+        context["debug_timings"] = [
+            {"stage": stage, "ms": values["seconds"] * 1000, "calls": values["calls"]}
+            for stage, values in timings.as_dict()["stages"].items()
+        ]
+    return render(request, "index.html", context, status=status)
 
 
 def counter(request):
@@ -131,70 +982,346 @@ def counter(request):
     Recebe um arquivo e uma lista de idiomas e retorna texto extraído,
     número de páginas, imagens com texto, palavras e caracteres.
     """
-    languages_list = [
-        {"id": "deu", "name": "Alemão"}, {"id": "kor", "name": "Coreano"},
-        {"id": "spa", "name": "Espanhol"}, {"id": "fra", "name": "Francês"},
-        {"id": "hin", "name": "Hindi"}, {"id": "eng", "name": "Inglês"},
-        {"id": "ita", "name": "Italiano"}, {"id": "jpn", "name": "Japonês"},
-        {"id": "por", "name": "Português"}
-    ]
-
+    context = _counter_context(request)
     if request.method == "GET":
-        return render(request, "index.html", {"languages_list": languages_list})
+        return _render_counter(request, context)
 
-    file = request.FILES["uploaded_file"]
-    lang = "+".join(request.POST.getlist("languages"))
-    selected_languages = [
-        language["name"] for language in languages_list if language["id"] in lang
-    ]
-    file_name = file.name[:40] + "..." if len(file.name) > 40 else file.name
-    error, message = False, ""
-    text_extracted, text_cleaned = "", ""
-    qt_pages = qt_images = qt_words = qt_char_extracted = qt_char_cleaned = 0
+    try:
+        options = _counter_options(request, context)
+        if options["queue"]:
+            context["job_id"] = submit_job(
+                options["file"], options["lang"], options["preprocess"], options["line_filters"],
+                options["page_selection"], options["language_routing"],
+            )
+        else:
+            result = cached_extract_file(
+                options["file"], options["lang"], options["preprocess"],
+                line_filters=options["line_filters"], page_selection=options["page_selection"],
+                language_routing=options["language_routing"],
+            )
+            _counter_result(context, options["file"], result)
+    except Exception as e:
+        context.update({"error": True, "message": f"Erro: {e}"})
+
+    return _render_counter(request, context)
 
+
+async def counter_async(request):
+    """
+    Versão assíncrona de counter, para servidores ASGI.
+
+    A extração roda no executor de concurrency.run_extraction, limitada a
+    ASYNC_COUNTER["MAX_CONCURRENT"] por processo, então um worker atende
+    muitos uploads simultâneos enquanto espera o OCR e os subprocessos.
+    Acima da capacidade da fila responde 503.
+    """
+    if request.method == "GET":
+        return _render_counter(request, _counter_context(request))
+
+    # A leitura do formulário e o preflight abrem o arquivo enviado, então
+    # também saem do event loop
+    context = await sync_to_async(_counter_context)(request)
+    status = 200
     try:
-        if file.name.lower().endswith(".pdf"):
-            pdf_is_valid = handle_uploaded_file(file, validate_pdf)
-            # fonts_and_encodings = handle_uploaded_file(file, get_pdf_fonts_and_encodings_as_dict)
-            # creators_authors_info = handle_uploaded_file(file, get_file_metadata_as_dict)
-            # if validate_pdf_fonts_and_encodings(fonts_and_encodings) and validate_pdf_creator_author_creator_tool(creators_authors_info):
-            if pdf_is_valid:
-                text_extracted, qt_pages, qt_images, qt_words = process_pdf(file, lang)
-            else:
-                callback = partial(extract_text_from_pdf_images, lang=lang)
-                text_extracted, qt_pages, qt_images, qt_words = handle_uploaded_file(file, callback)
-        elif file.name.lower().endswith(("jpg", "jpeg", "png", "bmp", "gif", "tiff")):
-            text_extracted, qt_words = process_image(file, lang)
-            qt_images += 1
-            qt_pages += 1
+        options = await sync_to_async(_counter_options)(request, context)
+        if options["queue"]:
+            context["job_id"] = await sync_to_async(submit_job)(
+                options["file"], options["lang"], options["preprocess"], options["line_filters"],
+                options["page_selection"], options["language_routing"],
+            )
         else:
-            raise ValueError("Tipo de arquivo não suportado.")
+            result = await run_extraction(
+                cached_extract_file, options["file"], options["lang"], options["preprocess"],
+                line_filters=options["line_filters"], page_selection=options["page_selection"],
+                language_routing=options["language_routing"],
+            )
+            _counter_result(context, options["file"], result)
+    except Overloaded as e:
+        status = 503
+        context.update({"error": True, "message": f"Erro: {e}"})
+    except Exception as e:
+        context.update({"error": True, "message": f"Erro: {e}"})
+
+    response = _render_counter(request, context, status)
+    if status == 503:
+        response["Retry-After"] = "30"
+    return response
 
-        if not text_extracted:
-            raise ValueError("Erro ao extrair texto.")
 
-        text_cleaned = text_extracted.replace("\n", "").replace("\r", "").replace("\t", "").replace(" ", "")
-        qt_char_extracted = len(text_extracted)
-        qt_char_cleaned = len(text_cleaned)
+def _event_response(content):
+    """Resposta text/event-stream, sem cache nem buffer em proxies (nginx)."""
+    response_class = HttpResponse if isinstance(content, str) else StreamingHttpResponse
+    response = response_class(content, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
+
+def _stream_options(request):
+    """
+    Lê o formulário de counter_stream.
+
+    :return: (options, None) para extrair, ou (None, resposta) com o evento
+             "queued" (arquivo enviado para a fila de jobs) ou "error".
+    """
+    context = _counter_context(request)
+    try:
+        options = _counter_options(request, context)
+        if options["queue"]:
+            job_id = submit_job(
+                options["file"], options["lang"], options["preprocess"], options["line_filters"],
+                options["page_selection"], options["language_routing"],
+            )
+            return None, _event_response(sse_event("queued", {
+                "job_id": job_id, "status_url": reverse("job_status", args=[job_id]),
+            }))
     except Exception as e:
-        error = True
-        message = f"Erro: {e}"
+        return None, _event_response(sse_event("error", {"message": f"Erro: {e}"}))
+    return options, None
 
-    return render(
-        request,
-        "index.html",
-        {
-            "file_name": file_name,
-            "languages_list": languages_list,
-            "selected_languages": selected_languages,
-            "error": error,
-            "message": message,
-            "qt_pages": qt_pages,
-            "qt_images": qt_images,
-            "qt_words": qt_words,
-            "qt_char_extracted": qt_char_extracted,
-            "qt_char_cleaned": qt_char_cleaned,
-            "text_extracted": text_extracted.strip(),
-        },
+
+def _extraction_stream(options):
+    return ExtractionStream(
+        cached_extract_file, options["file"], options["lang"], options["preprocess"],
+        line_filters=options["line_filters"], page_selection=options["page_selection"],
+        language_routing=options["language_routing"],
     )
+
+
+@require_POST
+def counter_stream(request):
+    """
+    Recebe o mesmo formulário de counter e responde com server-sent events
+    (ExtractionStream): as contagens e o texto de cada página são enviados
+    assim que ela termina, com os totais acumulados, e o resultado final
+    em um evento "done".
+
+    Arquivos grandes demais para a requisição vão para a fila de jobs e
+    recebem um único evento "queued" com o endereço do status.
+    """
+    options, response = _stream_options(request)
+    if response is not None:
+        return response
+    return _event_response(iter(_extraction_stream(options).start()))
+
+
+@require_POST
+async def counter_stream_async(request):
+    """
+    Versão assíncrona de counter_stream, para servidores ASGI.
+
+    A extração ocupa uma das vagas de concurrency.run_extraction, como em
+    counter_async; acima da capacidade da fila responde 503 antes de abrir
+    o stream.
+    """
+    options, response = await sync_to_async(_stream_options)(request)
+    if response is not None:
+        return response
+    try:
+        check_capacity()
+    except Overloaded as e:
+        response = _event_response(sse_event("error", {"message": f"Erro: {e}"}))
+        response.status_code = 503
+        response["Retry-After"] = "30"
+        return response
+    # Um iterador síncrono seria consumido inteiro antes do envio
+    return _event_response(aiter(_extraction_stream(options).start_limited()))
+
+
+@require_GET
+def result_text(request, text_id):
+    """
+    Retorna, em JSON, uma página de STREAMING["TEXT_PAGE_SIZE"] caracteres do
+    texto de uma extração do histórico, para carregar textos grandes aos poucos.
+
+    :param text_id: text_id do resultado de cached_extract_file.
+    """
+    text = store.find_text(text_id)
+    if text is None:
+        return JsonResponse({"error": "Texto não encontrado."}, status=404)
+    size = settings.STREAMING["TEXT_PAGE_SIZE"]
+    pages = max(1, -(-len(text) // size))
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        return JsonResponse({"error": "Página inválida."}, status=400)
+    if not 1 <= page <= pages:
+        return JsonResponse({"error": "Página inválida."}, status=400)
+    return JsonResponse({"text": text[(page - 1) * size:page * size], "page": page, "pages": pages})
+
+
+@csrf_exempt
+@require_POST
+def job_submit(request):
+    """
+    Recebe um arquivo e uma lista de idiomas e enfileira a extração,
+    retornando imediatamente o identificador do job.
+    """
+    file = request.FILES.get("uploaded_file")
+    if file is None:
+        error = upload_error(request, "uploaded_file")
+        if error is not None:
+            return JsonResponse({"error": f"Erro: {error}"}, status=error.status)
+        return JsonResponse({"error": "Arquivo não enviado."}, status=400)
+
+    try:
+        lang = get_request_languages(request.POST, default="por")
+        preprocess = get_request_preprocess(request.POST)
+        line_filters = get_request_line_filters(request.POST)
+        page_selection = get_request_page_selection(request.POST)
+        language_routing = get_request_language_routing(request.POST)
+        upload = preflight(file)
+    except PreflightError as e:
+        return JsonResponse({"error": f"Erro: {e}"}, status=e.status)
+    except ValueError as e:
+        return JsonResponse({"error": f"Erro: {e}"}, status=400)
+
+    try:
+        job_id = submit_job(file, lang, preprocess, line_filters, page_selection, language_routing)
+    except (QueueFull, JobsUnavailable) as e:
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = "30"
+        return response
+
+    return JsonResponse({"job_id": job_id, "status": "queued", "pages": upload["pages"]}, status=202)
+
+
+@require_GET
+def job_status(request, job_id):
+    """Retorna o progresso por página de um job e, ao final, as contagens."""
+    status = get_job_status(str(job_id))
+    if status is None:
+        return JsonResponse({"error": "Job não encontrado."}, status=404)
+    return JsonResponse(status)
+
+
+@csrf_exempt
+@require_POST
+def job_cancel(request, job_id):
+    """Solicita o cancelamento de um job."""
+    if not cancel_job(str(job_id)):
+        return JsonResponse({"error": "Job não encontrado ou já finalizado."}, status=404)
+    return JsonResponse(get_job_status(str(job_id)))
+
+
+COUNT_FIELDS = ("qt_pages", "qt_images", "qt_words", "qt_char_extracted", "qt_char_cleaned")
+
+
+def count_path(path, file_name, lang, preprocess=None, line_filters=None, language_routing=None):
+    """
+    Extrai e conta um arquivo gravado em disco, sem propagar erros.
+
+    :param path: Caminho do arquivo.
+    :param file_name: Nome original, usado para escolher o caminho de extração.
+    :return: Dicionário com as contagens, ou com a chave error em caso de falha.
+    """
+    try:
+        with metrics.collect() as timings, open(path, "rb") as f:
+            file = File(f, name=file_name)
+            preflight(file)
+            result = cached_extract_file(
+                file, lang, preprocess, line_filters=line_filters, language_routing=language_routing
+            )
+        if not result["text_extracted"]:
+            raise ValueError("Erro ao extrair texto.")
+        return {
+            "file_name": file_name,
+            "qt_pages": result["qt_pages"],
+            "qt_images": result["qt_images"],
+            "qt_words": result["qt_words"],
+            "qt_char_extracted": result["qt_char_extracted"],
+            "qt_char_cleaned": result["qt_char_cleaned"],
+            "from_cache": result["from_cache"],
+            "timings": timings.as_dict(),
+        }
+    except Exception as e:
+        return {"file_name": file_name, "error": f"Erro: {e}"}
+
+
+def _save_batch_files(files, temp_dir):
+    """
+    Grava os arquivos do lote em temp_dir, expandindo arquivos .zip.
+
+    Os membros do zip são gravados com nomes sequenciais, preservando apenas a
+    extensão, para que caminhos dentro do zip não escapem de temp_dir.
+
+    :return: Lista de tuplas (caminho gravado, nome original).
+    """
+    saved = []
+
+    def save(name, chunks):
+        path = os.path.join(temp_dir, f"{len(saved)}{os.path.splitext(name)[1].lower()}")
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        saved.append((path, name))
+
+    for file in files:
+        if file.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(file) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    if member.file_size > settings.UPLOAD_LIMITS["MAX_BYTES"]:
+                        raise ValueError(f"{member.filename}: arquivo maior que o limite permitido.")
+                    with archive.open(member) as f:
+                        save(member.filename, iter(lambda: f.read(1024 * 1024), b""))
+        else:
+            save(file.name, file.chunks())
+
+        if len(saved) > settings.BATCH["MAX_FILES"]:
+            raise ValueError(f"O lote excede o limite de {settings.BATCH['MAX_FILES']} arquivos.")
+    return saved
+
+
+@csrf_exempt
+@require_POST
+def batch_counter(request):
+    """
+    Recebe vários arquivos (ou arquivos .zip) e uma lista de idiomas e retorna,
+    em JSON, as contagens de cada arquivo e o total do lote.
+
+    Os arquivos são processados em paralelo; a falha de um arquivo, inclusive
+    a recusa pelo tipo durante o upload, é informada no próprio item e não
+    interrompe os demais.
+    """
+    files = request.FILES.getlist("files")
+    error = getattr(request, "upload_error", None)
+    if error is not None:
+        return JsonResponse({"error": f"Erro: {error}"}, status=error.status)
+    rejected = [
+        {"file_name": name, "error": f"Erro: {error}"}
+        for field, name, error in getattr(request, "rejected_files", ()) if field == "files"
+    ]
+    if not files and not rejected:
+        return JsonResponse({"error": "Nenhum arquivo enviado."}, status=400)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            lang = get_request_languages(request.POST, default="por")
+            preprocess = get_request_preprocess(request.POST)
+            line_filters = get_request_line_filters(request.POST)
+            language_routing = get_request_language_routing(request.POST)
+            saved = _save_batch_files(files, temp_dir)
+        except (ValueError, zipfile.BadZipFile) as e:
+            return JsonResponse({"error": f"Erro: {e}"}, status=400)
+
+        workers = max(1, min(settings.BATCH["WORKERS"], len(saved)))
+        with ProcessPoolExecutor(**file_pool_options(workers)) as executor:
+            results = list(executor.map(
+                count_path,
+                [path for path, _ in saved],
+                [name for _, name in saved],
+                repeat(lang),
+                repeat(preprocess),
+                repeat(line_filters),
+                repeat(language_routing),
+            ))
+
+    results += rejected
+    for result in results:
+        metrics.merge(result.get("timings"))
+    succeeded = [result for result in results if "error" not in result]
+    total = {field: sum(result[field] for result in succeeded) for field in COUNT_FIELDS}
+    total.update({"files": len(results), "failed": len(results) - len(succeeded)})
+    return JsonResponse({"languages": lang, "files": results, "total": total})